@@ -1,14 +1,27 @@
 from flask import Flask, request, jsonify
-from cv_module import classify_image, calculate_severity, scale_confidence
-from nlp_module import generate_description, analyze_text_comprehensive, classify_text, summarize_text, detect_urgency
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from cv_module import (classify_image, classify_images, cascade_stats, score_severity, scale_confidence,
+                       calculate_severity, compute_severity_features, DecodedImage, assess_quality,
+                       ImageResultCache, model_registry, serving_version)
+from cv_module.severity import SEVERITY_MAX_SIDE, SEVERITY_MODE
+from cv_module.severity_pool import SEVERITY_POOL_WORKERS
+from nlp_module import (pick_description, description_pool, analyze_text_comprehensive, analyze_texts_comprehensive,
+                        text_batcher, classify_text, summarize_text, detect_urgency)
 import base64
 import os
 import json
 import uuid
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import cloudinary
 import cloudinary.uploader
 from dotenv import load_dotenv
+from gemini_client import generate_content, single_flight_stats
+from structured_output import generate_json
+from llm_cache import llm_cache
+import resources
 
 load_dotenv()
 
@@ -22,8 +35,232 @@ cloudinary.config(
 TRAINING_DATA_DIR = os.path.join(os.path.dirname(__file__), "training_data")
 os.makedirs(TRAINING_DATA_DIR, exist_ok=True)
 
+# Binary uploads: bodies larger than this spill from memory to a temp file
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_BYTES", str(4 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES     = 64 * 1024
+MAX_UPLOAD_BYTES       = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))     # per image
+# Whole body of the multi-image routes: three phone photos plus multipart / base64 overhead
+MAX_MULTI_UPLOAD_BYTES = int(os.getenv("MAX_MULTI_UPLOAD_BYTES", str(4 * MAX_UPLOAD_BYTES)))
+MAX_BATCH_IMAGES       = int(os.getenv("MAX_BATCH_IMAGES", "16"))
+MAX_BATCH_TEXTS        = int(os.getenv("MAX_BATCH_TEXTS", "50"))
+
+# Reject dark / blank / blurry / tiny uploads before YOLO, Gemini and severity run
+QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "true").lower() == "true"
+
+# Classification + severity results for exact and near-duplicate uploads
+image_cache = ImageResultCache()
+
+# Shared pool for per-image work inside one request (severity, Gemini fallbacks).
+# OpenCV releases the GIL, so threads give real parallelism here.
+analysis_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ANALYSIS_WORKERS", str(min(8, os.cpu_count() or 1)))),
+    thread_name_prefix="analysis"
+)
+
+# Request branches that mostly wait on Gemini (text analysis) run here, so they
+# never hold an analysis worker the CV branches need
+io_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("IO_WORKERS", "32")),
+    thread_name_prefix="io"
+)
+
+# No global MAX_CONTENT_LENGTH: the image readers below cap their own request
+# bodies, so the JSON / text routes are not limited by the image budget
 app = Flask(__name__)
 
+# Load models and clients in the background so the server binds immediately;
+# /ready turns 200 once they are warm. WARMUP_ON_START=false defers to first use.
+if os.getenv("WARMUP_ON_START", "true").lower() == "true":
+    resources.warm_up(background=True)
+
+
+@app.errorhandler(BadRequest)
+@app.errorhandler(RequestEntityTooLarge)
+def _upload_error(e):
+    """Malformed / truncated / oversized uploads get the usual JSON error body."""
+    return jsonify({"error": e.description}), e.code
+
+
+def _limit_request_body(max_bytes=MAX_UPLOAD_BYTES):
+    """Caps this request's body (413 above it); call before the body is read."""
+    request.max_content_length = max_bytes
+
+
+def _read_stream(stream, length=None):
+    """
+    Streams an upload body into a single buffer without base64 round-trips.
+    Known length → filled in place; unknown length → spooled buffer first.
+    A body that ends before its declared length is rejected (400), not analyzed.
+    Returns: memoryview over the raw image bytes
+    """
+    if length:
+        if length > MAX_UPLOAD_BYTES:
+            raise RequestEntityTooLarge("Image exceeds upload size limit")
+        buffer = bytearray(length)
+        view = memoryview(buffer)
+        filled = 0
+        while filled < length:
+            n = stream.readinto(view[filled:filled + UPLOAD_CHUNK_BYTES])
+            if not n:
+                break
+            filled += n
+        if filled < length:
+            raise BadRequest(f"Upload ended after {filled} of {length} bytes")
+        return view
+
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES) as spool:
+        total = 0
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > MAX_UPLOAD_BYTES:
+                raise RequestEntityTooLarge("Image exceeds upload size limit")
+            spool.write(chunk)
+        spool.seek(0)
+        buffer = bytearray(total)
+        spool.readinto(buffer)
+        return memoryview(buffer)
+
+
+def _read_image_upload():
+    """
+    Reads the image and accompanying fields from any supported request format:
+    - multipart/form-data: "image" file part, other fields as form fields
+    - application/octet-stream: raw image body, other fields as query params
+    - application/json: legacy base64 "image" field
+    Returns: (image buffer or None, fields dict)
+    """
+    _limit_request_body()
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("image")
+        if upload is None:
+            return None, request.form.to_dict()
+        # werkzeug has already spooled the part; size it and read it in place
+        upload.stream.seek(0, os.SEEK_END)
+        length = upload.stream.tell()
+        upload.stream.seek(0)
+        return _read_stream(upload.stream, length), request.form.to_dict()
+
+    if request.mimetype == "application/octet-stream" or request.mimetype.startswith("image/"):
+        return _read_stream(request.stream, request.content_length), request.args.to_dict()
+
+    data = request.get_json(silent=True) or {}
+    image_base64 = data.get("image")
+    return (base64.b64decode(image_base64) if image_base64 else None), data
+
+
+def _read_image_uploads():
+    """
+    Multi-image variant of _read_image_upload:
+    - multipart/form-data: one or more "images" file parts
+    - application/json: "images" list of base64 strings
+    Returns: (list of image buffers, fields dict)
+    """
+    _limit_request_body(MAX_MULTI_UPLOAD_BYTES)
+    if request.mimetype == "multipart/form-data":
+        buffers = []
+        for upload in request.files.getlist("images"):
+            upload.stream.seek(0, os.SEEK_END)
+            length = upload.stream.tell()
+            upload.stream.seek(0)
+            buffers.append(_read_stream(upload.stream, length))
+        return buffers, request.form.to_dict()
+
+    data = request.get_json(silent=True) or {}
+    return [base64.b64decode(image) for image in data.get("images") or [] if image], data
+
+
+def _check_image_quality(image):
+    """Returns: the quality result when the image should be rejected, else None."""
+    if not QUALITY_GATE_ENABLED:
+        return None
+    quality = assess_quality(image)
+    if quality["usable"]:
+        return None
+    print(f"Image rejected by quality gate: {quality['reason']} {quality['metrics']}")
+    return quality
+
+
+def _unusable_image_result(quality):
+    """Structured "unusable image" result; keeps the usual fields so clients need no special case."""
+    return {
+        "usable": False,
+        "reason": quality["reason"],
+        "message": quality["message"],
+        "quality": quality["metrics"],
+        "predicted_category": "Uncategorized",
+        "confidence_percent": 0.0,
+        "severity_score": 1,
+        "is_miscategorized": True
+    }
+
+
+def _analyze_image(image, executor=None):
+    """
+    Classification + severity for one upload, served from image_cache for exact
+    and near-duplicate repeats under the serving model version. An exact hit
+    skips YOLO, Gemini and severity; a near-duplicate (perceptual) hit reuses
+    the category but scores severity on this image, and its detections belong
+    to the other image ("detections_borrowed": true).
+    With an executor and the severity process pool disabled, the severity
+    features (which do not depend on the category) are computed there while
+    classification runs; only the cheap category lookup waits for the category.
+    With the pool enabled, severity goes through score_severity (pool + timeout
+    fallback) after classification. Do not pass the executor this call is running on.
+    Returns: (result dict, cache match "exact" | "perceptual" | None)
+    """
+    cached, match, key = _lookup_image_result(image)
+    if cached is not None:
+        return cached, match
+
+    # Region mode needs the boxes first, so it keeps the sequential path
+    features_future = None
+    if executor is not None and SEVERITY_MODE != "region" and SEVERITY_POOL_WORKERS <= 0:
+        features_future = executor.submit(compute_severity_features, image.at(SEVERITY_MAX_SIDE))
+
+    category, raw_confidence, detections = classify_image(image, return_detections=True)
+    confidence_percent = scale_confidence(raw_confidence)
+    if features_future is not None:
+        severity = calculate_severity(category, confidence_percent, image, features=features_future.result(),
+                                      detections=detections)
+    else:
+        severity = score_severity(category, confidence_percent, image, detections)
+    return _store_image_result(key, category, raw_confidence, severity, detections), None
+
+
+def _lookup_image_result(image):
+    """
+    image_cache lookup under the serving model version; a perceptual hit gets
+    severity rescored on this image and its detections flagged as borrowed.
+    Returns: (result or None, cache match, key for _store_image_result)
+    """
+    cached, match, key = image_cache.lookup(image, serving_version())
+    if cached is not None:
+        print(f"✓ Image result cache hit ({match}): {cached['predicted_category']}")
+        if match == "perceptual":
+            # Frame-mode severity: the cached boxes are in the other image's coordinates
+            severity = score_severity(cached["predicted_category"], cached["confidence_percent"], image)
+            cached = {**cached, "severity_score": severity, "detections_borrowed": True}
+    return cached, match, key
+
+
+def _store_image_result(key, category, raw_confidence, severity, detections):
+    """Returns: the _analyze_image result dict, stored in image_cache when it may be reused."""
+    result = {
+        "predicted_category": category,
+        "confidence_percent": scale_confidence(raw_confidence),
+        "severity_score": severity,
+        "detections": detections
+    }
+    # A zero-confidence Uncategorized is the Gemini error path — do not pin it;
+    # nor a result from models that were swapped (or first loaded) mid-request
+    if not (category == "Uncategorized" and raw_confidence == 0.0) and serving_version() == key[0]:
+        image_cache.store(key, result)
+    return result
+
+
 # ──────────────────────────────────────────────
 # EXISTING ENDPOINTS (unchanged)
 # ──────────────────────────────────────────────
@@ -31,25 +268,31 @@ app = Flask(__name__)
 @app.route("/analyze", methods=["POST"])
 def analyze():
     """Complete image analysis: classification, severity, description, and AI insights."""
-    data = request.json
-    image_base64 = data.get("image")
+    image_buffer, _ = _read_image_upload()
 
-    if not image_base64:
+    if not image_buffer:
         return jsonify({"error": "Image required"}), 400
 
-    image_bytes = base64.b64decode(image_base64)
-    category, raw_confidence = classify_image(image_bytes)
-    description = generate_description(category)
-    confidence_percent = scale_confidence(raw_confidence)
-    severity = calculate_severity(category, confidence_percent, image_bytes)
-    is_miscategorized = confidence_percent < 50
+    image = DecodedImage(image_buffer)
+    quality = _check_image_quality(image)
+    if quality:
+        result = _unusable_image_result(quality)
+        result["generated_description"] = quality["message"]
+        return jsonify(result)
+
+    result, cache_match = _analyze_image(image)
+    description = pick_description(result["predicted_category"])
+    is_miscategorized = result["confidence_percent"] < 50
 
     return jsonify({
-        "predicted_category": category,
-        "confidence_percent": confidence_percent,
+        "predicted_category": result["predicted_category"],
+        "confidence_percent": result["confidence_percent"],
         "generated_description": description,
-        "severity_score": severity,
-        "is_miscategorized": is_miscategorized
+        "severity_score": result["severity_score"],
+        "is_miscategorized": is_miscategorized,
+        "detections": result["detections"],
+        "detections_borrowed": result.get("detections_borrowed", False),
+        "cache": cache_match
     })
 
 
@@ -69,6 +312,31 @@ def analyze_text():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/analyze-text-batch", methods=["POST"])
+def analyze_text_batch():
+    """
+    /analyze-text for several complaints at once. Body: {"texts": [...]}
+    Texts share batched Gemini calls; each result has the /analyze-text shape.
+    """
+    data = request.json or {}
+    texts = data.get("texts")
+
+    if not isinstance(texts, list) or not texts:
+        return jsonify({"error": "texts (non-empty list) required"}), 400
+    if len(texts) > MAX_BATCH_TEXTS:
+        return jsonify({"error": f"At most {MAX_BATCH_TEXTS} texts per batch"}), 400
+
+    try:
+        texts = [str(text or "").strip() for text in texts]
+        results = analyze_texts_comprehensive(texts)
+        return jsonify({
+            "results": [{"index": index, **result} for index, result in enumerate(results)],
+            "count": len(results)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/classify-text", methods=["POST"])
 def classify_text_endpoint():
     """Text classification only."""
@@ -135,64 +403,100 @@ def detect_urgency_endpoint():
 @app.route("/analyze-and-enhance", methods=["POST"])
 def analyze_and_enhance():
     """
-    Combined endpoint:
-    1. Runs CV on the uploaded image → detects category
-    2. Runs NLP to generate a rich enhanced description for that category
+    Combined endpoint, run as concurrent stages:
+    0. Quality gate: an unusable upload is rejected before any Gemini call
+    1. Starts the independent branches together: NLP analysis of the user's text
+       (io_executor), image classification (this thread) and the image's severity
+       features (analysis_executor)
+    2. Joins them once the category is known → severity level, enhanced description
     3. Returns category, confidence, enhanced_description, severity, urgency hint
+
+    Latency is the slowest branch rather than the sum of all of them.
     
     Frontend uses this to auto-fill the form fields after image upload.
     """
-    data = request.json
-    image_base64 = data.get("image")
-    user_description = data.get("description", "").strip()  # optional existing text
+    image_buffer, data = _read_image_upload()
+    user_description = (data.get("description") or "").strip()  # optional existing text
 
-    if not image_base64:
+    if not image_buffer:
         return jsonify({"error": "Image required"}), 400
 
     try:
-        image_bytes = base64.b64decode(image_base64)
-
-        # Step 1: CV - detect category from image
-        category, raw_confidence = classify_image(image_bytes)
-        confidence_percent = scale_confidence(raw_confidence)
-        severity = calculate_severity(category, confidence_percent, image_bytes)
-        is_miscategorized = confidence_percent < 50
-
-        # Step 2: NLP - build enhanced description
-        # If user already typed something, enhance that; otherwise generate from category
+        # Decoded once, shared by the quality gate, classification, Gemini fallback and severity
+        image = DecodedImage(image_buffer)
+        quality = _check_image_quality(image)
+        if quality:
+            return jsonify(_unusable_enhance_response(quality, user_description))
+
+        # Stage 1a: the text branch needs nothing from the image, so it starts first
+        text_future = None
         if user_description and len(user_description) >= 10:
-            # Enhance the user's own description
-            text_analysis = analyze_text_comprehensive(user_description)
-            enhanced_description = _build_enhanced_description(
-                category, confidence_percent, user_description, text_analysis
-            )
-            urgency = text_analysis.get("urgency", {})
-        else:
-            # Generate from scratch based on detected category
-            base_description = generate_description(category)
-            enhanced_description = base_description
-            urgency_level, urgency_label, keywords = detect_urgency(base_description)
-            urgency = {
-                "level": urgency_level,
-                "label": urgency_label,
-                "keywords": keywords
-            }
+            text_future = io_executor.submit(analyze_text_comprehensive, user_description)
 
-        return jsonify({
-            "predicted_category": category,
-            "confidence_percent": confidence_percent,
-            "enhanced_description": enhanced_description,
-            "severity_score": severity,
-            "is_miscategorized": is_miscategorized,
-            "urgency": urgency,
-            "ai_suggested": True   # flag so frontend can show "AI Suggested" badge
-        })
+        # Stage 1b: CV - classification ‖ severity features (cached for repeat uploads)
+        result, cache_match = _analyze_image(image, executor=analysis_executor)
+
+        # Stage 2: join - build enhanced description now that the category is known
+        text_analysis = text_future.result() if text_future is not None else None
+        return jsonify(_enhance_response(result, cache_match, user_description, text_analysis))
 
     except Exception as e:
         print(f"analyze-and-enhance error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def _unusable_enhance_response(quality, user_description):
+    """/analyze-and-enhance response for an upload rejected by the quality gate."""
+    urgency_level, urgency_label, keywords = detect_urgency(user_description)
+    result = _unusable_image_result(quality)
+    result.update({
+        "enhanced_description": user_description,
+        "urgency": {"level": urgency_level, "label": urgency_label, "keywords": keywords},
+        "ai_suggested": False
+    })
+    return result
+
+
+def _enhance_response(result, cache_match, user_description, text_analysis):
+    """
+    /analyze-and-enhance response from the CV result and, when the user typed a
+    description, its text analysis (None otherwise).
+    """
+    category = result["predicted_category"]
+    confidence_percent = result["confidence_percent"]
+
+    # If user already typed something, enhance that; otherwise generate from category
+    if text_analysis is not None:
+        # Enhance the user's own description
+        enhanced_description = _build_enhanced_description(
+            category, confidence_percent, user_description, text_analysis
+        )
+        urgency = text_analysis.get("urgency", {})
+    else:
+        # Generate from scratch based on detected category
+        base_description = pick_description(category)
+        enhanced_description = base_description
+        urgency_level, urgency_label, keywords = detect_urgency(base_description)
+        urgency = {
+            "level": urgency_level,
+            "label": urgency_label,
+            "keywords": keywords
+        }
+
+    return {
+        "predicted_category": category,
+        "confidence_percent": confidence_percent,
+        "enhanced_description": enhanced_description,
+        "severity_score": result["severity_score"],
+        "is_miscategorized": confidence_percent < 50,
+        "urgency": urgency,
+        "detections": result["detections"],
+        "detections_borrowed": result.get("detections_borrowed", False),
+        "cache": cache_match,
+        "ai_suggested": True   # flag so frontend can show "AI Suggested" badge
+    }
+
+
 def _build_enhanced_description(category, confidence, user_text, text_analysis):
     """
     Merges AI insights with user text to produce a richer description.
@@ -221,6 +525,270 @@ def _build_enhanced_description(category, confidence, user_text, text_analysis):
     return enhanced.strip()
 
 
+# ──────────────────────────────────────────────
+# BATCH ENDPOINT: Analyze all images of one issue in a single call
+# Replaces N round-trips to /analyze with one batched YOLO pass
+# ──────────────────────────────────────────────
+
+@app.route("/analyze-batch", methods=["POST"])
+def analyze_batch():
+    """
+    Analyzes several images of one issue together:
+    0. Each image is decoded and quality-gated on its own; a corrupt or
+       unusable one becomes an unusable entry instead of failing the batch
+    1. YOLO runs over the usable images in shared batched forward passes
+    2. Severity is computed for every usable image in parallel
+    3. Returns per-image results plus an issue-level aggregate
+       (majority category, max severity) over the usable images
+    """
+    image_buffers, _ = _read_image_uploads()
+
+    if not image_buffers:
+        return jsonify({"error": "At least one image required"}), 400
+    if len(image_buffers) > MAX_BATCH_IMAGES:
+        return jsonify({"error": f"At most {MAX_BATCH_IMAGES} images per batch"}), 400
+
+    try:
+        images = [DecodedImage(buffer) for buffer in image_buffers]
+        gated = list(analysis_executor.map(_gate_image, images))
+        images = [image for image, unusable in zip(images, gated) if unusable is None]
+
+        classifications = classify_images(images, executor=analysis_executor, return_detections=True) if images else []
+        confidences = [scale_confidence(raw_confidence) for _, raw_confidence, _ in classifications]
+
+        severities = list(analysis_executor.map(
+            score_severity,
+            [category for category, _, _ in classifications],
+            confidences,
+            images,
+            [detections for _, _, detections in classifications]
+        ))
+
+        return jsonify(_batch_response(gated, classifications, confidences, severities))
+
+    except Exception as e:
+        print(f"analyze-batch error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+def _gate_image(image):
+    """
+    Decode + quality gate for one image of a batch, so a bad upload fails alone.
+    Returns: the unusable result for a rejected or unreadable image, else None
+    """
+    try:
+        quality = _check_image_quality(image)
+        if quality:
+            return _unusable_image_result(quality)
+        image.size  # decodes now, also with the quality gate off
+        return None
+    except Exception as e:
+        return _failed_image_result(e)
+
+
+def _batch_response(gated, classifications, confidences, severities):
+    """
+    Per-image results plus the issue-level aggregate for /analyze-batch.
+    gated has each image's unusable result or None; the classification lists
+    cover the None entries in order. The aggregate counts usable images only.
+    """
+    analyzed = iter(zip(classifications, confidences, severities))
+    results = []
+    for i, unusable in enumerate(gated):
+        if unusable is not None:
+            results.append({"index": i, **unusable, "detections": []})
+            continue
+        (category, _, detections), confidence_percent, severity = next(analyzed)
+        results.append({
+            "index": i,
+            "usable": True,
+            "predicted_category": category,
+            "confidence_percent": confidence_percent,
+            "severity_score": severity,
+            "is_miscategorized": confidence_percent < 50,
+            "detections": detections
+        })
+
+    usable = [r for r in results if r["usable"]]
+    aggregate = _aggregate_results(usable or results)
+    aggregate["usable"] = bool(usable)
+    aggregate["generated_description"] = pick_description(aggregate["predicted_category"])
+    return {"results": results, "aggregate": aggregate}
+
+
+def _aggregate_results(results):
+    """
+    Issue-level view of per-image results.
+    Category is the majority vote (Uncategorized only wins if nothing else was found);
+    ties go to the category with the higher summed confidence.
+    """
+    votes = Counter(r["predicted_category"] for r in results if r["predicted_category"] != "Uncategorized")
+    if votes:
+        confidence_sums = Counter()
+        for r in results:
+            confidence_sums[r["predicted_category"]] += r["confidence_percent"]
+        category = max(votes, key=lambda c: (votes[c], confidence_sums[c]))
+    else:
+        category = "Uncategorized"
+
+    matching = [r["confidence_percent"] for r in results if r["predicted_category"] == category]
+    confidence_percent = round(sum(matching) / len(matching), 1) if matching else 0.0
+
+    return {
+        "predicted_category": category,
+        "confidence_percent": confidence_percent,
+        "severity_score": max(r["severity_score"] for r in results),
+        "is_miscategorized": confidence_percent < 50,
+        "image_count": len(results),
+        "category_votes": dict(Counter(r["predicted_category"] for r in results))
+    }
+
+
+# ──────────────────────────────────────────────
+# UNIFIED ENDPOINT: images + citizen text in one call
+# Replaces the backend's /analyze-and-enhance + /analyze-text round-trips
+# ──────────────────────────────────────────────
+
+def _read_issue_upload():
+    """
+    Images and fields for /analyze-issue: multipart "images" (or a single "image")
+    parts, a raw image body, or JSON with "images" / "image" base64 strings.
+    Returns: (list of image buffers, fields dict)
+    """
+    _limit_request_body(MAX_MULTI_UPLOAD_BYTES)
+    if request.mimetype == "multipart/form-data" and "images" not in request.files:
+        image_buffer, data = _read_image_upload()
+        return ([image_buffer] if image_buffer else []), data
+    if request.mimetype == "application/octet-stream" or request.mimetype.startswith("image/"):
+        image_buffer, data = _read_image_upload()
+        return [image_buffer], data
+    image_buffers, data = _read_image_uploads()
+    if not image_buffers and data.get("image"):
+        image_buffers = [base64.b64decode(data["image"])]
+    return image_buffers, data
+
+
+def _analyze_issue_image(image, executor=None):
+    """
+    Quality gate + cached classification / severity for one image of an issue.
+    A failure is reported as this image being unusable ("analysis_failed" with
+    the error), so the other images and the text analysis still return.
+    """
+    try:
+        quality = _check_image_quality(image)
+        if quality:
+            return _unusable_image_result(quality)
+        result, cache_match = _analyze_image(image, executor)
+    except Exception as e:
+        return _failed_image_result(e)
+    return _usable_image_result(result, cache_match)
+
+
+def _usable_image_result(result, cache_match):
+    """Per-image entry of an issue for an analyzed image."""
+    return {"detections_borrowed": False, **result, "usable": True,
+            "is_miscategorized": result["confidence_percent"] < 50, "cache": cache_match}
+
+
+def _failed_image_result(error):
+    """Per-image entry for an image whose analysis raised: unusable, with the error."""
+    print(f"image analysis error: {error}")
+    result = _unusable_image_result({"reason": "analysis_failed", "message": "The image could not be analyzed.",
+                                     "metrics": {}})
+    result["error"] = str(error)
+    return result
+
+
+def _issue_response(image_results, description, text_analysis):
+    """
+    /analyze-issue response: CV fields aggregated over the usable images (null
+    without images), the description's text analysis (None if too short) and per-image results.
+    """
+    response = {
+        "predicted_category": None, "confidence_percent": None, "severity_score": None,
+        "is_miscategorized": None, "usable": None, "enhanced_description": None,
+        "detections": None, "detections_borrowed": None, "cache": None, "ai_suggested": False
+    }
+    usable = [r for r in image_results if r["usable"]]
+    if usable:
+        aggregate = _aggregate_results(usable)
+        category = aggregate["predicted_category"]
+        # Detections / cache of the most confident image showing the issue category
+        primary = max(usable, key=lambda r: (r["predicted_category"] == category, r["confidence_percent"]))
+        if len(description) >= 10 and text_analysis:
+            enhanced_description = _build_enhanced_description(
+                category, aggregate["confidence_percent"], description, text_analysis
+            )
+        else:
+            enhanced_description = pick_description(category)
+        response.update(aggregate)
+        response.update({
+            "usable": True,
+            "enhanced_description": enhanced_description,
+            "detections": primary["detections"],
+            "detections_borrowed": primary["detections_borrowed"],
+            "cache": primary["cache"],
+            "ai_suggested": True
+        })
+    elif image_results:
+        response.update({key: value for key, value in image_results[0].items() if key != "index"})
+        response["enhanced_description"] = description
+
+    if text_analysis:
+        urgency = text_analysis["urgency"]
+    else:
+        urgency_level, urgency_label, keywords = detect_urgency(response["enhanced_description"] or description)
+        urgency = {"level": urgency_level, "label": urgency_label, "keywords": keywords}
+
+    response.update({
+        "classification": text_analysis["classification"] if text_analysis else None,
+        "summary": text_analysis["summary"] if text_analysis else None,
+        "urgency": urgency,
+        "text_error": text_analysis.get("error") if text_analysis else None,
+        "images": image_results
+    })
+    return response
+
+
+@app.route("/analyze-issue", methods=["POST"])
+def analyze_issue():
+    """
+    Everything issue creation needs in one request:
+    1. Text analysis of the citizen's description starts first (one batched Gemini text call)
+    2. Meanwhile every image is quality-checked, classified and scored
+    3. Returns the /analyze-and-enhance fields (aggregated over the images), the
+       /analyze-text fields, and per-image results
+    Images are optional; without them the CV fields are null.
+    """
+    image_buffers, data = _read_issue_upload()
+    description = (data.get("description") or "").strip()
+
+    if not image_buffers and len(description) < 3:
+        return jsonify({"error": "Image or description required"}), 400
+    if len(image_buffers) > MAX_BATCH_IMAGES:
+        return jsonify({"error": f"At most {MAX_BATCH_IMAGES} images per issue"}), 400
+
+    try:
+        text_future = io_executor.submit(analyze_text_comprehensive, description) if len(description) >= 3 else None
+
+        images = [DecodedImage(buffer) for buffer in image_buffers]
+        if len(images) > 1:
+            image_results = list(analysis_executor.map(_analyze_issue_image, images))
+        else:
+            # One image: its severity features overlap classification on the analysis pool
+            image_results = [_analyze_issue_image(image, analysis_executor) for image in images]
+        for index, image_result in enumerate(image_results):
+            image_result["index"] = index
+
+        text_analysis = text_future.result() if text_future else None
+
+        return jsonify(_issue_response(image_results, description, text_analysis))
+
+    except Exception as e:
+        print(f"analyze-issue error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # ──────────────────────────────────────────────
 # NEW ENDPOINT 2: Save training data for model retraining
 # Called by backend after issue is successfully submitted
@@ -231,8 +799,8 @@ def save_training_data():
     """
     Saves the submitted image + confirmed label for future model retraining.
     
-    Expects:
-    - image: base64 encoded image
+    Expects (JSON, multipart/form-data or octet-stream + query params):
+    - image: base64 encoded image, "image" file part, or the raw request body
     - confirmed_category: the final category (user may have edited AI suggestion)
     - ai_category: what AI originally predicted
     - confidence: AI confidence score
@@ -242,18 +810,21 @@ def save_training_data():
     - Local: training_data/<category>/<uuid>.jpg  +  metadata JSON
     - Cloudinary: training_data/<category>/ folder
     """
-    data = request.json
-    image_base64 = data.get("image")
+    image_bytes, data = _read_image_upload()
     confirmed_category = data.get("confirmed_category", "Uncategorized")
     ai_category = data.get("ai_category", "Uncategorized")
     confidence = data.get("confidence", 0)
     issue_id = data.get("issue_id", "unknown")
 
-    if not image_base64:
+    if not image_bytes:
         return jsonify({"error": "Image required"}), 400
 
     try:
-        image_bytes = base64.b64decode(image_base64)
+        confidence = float(confidence)
+    except (TypeError, ValueError):
+        confidence = 0
+
+    try:
         sample_id = str(uuid.uuid4())
         timestamp = datetime.utcnow().isoformat()
 
@@ -283,8 +854,9 @@ def save_training_data():
         # ── 2. Save to Cloudinary ──
         cloudinary_result = None
         try:
+            # Upload straight from the saved file — no base64 data-URI copy
             upload_response = cloudinary.uploader.upload(
-                f"data:image/jpeg;base64,{image_base64}",
+                image_path,
                 folder=f"training_data/{confirmed_category}",
                 public_id=sample_id,
                 context=f"issue_id={issue_id}|ai_category={ai_category}|confirmed={confirmed_category}|confidence={confidence}"
@@ -356,34 +928,117 @@ def training_stats():
     })
 
 
-@app.route("/health", methods=["GET"])
-def health():
-    return jsonify({"status": "AI Service is running", "version": "2.0"}), 200
+# ──────────────────────────────────────────────
+# MODEL REGISTRY: inspect, hot-load and roll back serving models
+# ──────────────────────────────────────────────
 
-@app.route("/rag-suggest", methods=["POST"])
-def rag_suggest():
+@app.route("/models", methods=["GET"])
+def list_models():
+    """Current and previous versions per model slot."""
+    return jsonify(model_registry.describe())
+
+
+@app.route("/models/reload", methods=["POST"])
+def reload_model():
     """
-    RAG endpoint for crew resolution suggestions.
-    Receives current issue + similar resolved issues from backend.
-    Generates step-by-step resolution guide using Gemini.
+    Serves new weights in a slot, in every worker: "path" (a file inside models/)
+    is loaded in the background and the old model keeps serving until it is warmed
+    up; "version" swaps to a version still in memory. Without either, re-checks
+    retrain_log.json.
     """
-    from nlp_module import generate_description
-    import google.generativeai as genai
-    gemini = genai.GenerativeModel("gemini-2.5-flash")
+    data = request.get_json(silent=True) or {}
+    slot = data.get("slot", "civic")
+    path = data.get("path")
+    version = data.get("version")
 
-    data = request.json
-    current_issue = data.get("current_issue", {})
-    similar_issues = data.get("similar_issues", [])
-
-    if not current_issue:
-        return jsonify({"error": "current_issue required"}), 400
+    try:
+        if path or version is not None:
+            model_registry.reload(slot, path=path, version=version)
+        else:
+            model_registry.check_for_new_model()
+        return jsonify({"reloading": True, "slot": slot, "path": path, "version": version}), 202
+    except (KeyError, FileNotFoundError) as e:
+        return jsonify({"error": str(e)}), 404
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/models/rollback", methods=["POST"])
+def rollback_model():
+    """Swaps a slot back to its previous version, in every worker."""
+    data = request.get_json(silent=True) or {}
+    slot = data.get("slot", "civic")
 
     try:
-        context = ""
-        if similar_issues:
-            context = "PAST RESOLVED SIMILAR ISSUES:\n"
-            for i, issue in enumerate(similar_issues, 1):
-                context += f"""
+        version = model_registry.rollback(slot)
+        return jsonify({"rolled_back": True, "slot": slot, "current": version.describe()})
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+
+
+@app.route("/models/cascade-stats", methods=["GET"])
+def model_cascade_stats():
+    """Which tier (civic classifier, detector, Gemini Vision) answered, and the thresholds in use."""
+    return jsonify(cascade_stats())
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    """Hit / miss counters and sizes of the result caches."""
+    return jsonify({
+        "image_results": image_cache.stats(),
+        "llm": llm_cache.stats(),
+        "gemini_single_flight": single_flight_stats(),
+        "text_batching": text_batcher.stats
+    })
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "AI Service is running", "version": "2.0"}), 200
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness probe: 200 once every required resource (models, clients) is loaded,
+    503 while warming up. Reports per-resource state and load duration.
+    """
+    is_ready, states = resources.readiness()
+    return jsonify({
+        "ready": is_ready,
+        "resources": states,
+        "models": model_registry.describe(),
+        "descriptions": description_pool.describe()
+    }), 200 if is_ready else 503
+
+
+# Structured reply for /rag-suggest (structured_output schema) and its token budget
+RAG_SUGGEST_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "steps": {"type": "array", "items": {"type": "string"}, "min_items": 1, "max_items": 6},
+        "materials": {"type": "array", "items": {"type": "string"}},
+        "estimated_time": {"type": "string"},
+        "safety_note": {"type": "string"}
+    },
+    "required": ["summary", "steps", "materials", "estimated_time", "safety_note"]
+}
+RAG_SUGGEST_MAX_TOKENS = 400
+
+
+def _rag_suggest_prompt(current_issue, similar_issues):
+    """Resolution-guide prompt: similar resolved issues as context, then the current issue."""
+    context = ""
+    if similar_issues:
+        context = "PAST RESOLVED SIMILAR ISSUES:\n"
+        for i, issue in enumerate(similar_issues, 1):
+            context += f"""
 Issue {i}:
 - Title: {issue.get('title', 'N/A')}
 - Category: {issue.get('category', 'N/A')}
@@ -391,7 +1046,7 @@ Issue {i}:
 - How it was resolved: {issue.get('resolution_comment', 'Resolved successfully')}
 """
 
-        prompt = f"""You are an expert municipal crew supervisor with years of field experience.
+    return f"""You are an expert municipal crew supervisor with years of field experience.
 
 {context}
 
@@ -401,51 +1056,29 @@ CURRENT ISSUE TO RESOLVE:
 - Description: {current_issue.get('description', 'N/A')}
 - Urgency: {current_issue.get('urgencyLabel', 'Medium')}
 
-Based on the past resolved issues above and your expertise, provide a clear resolution guide.
-
-Reply in this EXACT format:
-SUMMARY: <one sentence describing the fix approach>
-STEPS:
-1. <first action>
-2. <second action>
-3. <third action>
-4. <fourth action if needed>
-MATERIALS: <comma separated list of materials needed>
-ESTIMATED_TIME: <realistic time estimate e.g. "2-4 hours">
-SAFETY_NOTE: <one important safety precaution>
+Based on the past resolved issues above and your expertise, give a clear resolution guide:
+a one-sentence fix approach, 3-5 specific practical steps, the materials needed,
+a realistic time estimate (e.g. "2-4 hours") and one important safety precaution."""
 
-Nothing else. Be specific and practical."""
 
-        response = gemini.generate_content(prompt)
-        result = response.text.strip()
+@app.route("/rag-suggest", methods=["POST"])
+def rag_suggest():
+    """
+    RAG endpoint for crew resolution suggestions.
+    Receives current issue + similar resolved issues from backend.
+    Generates step-by-step resolution guide using Gemini.
+    """
+    data = request.json
+    current_issue = data.get("current_issue", {})
+    similar_issues = data.get("similar_issues", [])
 
-        suggestion = {
-            "summary": "", "steps": [], "materials": [],
-            "estimated_time": "", "safety_note": "",
-            "based_on": len(similar_issues)
-        }
+    if not current_issue:
+        return jsonify({"error": "current_issue required"}), 400
 
-        current_section = None
-        for line in result.split("\n"):
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("SUMMARY:"):
-                suggestion["summary"] = line.replace("SUMMARY:", "").strip()
-            elif line.startswith("STEPS:"):
-                current_section = "steps"
-            elif line.startswith("MATERIALS:"):
-                current_section = None
-                suggestion["materials"] = [m.strip() for m in line.replace("MATERIALS:", "").strip().split(",")]
-            elif line.startswith("ESTIMATED_TIME:"):
-                current_section = None
-                suggestion["estimated_time"] = line.replace("ESTIMATED_TIME:", "").strip()
-            elif line.startswith("SAFETY_NOTE:"):
-                current_section = None
-                suggestion["safety_note"] = line.replace("SAFETY_NOTE:", "").strip()
-            elif current_section == "steps" and line and line[0].isdigit():
-                step = line.split(".", 1)[-1].strip() if "." in line else line[2:].strip()
-                suggestion["steps"].append(step)
+    try:
+        prompt = _rag_suggest_prompt(current_issue, similar_issues)
+        reply = generate_json(prompt, RAG_SUGGEST_SCHEMA, RAG_SUGGEST_MAX_TOKENS)
+        suggestion = {**reply, "based_on": len(similar_issues)}
 
         return jsonify(suggestion)
 
@@ -457,20 +1090,9 @@ Nothing else. Be specific and practical."""
 
 # REPLACE the existing /rag-describe route in app.py with this:
 
-@app.route("/rag-describe", methods=["POST"])
-def rag_describe():
-    import google.generativeai as genai
-    gemini = genai.GenerativeModel("gemini-2.5-flash")
-
-    data        = request.json
-    description = data.get("description", "").strip()
-    category    = data.get("category", "General")
-
-    if not description or len(description) < 10:
-        return jsonify({"suggestion": None}), 200
-
-    try:
-        prompt = f"""You are helping a citizen write a better civic issue report for municipal workers.
+def _rag_describe_prompt(description, category):
+    """Prompt that rewrites a citizen's description into a clear 2-3 sentence report."""
+    return f"""You are helping a citizen write a better civic issue report for municipal workers.
 
 CITIZEN'S DESCRIPTION:
 "{description}"
@@ -484,14 +1106,28 @@ Rewrite this into a clear, specific, actionable 2-3 sentence report.
 
 Return ONLY the rewritten description. No preamble, no quotes, no explanation."""
 
-        response  = gemini.generate_content(prompt)
-        suggestion = response.text.strip().strip('"').strip("'").strip()
 
-        # FIX: only reject if suggestion is basically empty or identical word-for-word
-        if not suggestion or suggestion.lower() == description.lower():
-            return jsonify({"suggestion": None}), 200
+def _describe_suggestion(text, description):
+    """Cleaned rewrite, or None when it is empty or the same as the original."""
+    suggestion = text.strip().strip('"').strip("'").strip()
+    # FIX: only reject if suggestion is basically empty or identical word-for-word
+    if not suggestion or suggestion.lower() == description.lower():
+        return None
+    return suggestion
+
+
+@app.route("/rag-describe", methods=["POST"])
+def rag_describe():
+    data        = request.json
+    description = data.get("description", "").strip()
+    category    = data.get("category", "General")
+
+    if not description or len(description) < 10:
+        return jsonify({"suggestion": None}), 200
 
-        return jsonify({"suggestion": suggestion})
+    try:
+        response = generate_content(_rag_describe_prompt(description, category))
+        return jsonify({"suggestion": _describe_suggestion(response.text, description)})
 
     except Exception as e:
         print(f"RAG describe error: {e}")
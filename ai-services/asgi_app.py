@@ -0,0 +1,455 @@
+"""
+asgi_app.py - asyncio (ASGI) variant of the AI service, built on Quart.
+
+In app.py every Gemini call blocks a Flask worker thread for its whole
+round-trip, so a worker holds as many in-flight LLM requests as it has
+threads. Here the analysis and RAG routes are coroutines:
+
+  - Gemini calls await gemini_client.generate_content_async; at most
+    GEMINI_MAX_CONCURRENCY run per process, identical calls are coalesced
+  - concurrent text analyses share batched calls (nlp_module.nlp_async)
+  - CPU-bound CV work (decode, quality gate, YOLO, severity) runs on
+    app.py's analysis_executor; the Gemini Vision fallback is awaited on the
+    loop (classify_images_async) and severity uses score_severity_async
+
+so one process can hold hundreds of in-flight LLM requests. Request and
+response formats are the same as app.py, whose helpers, caches and executors
+this module reuses. The training-data and model-admin routes are only served
+by the WSGI service (serve.py / app.py).
+
+Usage:
+    hypercorn asgi_app:app --bind 0.0.0.0:8000     # production
+    python asgi_app.py                             # development server
+"""
+
+import asyncio
+import base64
+import functools
+from quart import Quart, request, jsonify
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+import resources
+from app import (MAX_UPLOAD_BYTES, MAX_MULTI_UPLOAD_BYTES, MAX_BATCH_IMAGES, MAX_BATCH_TEXTS, RAG_SUGGEST_SCHEMA, RAG_SUGGEST_MAX_TOKENS,
+                 analysis_executor, image_cache, _check_image_quality, _unusable_image_result, _lookup_image_result,
+                 _store_image_result, _usable_image_result, _failed_image_result, _gate_image,
+                 _unusable_enhance_response, _enhance_response, _issue_response,
+                 _batch_response, _rag_suggest_prompt, _rag_describe_prompt, _describe_suggestion)
+from cv_module import DecodedImage, classify_images_async, scale_confidence, score_severity_async, model_registry
+from nlp_module import (pick_description, description_pool, detect_urgency, text_batcher, async_text_batcher,
+                        analyze_text_comprehensive_async, analyze_texts_comprehensive_async,
+                        classify_text_async, summarize_text_async)
+from gemini_client import generate_content_async, single_flight_stats
+from structured_output import generate_json_async
+from llm_cache import llm_cache, cache_io_async
+
+# Quart bounds every body at the largest per-route limit while it streams;
+# the single-image routes are held to MAX_UPLOAD_BYTES by _limit_request_body
+app = Quart(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_MULTI_UPLOAD_BYTES
+
+# Per-endpoint body limits, as app.py's readers set them
+BODY_LIMITS = {
+    "analyze": MAX_UPLOAD_BYTES,
+    "analyze_and_enhance": MAX_UPLOAD_BYTES,
+    "analyze_issue": MAX_MULTI_UPLOAD_BYTES,
+    "analyze_batch": MAX_MULTI_UPLOAD_BYTES,
+}
+
+
+@app.before_request
+async def _limit_request_body():
+    """Rejects (413) a declared body above the endpoint's limit before it is read."""
+    limit = BODY_LIMITS.get(request.endpoint)
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        raise RequestEntityTooLarge()
+
+
+@app.errorhandler(BadRequest)
+@app.errorhandler(RequestEntityTooLarge)
+async def _upload_error(e):
+    """Malformed / oversized uploads get the usual JSON error body."""
+    return jsonify({"error": e.description}), e.code
+
+
+def _checked_image(buffer):
+    """Per-image MAX_UPLOAD_BYTES cap, as app._read_stream applies it. Returns: buffer"""
+    if len(buffer) > MAX_UPLOAD_BYTES:
+        raise RequestEntityTooLarge("Image exceeds upload size limit")
+    return buffer
+
+
+async def _in_executor(fn, *args, **kwargs):
+    """Runs CPU-bound work on the shared analysis pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(analysis_executor, functools.partial(fn, *args, **kwargs))
+
+
+def _start_text_analysis(text, min_length):
+    """Starts the description's text analysis as a task, or None when the text is too short."""
+    if text and len(text) >= min_length:
+        return asyncio.ensure_future(analyze_text_comprehensive_async(text))
+    return None
+
+
+async def _read_image_upload():
+    """Async _read_image_upload (app.py). Returns: (image bytes or None, fields dict)"""
+    if request.mimetype == "multipart/form-data":
+        files, form = await request.files, await request.form
+        upload = files.get("image")
+        return (_checked_image(upload.read()) if upload is not None else None), form.to_dict()
+
+    if request.mimetype == "application/octet-stream" or request.mimetype.startswith("image/"):
+        return _checked_image(await request.get_data()) or None, request.args.to_dict()
+
+    data = await request.get_json(silent=True) or {}
+    image_base64 = data.get("image")
+    return (base64.b64decode(image_base64) if image_base64 else None), data
+
+
+async def _read_issue_upload():
+    """Async _read_issue_upload (app.py). Returns: (list of image bytes, fields dict)"""
+    if request.mimetype == "multipart/form-data":
+        files, form = await request.files, await request.form
+        uploads = files.getlist("images") or [upload for upload in [files.get("image")] if upload is not None]
+        return [_checked_image(upload.read()) for upload in uploads], form.to_dict()
+
+    if request.mimetype == "application/octet-stream" or request.mimetype.startswith("image/"):
+        body = _checked_image(await request.get_data())
+        return ([body] if body else []), request.args.to_dict()
+
+    data = await request.get_json(silent=True) or {}
+    images = data.get("images") or ([data["image"]] if data.get("image") else [])
+    return [base64.b64decode(image) for image in images if image], data
+
+
+async def _analyze_image(image):
+    """
+    Async app._analyze_image: the cache lookup and the local cascade run on
+    analysis_executor, the Gemini Vision fallback is awaited on the loop.
+    Returns: (result dict, cache match "exact" | "perceptual" | None)
+    """
+    cached, match, key = await _in_executor(_lookup_image_result, image)
+    if cached is not None:
+        return cached, match
+    [(category, raw_confidence, detections)] = await classify_images_async([image], analysis_executor,
+                                                                           return_detections=True)
+    severity = await score_severity_async(category, scale_confidence(raw_confidence), image, detections)
+    return _store_image_result(key, category, raw_confidence, severity, detections), None
+
+
+async def _decode_and_check(image_buffer):
+    """Decode + quality gate on the executor. Returns: (image, quality result or None)"""
+    image = DecodedImage(image_buffer)
+    return image, await _in_executor(_check_image_quality, image)
+
+
+async def _decode_and_analyze(image_buffer):
+    """Decode + quality gate on the executor, then cached classification + severity."""
+    image, quality = await _decode_and_check(image_buffer)
+    if quality:
+        return quality, None, None
+    result, cache_match = await _analyze_image(image)
+    return None, result, cache_match
+
+
+async def _analyze_issue_image(image_buffer):
+    """Async app._analyze_issue_image: a failing image is reported unusable, not raised."""
+    try:
+        quality, result, cache_match = await _decode_and_analyze(image_buffer)
+    except Exception as e:
+        return _failed_image_result(e)
+    if quality:
+        return _unusable_image_result(quality)
+    return _usable_image_result(result, cache_match)
+
+
+# ──────────────────────────────────────────────
+# IMAGE + TEXT ANALYSIS
+# ──────────────────────────────────────────────
+
+@app.route("/analyze", methods=["POST"])
+async def analyze():
+    """Complete image analysis: classification, severity, description, and AI insights."""
+    image_buffer, _ = await _read_image_upload()
+
+    if not image_buffer:
+        return jsonify({"error": "Image required"}), 400
+
+    quality, result, cache_match = await _decode_and_analyze(image_buffer)
+    if quality:
+        result = _unusable_image_result(quality)
+        result["generated_description"] = quality["message"]
+        return jsonify(result)
+
+    return jsonify({
+        "predicted_category": result["predicted_category"],
+        "confidence_percent": result["confidence_percent"],
+        "generated_description": pick_description(result["predicted_category"]),
+        "severity_score": result["severity_score"],
+        "is_miscategorized": result["confidence_percent"] < 50,
+        "detections": result["detections"],
+        "detections_borrowed": result.get("detections_borrowed", False),
+        "cache": cache_match
+    })
+
+
+@app.route("/analyze-text", methods=["POST"])
+async def analyze_text():
+    """Comprehensive text analysis: classification + summarization + urgency detection."""
+    data = await request.get_json()
+    text = data.get("text", "").strip()
+
+    if not text:
+        return jsonify({"error": "Text required"}), 400
+
+    try:
+        return jsonify(await analyze_text_comprehensive_async(text))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/analyze-text-batch", methods=["POST"])
+async def analyze_text_batch():
+    """/analyze-text for several complaints at once. Body: {"texts": [...]}"""
+    data = await request.get_json() or {}
+    texts = data.get("texts")
+
+    if not isinstance(texts, list) or not texts:
+        return jsonify({"error": "texts (non-empty list) required"}), 400
+    if len(texts) > MAX_BATCH_TEXTS:
+        return jsonify({"error": f"At most {MAX_BATCH_TEXTS} texts per batch"}), 400
+
+    try:
+        results = await analyze_texts_comprehensive_async([str(text or "").strip() for text in texts])
+        return jsonify({
+            "results": [{"index": index, **result} for index, result in enumerate(results)],
+            "count": len(results)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/classify-text", methods=["POST"])
+async def classify_text_endpoint():
+    """Text classification only."""
+    data = await request.get_json()
+    text = data.get("text", "").strip()
+
+    if not text:
+        return jsonify({"error": "Text required"}), 400
+
+    try:
+        category, confidence = await classify_text_async(text)
+        return jsonify({"category": category, "confidence": confidence})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/summarize-text", methods=["POST"])
+async def summarize_text_endpoint():
+    """Text summarization only."""
+    data = await request.get_json()
+    text = data.get("text", "").strip()
+
+    if not text:
+        return jsonify({"error": "Text required"}), 400
+
+    try:
+        summary = await summarize_text_async(text)
+        return jsonify({
+            "summary": summary,
+            "original_length": len(text),
+            "summary_length": len(summary)
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/detect-urgency", methods=["POST"])
+async def detect_urgency_endpoint():
+    """Urgency detection (local keywords, no Gemini call)."""
+    data = await request.get_json()
+    text = data.get("text", "").strip()
+
+    if not text:
+        return jsonify({"error": "Text required"}), 400
+
+    urgency_level, urgency_label, keywords = detect_urgency(text)
+    return jsonify({
+        "urgency_level": urgency_level,
+        "urgency_label": urgency_label,
+        "keywords_found": keywords
+    })
+
+
+@app.route("/analyze-and-enhance", methods=["POST"])
+async def analyze_and_enhance():
+    """
+    /analyze-and-enhance: once the upload passes the quality gate, the text
+    analysis task and the CV executor job run concurrently and are joined once
+    the category is known.
+    """
+    image_buffer, data = await _read_image_upload()
+    user_description = (data.get("description") or "").strip()
+
+    if not image_buffer:
+        return jsonify({"error": "Image required"}), 400
+
+    text_task = None
+    try:
+        image, quality = await _decode_and_check(image_buffer)
+        if quality:
+            return jsonify(_unusable_enhance_response(quality, user_description))
+
+        text_task = _start_text_analysis(user_description, 10)
+        result, cache_match = await _analyze_image(image)
+        text_analysis = await text_task if text_task is not None else None
+        return jsonify(_enhance_response(result, cache_match, user_description, text_analysis))
+
+    except Exception as e:
+        if text_task is not None:
+            text_task.cancel()
+        print(f"analyze-and-enhance error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/analyze-issue", methods=["POST"])
+async def analyze_issue():
+    """/analyze-issue: text analysis task ‖ every image's analysis, awaited together."""
+    image_buffers, data = await _read_issue_upload()
+    description = (data.get("description") or "").strip()
+
+    if not image_buffers and len(description) < 3:
+        return jsonify({"error": "Image or description required"}), 400
+    if len(image_buffers) > MAX_BATCH_IMAGES:
+        return jsonify({"error": f"At most {MAX_BATCH_IMAGES} images per issue"}), 400
+
+    text_task = _start_text_analysis(description, 3)
+    try:
+        image_results = await asyncio.gather(*(_analyze_issue_image(buffer) for buffer in image_buffers))
+        for index, image_result in enumerate(image_results):
+            image_result["index"] = index
+
+        text_analysis = await text_task if text_task is not None else None
+        return jsonify(_issue_response(list(image_results), description, text_analysis))
+
+    except Exception as e:
+        if text_task is not None:
+            text_task.cancel()
+        print(f"analyze-issue error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/analyze-batch", methods=["POST"])
+async def analyze_batch():
+    """
+    /analyze-batch: each image decoded and quality-gated on the executor, batched local
+    classification of the usable ones, Vision fallbacks and severities awaited concurrently.
+    """
+    if request.mimetype == "multipart/form-data":
+        image_buffers = [_checked_image(upload.read()) for upload in (await request.files).getlist("images")]
+    else:
+        data = await request.get_json(silent=True) or {}
+        image_buffers = [base64.b64decode(image) for image in data.get("images") or [] if image]
+
+    if not image_buffers:
+        return jsonify({"error": "At least one image required"}), 400
+    if len(image_buffers) > MAX_BATCH_IMAGES:
+        return jsonify({"error": f"At most {MAX_BATCH_IMAGES} images per batch"}), 400
+
+    try:
+        images = [DecodedImage(buffer) for buffer in image_buffers]
+        gated = await asyncio.gather(*(_in_executor(_gate_image, image) for image in images))
+        images = [image for image, unusable in zip(images, gated) if unusable is None]
+
+        classifications = (await classify_images_async(images, analysis_executor, return_detections=True)
+                           if images else [])
+        confidences = [scale_confidence(raw_confidence) for _, raw_confidence, _ in classifications]
+        severities = await asyncio.gather(*(
+            score_severity_async(category, confidence_percent, image, detections)
+            for (category, _, detections), confidence_percent, image in zip(classifications, confidences, images)
+        ))
+        return jsonify(_batch_response(gated, classifications, confidences, severities))
+
+    except Exception as e:
+        print(f"analyze-batch error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# ──────────────────────────────────────────────
+# RAG ENDPOINTS
+# ──────────────────────────────────────────────
+
+@app.route("/rag-suggest", methods=["POST"])
+async def rag_suggest():
+    """Step-by-step resolution guide for crews from similar resolved issues."""
+    data = await request.get_json()
+    current_issue = data.get("current_issue", {})
+    similar_issues = data.get("similar_issues", [])
+
+    if not current_issue:
+        return jsonify({"error": "current_issue required"}), 400
+
+    try:
+        prompt = _rag_suggest_prompt(current_issue, similar_issues)
+        reply = await generate_json_async(prompt, RAG_SUGGEST_SCHEMA, RAG_SUGGEST_MAX_TOKENS)
+        return jsonify({**reply, "based_on": len(similar_issues)})
+
+    except Exception as e:
+        print(f"RAG suggest error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/rag-describe", methods=["POST"])
+async def rag_describe():
+    data        = await request.get_json()
+    description = data.get("description", "").strip()
+    category    = data.get("category", "General")
+
+    if not description or len(description) < 10:
+        return jsonify({"suggestion": None}), 200
+
+    try:
+        response = await generate_content_async(_rag_describe_prompt(description, category))
+        return jsonify({"suggestion": _describe_suggestion(response.text, description)})
+
+    except Exception as e:
+        print(f"RAG describe error: {e}")
+        return jsonify({"suggestion": None}), 200
+
+
+# ──────────────────────────────────────────────
+# HEALTH / STATS
+# ──────────────────────────────────────────────
+
+@app.route("/cache-stats", methods=["GET"])
+async def cache_stats():
+    """Hit / miss counters and sizes of the result caches."""
+    return jsonify({
+        "image_results": image_cache.stats(),
+        "llm": await cache_io_async(llm_cache.stats),
+        "gemini_single_flight": single_flight_stats(),
+        "text_batching": text_batcher.stats,
+        "text_batching_async": async_text_batcher.stats
+    })
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    return jsonify({"status": "AI Service is running", "version": "2.0", "server": "asgi"}), 200
+
+
+@app.route("/ready", methods=["GET"])
+async def ready():
+    """Readiness probe, as in app.py."""
+    is_ready, states = resources.readiness()
+    return jsonify({
+        "ready": is_ready,
+        "resources": states,
+        "models": model_registry.describe(),
+        "descriptions": description_pool.describe()
+    }), 200 if is_ready else 503
+
+
+if __name__ == "__main__":
+    app.run(port=8000, debug=True)
@@ -0,0 +1,199 @@
+"""
+batching.py - Dynamic micro-batching for model inference.
+
+Concurrent request threads submit single items; one worker thread gathers
+them into batches (up to max_batch_size, waiting at most max_wait_ms after
+the first item) and runs one batched call. Each caller gets its own result
+back through a Future. With the default single worker only that thread
+touches the model, so the model itself never sees concurrent calls; I/O-bound
+batches (remote API calls) can use several workers to keep batches in flight
+concurrently.
+
+AsyncMicroBatcher is the asyncio counterpart for coroutine callers: no worker
+threads, each batch runs as its own task on the event loop.
+"""
+
+import os
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    process_batch(items) must return a list of results in the same order.
+    If it raises, every caller in that batch receives the exception.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=10, name="batcher", workers=1):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._collect_lock = threading.Lock()
+        self._threads = []
+        self._pid = None
+        self.stats = {"batches": 0, "items": 0, "max_batch_seen": 0}
+
+    def submit(self, item):
+        """Queues one item. Returns: Future resolving to its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit_many(self, items):
+        """Queues several items at once so they can share a batch."""
+        self._ensure_worker()
+        futures = []
+        for item in items:
+            future = Future()
+            self._queue.put((item, future))
+            futures.append(future)
+        return futures
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def _running(self, pid):
+        return self._pid == pid and len(self._threads) == self.workers and all(t.is_alive() for t in self._threads)
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(); start fresh workers in each process
+        pid = os.getpid()
+        if self._running(pid):
+            return
+        with self._lock:
+            if self._running(pid):
+                return
+            if self._pid != pid:
+                self._queue = queue.Queue()
+                self._threads = []
+            self._pid = pid
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f"{self.name}-worker-{len(self._threads)}",
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _collect(self):
+        """Blocks for the first item, then gathers more until full or the wait expires."""
+        # One worker gathers at a time, so concurrent workers do not split a batch
+        with self._collect_lock:
+            return self._gather()
+
+    def _gather(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Callers that timed out and cancelled are dropped before inference
+            batch = [(item, future) for item, future in self._collect()
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: batch returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            with self._lock:
+                self.stats["batches"] += 1
+                self.stats["items"] += len(items)
+                self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(items))
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+
+class AsyncMicroBatcher:
+    """
+    process_batch(items) is a coroutine returning a list of results in the same order.
+    Items submitted within max_wait_ms of a batch's first item (up to max_batch_size)
+    share one call; every batch is its own task, so any number can be in flight.
+    Use from a single event loop.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=10, name="batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._pending = []       # (item, future) for the next batch
+        self._timer = None
+        self._tasks = set()      # running batches (the loop keeps only weak references)
+        self.stats = {"batches": 0, "items": 0, "max_batch_seen": 0}
+
+    def submit(self, item):
+        """Queues one item. Returns: asyncio.Future resolving to its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return future
+
+    def submit_many(self, items):
+        """Queues several items at once so they can share a batch."""
+        return [self.submit(item) for item in items]
+
+    async def __call__(self, item):
+        return await self.submit(item)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Callers that were cancelled are dropped before the call
+        batch = [(item, future) for item, future in self._pending if not future.done()]
+        self._pending = []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"{self.name}: batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.stats["batches"] += 1
+        self.stats["items"] += len(items)
+        self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(items))
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,124 @@
+"""
+benchmark_severity.py - Per-image severity analysis time, before and after the feature engine.
+
+Requests score one category, so each category is timed on its own:
+before: that category's original analyzer (severity.py at the top level), with
+        its own colour conversion and contour pass
+after:  cv_module.severity.calculate_severity(category, ...) — the path the
+        endpoints run, computing only the features that category's level reads,
+        with SEVERITY_MAX_SIDE set to the resolution under test
+
+Both sides start from the same decoded pixels, so decode cost is excluded.
+Also reports how often the two produce the same severity level.
+
+Usage:
+    python benchmark_severity.py              # default resolutions
+    python benchmark_severity.py 512 1600     # custom max sides
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+import cv2
+from PIL import Image
+
+import severity as legacy
+from export_model import load_sample_images
+from cv_module import severity
+from cv_module.image import DecodedImage
+
+# ── Config ──────────────────────────────────────────
+RESOLUTIONS = [320, 512, 1024, 2048]    # max side in pixels
+RUNS        = 20
+SYNTHETIC   = 4                          # noise images added when few samples exist
+CONFIDENCE  = 60                         # in the band where calculate_severity applies no adjustment
+
+CATEGORIES = [
+    ("Pothole", legacy.analyze_pothole_severity),
+    ("Garbage", legacy.analyze_garbage_severity),
+    ("Water Leakage", legacy.analyze_water_severity),
+    ("Streetlight", legacy.analyze_light_severity),
+]
+
+
+# ── Helpers ─────────────────────────────────────────
+
+def _sample_images():
+    images = load_sample_images()
+    rng = np.random.default_rng(0)
+    for _ in range(SYNTHETIC):
+        # Smoothed noise gives blobs of every size, like a cluttered street photo
+        noise = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        images.append(Image.fromarray(cv2.GaussianBlur(noise, (0, 0), 3)))
+    return images
+
+
+def _resize(image, max_side):
+    """Returns: (BGR array for the legacy analyzers, RGB array for DecodedImage)"""
+    scale = max_side / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    rgb = np.asarray(image.resize(size, Image.BILINEAR))
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR), rgb
+
+
+def _before(analyze):
+    return lambda frame: analyze(frame[0])
+
+
+def _after(category):
+    # A fresh DecodedImage per call, so no memoized grayscale / HSV carries over
+    return lambda frame: severity.calculate_severity(category, CONFIDENCE, DecodedImage.from_rgb(frame[1]),
+                                                     mode="frame")
+
+
+def _time_ms(fn, frames, runs):
+    fn(frames[0])
+    timings = []
+    for i in range(runs):
+        frame = frames[i % len(frames)]
+        start = time.perf_counter()
+        fn(frame)
+        timings.append((time.perf_counter() - start) * 1000)
+    return round(float(np.median(timings)), 3)
+
+
+# ── Main entry point ─────────────────────────────────
+
+def run_benchmark(resolutions=RESOLUTIONS, runs=RUNS):
+    """
+    Returns: one row per resolution and category with before/after median ms
+             per image, speedup and level agreement
+    """
+    images = _sample_images()
+    rows = []
+    for max_side in resolutions:
+        frames = [_resize(image, max_side) for image in images]
+        severity.SEVERITY_MAX_SIDE = max_side
+        for category, analyze in CATEGORIES:
+            before, after = _before(analyze), _after(category)
+            before_ms = _time_ms(before, frames, runs)
+            after_ms = _time_ms(after, frames, runs)
+            matches = sum(before(frame) == after(frame) for frame in frames)
+            rows.append({
+                "max_side": max_side,
+                "category": category,
+                "before_ms": before_ms,
+                "after_ms": after_ms,
+                "speedup": round(before_ms / max(after_ms, 1e-6), 2),
+                "level_agreement": round(matches / len(frames), 3)
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    resolutions = [int(arg) for arg in sys.argv[1:]] or RESOLUTIONS
+    cv2.setNumThreads(int(os.getenv("CPU_THREADS_PER_WORKER", "1")))
+    rows = run_benchmark(resolutions)
+
+    print(f"\n{'max side':>9} {'category':>14} {'before ms':>10} {'after ms':>9} {'speedup':>8}")
+    for row in rows:
+        print(f"{row['max_side']:>9} {row['category']:>14} {row['before_ms']:>10} {row['after_ms']:>9} "
+              f"{row['speedup']:>7}x")
+    print("\nResult:", json.dumps(rows, indent=2))
@@ -0,0 +1,116 @@
+"""
+calibrate.py - Confidence calibration for the retrained civic classifier.
+
+Runs the classifier (models/civic_latest.pt) over the validation split that
+retrain.prepare_dataset builds (dataset/val/<category>/), fits a softmax
+temperature and per-category confidence thresholds (cv_module/calibration.py),
+and stores them in models/civic_calibration.json under the fingerprint of the
+weights file. classify_image picks the new entry up without a restart, for
+that model version only, and falls through to the detector / Gemini Vision
+when the calibrated confidence is below the category's threshold.
+
+An exported model (e.g. the INT8 ONNX file) is a different version with its
+own probabilities, so it is calibrated separately.
+
+Usage:
+    python calibrate.py                          # models/civic_latest.pt
+    python calibrate.py path/to/weights.pt
+    python calibrate.py models/civic_latest_int8.onnx
+"""
+
+import os
+import sys
+import json
+from datetime import datetime
+import numpy as np
+from PIL import Image
+
+from cv_module.backends import load_backend
+from cv_module.calibration import (CALIBRATION_TARGET_PRECISION, apply_temperature, fit_temperature,
+                                   fit_thresholds, save_calibration)
+from cv_module.registry import file_fingerprint
+from export_model import list_images
+
+# ── Config ──────────────────────────────────────────
+BASE_DIR   = os.path.dirname(__file__)
+VAL_DIR    = os.path.join(BASE_DIR, "dataset", "val")
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+
+
+# ── Helpers ─────────────────────────────────────────
+
+def _expected_calibration_error(probs, labels, bins=10):
+    """Mean |accuracy − confidence| over confidence bins, weighted by bin size."""
+    confidence = probs.max(axis=1)
+    correct = probs.argmax(axis=1) == labels
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    error = 0.0
+    for low, high in zip(edges[:-1], edges[1:]):
+        in_bin = (confidence > low) & (confidence <= high)
+        if in_bin.any():
+            error += in_bin.mean() * abs(correct[in_bin].mean() - confidence[in_bin].mean())
+    return float(error)
+
+
+def _coverage(probs, names, thresholds, default):
+    """Share of validation images the classifier would answer itself (no fallback)."""
+    predicted = probs.argmax(axis=1)
+    confidence = probs.max(axis=1)
+    limits = np.array([thresholds.get(names[int(p)], default) for p in predicted])
+    return float((confidence >= limits).mean()) if len(probs) else 0.0
+
+
+# ── Main entry point ─────────────────────────────────
+
+def calibrate_model(weights=os.path.join(MODELS_DIR, "civic_latest.pt"),
+                    target_precision=CALIBRATION_TARGET_PRECISION):
+    """
+    Fits temperature + per-category thresholds on dataset/val for these weights
+    (.onnx files run on ONNX Runtime, as they are served).
+    Returns: report dict (the entry written to models/civic_calibration.json)
+    """
+    from cv_module.vision import CIVIC_MIN_CONFIDENCE
+
+    backend = load_backend(weights, kind="onnx" if weights.endswith(".onnx") else None)
+    if backend.task != "classify":
+        raise ValueError(f"Expected a classification model, got task={backend.task}")
+
+    samples = list_images(VAL_DIR)
+    name_to_id = {name: idx for idx, name in backend.names.items()}
+    samples = [(path, category) for path, category in samples if category in name_to_id]
+    if not samples:
+        raise RuntimeError(f"No validation split at {VAL_DIR} — run retrain.prepare_dataset first")
+
+    probs = np.stack([backend.predict([Image.open(path).convert("RGB")])[0]["probs"] for path, _ in samples])
+    labels = np.array([name_to_id[category] for _, category in samples])
+
+    temperature = fit_temperature(probs, labels)
+    calibrated = apply_temperature(probs, temperature)
+    thresholds = fit_thresholds(calibrated, labels, backend.names, target_precision)
+
+    calibration = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "weights": weights,
+        "fingerprint": file_fingerprint(weights),
+        "validation_images": len(samples),
+        "temperature": round(temperature, 4),
+        "target_precision": target_precision,
+        "thresholds": thresholds,
+        "top1": round(float((probs.argmax(axis=1) == labels).mean()), 4),
+        "ece": {
+            "raw": round(_expected_calibration_error(probs, labels), 4),
+            "calibrated": round(_expected_calibration_error(calibrated, labels), 4)
+        },
+        "validation_coverage": round(_coverage(calibrated, backend.names, thresholds, CIVIC_MIN_CONFIDENCE), 4)
+    }
+
+    save_calibration(calibration["fingerprint"], calibration)
+    print(f"✓ Calibration saved for {calibration['fingerprint']}: T={calibration['temperature']}, "
+          f"thresholds={thresholds}, coverage {calibration['validation_coverage']:.0%}")
+    return calibration
+
+
+if __name__ == "__main__":
+    weights = sys.argv[1] if len(sys.argv) > 1 else os.path.join(MODELS_DIR, "civic_latest.pt")
+    result = calibrate_model(weights)
+    print("\nResult:", json.dumps(result, indent=2, default=str))
@@ -1,5 +1,11 @@
 # CV Module - Computer Vision processing
-from .vision import classify_image
-from .severity import calculate_severity, scale_confidence
+from .vision import classify_image, classify_images, classify_images_async, cascade_stats, model_registry, serving_version
+from .severity import calculate_severity, compute_severity_features, scale_confidence
+from .image import DecodedImage
+from .quality import assess_quality
+from .result_cache import ImageResultCache
+from .severity_pool import score_severity, score_severity_async
 
-__all__ = ['classify_image', 'calculate_severity', 'scale_confidence']
+__all__ = ['classify_image', 'classify_images', 'classify_images_async', 'cascade_stats', 'calculate_severity', 'compute_severity_features', 'scale_confidence', 'DecodedImage', 'assess_quality', 'ImageResultCache', 'model_registry',
+           'serving_version',
+           'score_severity', 'score_severity_async']
@@ -0,0 +1,242 @@
+"""
+Pluggable inference backends for the vision models.
+
+Every backend exposes the same interface:
+    backend.task            "detect" or "classify"
+    backend.names           {class_id: class_name}
+    backend.predict(images) one prediction dict per PIL image
+
+Prediction dicts:
+    detect   → {"class_ids": int array, "confidences": float array,
+                "boxes": Nx4 float array (x1, y1, x2, y2 in input pixels)}
+    classify → {"probs": float array over backend.names}
+
+Backend selection (CV_INFERENCE_BACKEND):
+    torch    — ultralytics / PyTorch eager (default)
+    onnx     — onnxruntime on CPU; torch is only needed to export a .pt once
+    openvino — OpenVINO runtime reading the same exported .onnx file
+"""
+
+import os
+import ast
+import cv2
+import numpy as np
+
+INFERENCE_BACKEND    = os.getenv("CV_INFERENCE_BACKEND", "torch").lower()
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", str(os.cpu_count() or 1)))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "1"))
+
+# Same defaults as ultralytics predict(), so backends agree on what counts as a box
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD  = 0.7
+MAX_DETECTIONS = 300
+
+
+# ── PyTorch (ultralytics) ───────────────────────────
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, weights):
+        from ultralytics import YOLO
+        self.weights = weights
+        self.model = YOLO(weights)
+        self.task = self.model.task
+        self.names = dict(self.model.names)
+
+    def predict(self, images):
+        predictions = []
+        for result in self.model(images, verbose=False):
+            if self.task == "classify":
+                predictions.append({"probs": result.probs.data.cpu().numpy()})
+            else:
+                boxes = result.boxes
+                predictions.append({
+                    "class_ids": boxes.cls.cpu().numpy().astype(int),
+                    "confidences": boxes.conf.cpu().numpy(),
+                    "boxes": boxes.xyxy.cpu().numpy()
+                })
+        return predictions
+
+
+# ── ONNX Runtime ────────────────────────────────────
+
+class OnnxBackend:
+    """Runs an ultralytics-exported ONNX model without torch."""
+    name = "onnx"
+
+    def __init__(self, onnx_path):
+        self.weights = onnx_path
+        self._load(onnx_path)
+        meta = self._metadata()
+        self.task = meta.get("task", "detect")
+        self.names = ast.literal_eval(meta["names"]) if "names" in meta else {}
+        imgsz = ast.literal_eval(meta["imgsz"]) if "imgsz" in meta else [640, 640]
+        self.imgsz = tuple(imgsz) if isinstance(imgsz, (list, tuple)) else (imgsz, imgsz)
+        self.dynamic_batch = not isinstance(self._input_shape()[0], int)
+
+    def _load(self, onnx_path):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+        options.inter_op_num_threads = ORT_INTER_OP_THREADS
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _metadata(self):
+        return dict(self.session.get_modelmeta().custom_metadata_map)
+
+    def _input_shape(self):
+        return self.session.get_inputs()[0].shape
+
+    def _run(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+    def predict(self, images):
+        arrays = [np.asarray(image.convert("RGB")) for image in images]
+        if self.task == "classify":
+            batch = np.stack([_classify_transform(a, self.imgsz[0]) for a in arrays])
+            return [{"probs": probs} for probs in self._forward(batch)]
+
+        letterboxed = [_letterbox(a, self.imgsz) for a in arrays]
+        batch = np.stack([tensor for tensor, _, _ in letterboxed])
+        outputs = self._forward(batch)
+        return [
+            _postprocess_detections(output, ratio, pad, array.shape[:2])
+            for output, (_, ratio, pad), array in zip(outputs, letterboxed, arrays)
+        ]
+
+    def _forward(self, batch):
+        # Static-batch exports only take one image at a time
+        if self.dynamic_batch:
+            return self._run(batch)
+        return np.concatenate([self._run(batch[i:i + 1]) for i in range(len(batch))])
+
+
+# ── OpenVINO ────────────────────────────────────────
+
+class OpenVinoBackend(OnnxBackend):
+    """OpenVINO compiles the exported ONNX graph directly; pre/post-processing is shared."""
+    name = "openvino"
+
+    def _load(self, onnx_path):
+        import onnx
+        import openvino as ov
+        core = ov.Core()
+        self._onnx_meta = {p.key: p.value for p in onnx.load(onnx_path, load_external_data=False).metadata_props}
+        self.model = core.read_model(onnx_path)
+        self.compiled = core.compile_model(self.model, "CPU", {
+            "INFERENCE_NUM_THREADS": ORT_INTRA_OP_THREADS,
+            "PERFORMANCE_HINT": "LATENCY"
+        })
+
+    def _metadata(self):
+        return self._onnx_meta
+
+    def _input_shape(self):
+        shape = self.model.inputs[0].get_partial_shape()
+        return [d.get_length() if d.is_static else None for d in shape]
+
+    def _run(self, batch):
+        return self.compiled(batch)[0]
+
+
+# ── Pre/post-processing (mirrors ultralytics) ───────
+
+def _letterbox(array, imgsz):
+    """Resize keeping aspect ratio, pad to imgsz with grey. Returns (CHW float tensor, ratio, (pad_w, pad_h))."""
+    height, width = array.shape[:2]
+    ratio = min(imgsz[0] / height, imgsz[1] / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    pad_w, pad_h = (imgsz[1] - new_w) / 2, (imgsz[0] - new_h) / 2
+    if (new_w, new_h) != (width, height):
+        array = cv2.resize(array, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(pad_h - 0.1)), int(round(pad_h + 0.1))
+    left, right = int(round(pad_w - 0.1)), int(round(pad_w + 0.1))
+    array = cv2.copyMakeBorder(array, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    tensor = np.ascontiguousarray(array.transpose(2, 0, 1), dtype=np.float32) / 255.0
+    return tensor, ratio, (left, top)
+
+
+def _classify_transform(array, size):
+    """Shorter side → size, centre crop, scale to [0, 1] (ultralytics classify_transforms)."""
+    height, width = array.shape[:2]
+    scale = size / min(height, width)
+    array = cv2.resize(array, (max(size, round(width * scale)), max(size, round(height * scale))),
+                       interpolation=cv2.INTER_LINEAR)
+    height, width = array.shape[:2]
+    top, left = (height - size) // 2, (width - size) // 2
+    array = array[top:top + size, left:left + size]
+    return np.ascontiguousarray(array.transpose(2, 0, 1), dtype=np.float32) / 255.0
+
+
+def _postprocess_detections(output, ratio, pad, original_shape):
+    """YOLOv8 head output (4 + num_classes, anchors) → boxes in original image pixels after NMS."""
+    predictions = output.T
+    scores = predictions[:, 4:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    keep = confidences > CONF_THRESHOLD
+    predictions, class_ids, confidences = predictions[keep], class_ids[keep], confidences[keep]
+
+    if len(predictions) == 0:
+        return {"class_ids": np.zeros(0, dtype=int), "confidences": np.zeros(0, dtype=np.float32),
+                "boxes": np.zeros((0, 4), dtype=np.float32)}
+
+    cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    # Class-aware NMS, same as ultralytics' default (agnostic=False)
+    xywh = np.stack([boxes[:, 0], boxes[:, 1], w, h], axis=1)
+    indices = cv2.dnn.NMSBoxesBatched(xywh.tolist(), confidences.tolist(), class_ids.tolist(),
+                                      CONF_THRESHOLD, IOU_THRESHOLD)
+    indices = np.array(indices, dtype=int).reshape(-1)[:MAX_DETECTIONS]
+
+    boxes = boxes[indices]
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad[0]) / ratio
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad[1]) / ratio
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, original_shape[1])
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, original_shape[0])
+    return {"class_ids": class_ids[indices].astype(int), "confidences": confidences[indices], "boxes": boxes}
+
+
+# ── Export / loading ────────────────────────────────
+
+def export_onnx(weights, imgsz=None, force=False):
+    """
+    Exports ultralytics .pt weights to ONNX next to the weights file (needs torch).
+    Reuses an existing export that is newer than the weights unless force=True.
+    Returns: path to the .onnx file
+    """
+    onnx_path = os.path.splitext(weights)[0] + ".onnx"
+    if not force and os.path.exists(onnx_path) and (
+            not os.path.exists(weights) or os.path.getmtime(onnx_path) >= os.path.getmtime(weights)):
+        return onnx_path
+
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    if imgsz is None:
+        imgsz = 224 if model.task == "classify" else 640
+    print(f"📦 Exporting {weights} → ONNX (imgsz={imgsz})...")
+    return model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+
+def load_backend(weights, kind=None):
+    """
+    Builds the inference backend for weights (.pt or .onnx).
+    ONNX/OpenVINO with .pt weights use (or create) the sibling .onnx export.
+    Returns: backend instance
+    """
+    kind = (kind or INFERENCE_BACKEND).lower()
+    if kind == "torch":
+        return TorchBackend(weights)
+
+    onnx_path = weights if weights.endswith(".onnx") else export_onnx(weights)
+
+    if kind == "onnx":
+        return OnnxBackend(onnx_path)
+    if kind == "openvino":
+        return OpenVinoBackend(onnx_path)
+    raise ValueError(f"Unknown CV_INFERENCE_BACKEND: {kind}")
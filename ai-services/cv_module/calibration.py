@@ -0,0 +1,147 @@
+"""
+Confidence calibration for the retrained civic classifier.
+
+A small fine-tuned classifier is usually over-confident, so its raw top-1
+probability is a poor signal for "good enough, skip Gemini". calibrate.py fits
+on the validation split after each retrain:
+  - a softmax temperature (minimises negative log-likelihood)
+  - a per-category threshold: the lowest calibrated confidence at which that
+    category's predictions still reach CALIBRATION_TARGET_PRECISION
+and writes them to models/civic_calibration.json, keyed by the fingerprint of
+the weights they were fitted on (registry.file_fingerprint). classify_image
+applies the entry of the civic version it is serving, so a rollback or the
+INT8 export never runs with another version's thresholds; a version without
+an entry uses raw probabilities and CIVIC_MIN_CONFIDENCE. The file is re-read
+whenever it changes.
+"""
+
+import os
+import json
+import threading
+import numpy as np
+
+from .registry import MODELS_DIR
+
+CIVIC_CALIBRATION_PATH = os.path.join(MODELS_DIR, "civic_calibration.json")
+
+CALIBRATION_TARGET_PRECISION = float(os.getenv("CALIBRATION_TARGET_PRECISION", "0.9"))
+CALIBRATION_MIN_THRESHOLD    = float(os.getenv("CALIBRATION_MIN_THRESHOLD", "0.3"))   # floor for small val sets
+CALIBRATION_VERSIONS_KEPT    = 10      # newest entries kept, so rolled-back versions still find theirs
+
+# Manual per-category overrides, e.g. "Pothole:0.7,Garbage:0.55" (win over the fitted file)
+THRESHOLD_OVERRIDES = {
+    name.strip(): float(value)
+    for name, value in (item.split(":", 1) for item in os.getenv("CIVIC_CATEGORY_THRESHOLDS", "").split(",") if ":" in item)
+}
+
+_cache = {"path": None, "mtime": None, "versions": None}
+_cache_lock = threading.Lock()
+
+
+# ── Serving ──
+
+def _read_versions(path):
+    """{fingerprint: calibration} from the file, re-read only when it changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    with _cache_lock:
+        if _cache["versions"] is None or (path, mtime) != (_cache["path"], _cache["mtime"]):
+            versions = {}
+            if mtime is not None:
+                try:
+                    with open(path) as f:
+                        versions = json.load(f).get("versions", {})
+                except (OSError, ValueError, AttributeError) as e:
+                    print(f"Calibration file unreadable, using raw probabilities: {e}")
+            _cache["path"], _cache["mtime"], _cache["versions"] = path, mtime, versions
+        return _cache["versions"]
+
+
+def load_calibration(fingerprint, path=CIVIC_CALIBRATION_PATH):
+    """
+    Calibration fitted on the weights with this fingerprint (ModelVersion.fingerprint).
+    Returns: {"temperature": float, "thresholds": {category: float}, "fitted": bool}
+    """
+    fitted = _read_versions(path).get(fingerprint)
+    calibration = {"temperature": 1.0, "thresholds": {}, **(fitted or {}), "fitted": fitted is not None}
+    calibration["thresholds"] = {**calibration["thresholds"], **THRESHOLD_OVERRIDES}
+    return calibration
+
+
+def save_calibration(fingerprint, calibration, path=CIVIC_CALIBRATION_PATH):
+    """Stores one version's calibration, keeping the newest CALIBRATION_VERSIONS_KEPT entries."""
+    try:
+        with open(path) as f:
+            versions = json.load(f).get("versions", {})
+    except (OSError, ValueError, AttributeError):
+        versions = {}
+    versions[fingerprint] = calibration
+    newest = sorted(versions.items(), key=lambda item: item[1].get("timestamp", ""), reverse=True)
+    # Renamed into place, so a serving process never reads half a file
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"versions": dict(newest[:CALIBRATION_VERSIONS_KEPT])}, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def apply_temperature(probs, temperature=1.0):
+    """Rescales a probability vector as softmax(log(p) / T)."""
+    probs = np.asarray(probs, dtype=np.float64)
+    if temperature == 1.0:
+        return probs
+    logits = np.log(np.clip(probs, 1e-12, 1.0)) / temperature
+    logits -= logits.max(axis=-1, keepdims=True)
+    scaled = np.exp(logits)
+    return scaled / scaled.sum(axis=-1, keepdims=True)
+
+
+# ── Fitting (used by calibrate.py) ──
+
+def fit_temperature(probs, labels, candidates=None):
+    """
+    Temperature minimising NLL of the true labels, by grid search.
+    probs: NxC raw probabilities, labels: N class indices
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    labels = np.asarray(labels)
+    if candidates is None:
+        candidates = np.exp(np.linspace(np.log(0.25), np.log(10.0), 120))
+
+    def nll(temperature):
+        scaled = apply_temperature(probs, temperature)
+        return -np.mean(np.log(np.clip(scaled[np.arange(len(labels)), labels], 1e-12, 1.0)))
+
+    return float(min(candidates, key=nll))
+
+
+def fit_thresholds(probs, labels, names, target_precision=CALIBRATION_TARGET_PRECISION):
+    """
+    Per-category threshold: the lowest calibrated top-1 confidence at which
+    predictions of that category are still at least target_precision correct.
+    Categories that never reach it get 1.0 (always defer to the next tier);
+    categories never predicted are left out (serving default applies).
+    Returns: {category: threshold}
+    """
+    probs = np.asarray(probs, dtype=np.float64)
+    labels = np.asarray(labels)
+    predicted = probs.argmax(axis=1)
+    confidence = probs.max(axis=1)
+
+    thresholds = {}
+    for class_id, name in names.items():
+        mask = predicted == class_id
+        if not mask.any():
+            continue
+        order = np.argsort(-confidence[mask])
+        correct = (labels[mask] == class_id)[order]
+        precision = np.cumsum(correct) / np.arange(1, len(correct) + 1)
+        passing = np.nonzero(precision >= target_precision)[0]
+        if len(passing) == 0:
+            thresholds[name] = 1.0
+        else:
+            # Deepest prefix that still meets the target → lowest usable threshold
+            thresholds[name] = round(max(float(confidence[mask][order][passing[-1]]), CALIBRATION_MIN_THRESHOLD), 4)
+    return thresholds
@@ -0,0 +1,222 @@
+import io
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+# Upper bound on the longest side of any decoded upload (0 = full resolution).
+# JPEGs are decoded directly at 1/2, 1/4 or 1/8 scale via draft mode.
+MAX_DECODE_SIDE = int(os.getenv("CV_MAX_DECODE_SIDE", "1600"))
+
+# Inline uploads to Gemini Vision: longest side and byte budget of the JPEG.
+# Quality steps are tried highest first (binary search) until one fits.
+GEMINI_IMAGE_MAX_SIDE  = int(os.getenv("GEMINI_IMAGE_MAX_SIDE", "1024"))
+GEMINI_IMAGE_MAX_BYTES = int(os.getenv("GEMINI_IMAGE_MAX_BYTES", "250000"))
+JPEG_QUALITY_STEPS     = (90, 85, 75, 65, 55, 45, 35)
+MIN_UPLOAD_SIDE        = 256
+
+# Longest side each CV stage reads (register_stage_side); an upload is decoded
+# once, at the largest of them, and every stage view is scaled down from that
+_stage_sides = {GEMINI_IMAGE_MAX_SIDE}
+
+
+def register_stage_side(max_side):
+    """Declares the resolution a CV stage reads through DecodedImage.at()."""
+    if max_side:
+        _stage_sides.add(int(max_side))
+
+
+def _downscale(image, max_side):
+    """image bounded to max_side (Image.reduce, then a thumbnail pass); never modifies image."""
+    if not max_side or max(image.size) <= max_side:
+        return image
+    factor = max(image.size) // max_side
+    image = image.reduce(factor) if factor >= 2 else image.copy()
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return image
+
+
+def _decode(image_bytes, max_side=None):
+    """
+    Decodes image bytes to an RGB PIL image whose longest side is at most
+    max_side. Uses JPEG draft mode (DCT scaling) and Image.reduce so the
+    full-resolution bitmap is never materialized for large uploads.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    if max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        target = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        # JPEG: decoder picks the smallest 1/N scale that is still >= target
+        image.draft("RGB", target)
+        image = _downscale(image, max_side)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image
+
+
+def _covers(bitmap, decoded_side, max_side):
+    """Whether a bitmap decoded at decoded_side (None = full resolution) can serve a max_side view."""
+    return (decoded_side is None or max(bitmap.size) < decoded_side
+            or (max_side is not None and max_side <= decoded_side))
+
+
+class DecodedImage:
+    """
+    One decoded upload shared by every CV stage of a request.
+    The raw bytes are decoded once, at the largest side any registered stage
+    reads (register_stage_side); RGB / BGR / grayscale / HSV arrays and the
+    JPEG re-encode are computed on first access and memoized.
+
+    Stages that need less resolution call at(max_side) to get a reduced-size
+    view, scaled down from that one bitmap (not decoded again) and memoized.
+    Only a request above the shared side (e.g. the full-size pil of the
+    upload itself) decodes again.
+    """
+
+    @classmethod
+    def from_rgb(cls, array):
+        """Wraps an already-decoded HxWx3 RGB array (e.g. one received through shared memory)."""
+        image = cls(None, max_side=max(array.shape[:2]))
+        image._rgb = array
+        return image
+
+    def __init__(self, image_bytes, max_side=MAX_DECODE_SIDE, _parent=None):
+        self.image_bytes = image_bytes
+        self.max_side = max_side or None
+        self._parent = _parent
+        self._views = {}
+        self._shared = None      # (bitmap, side it was decoded at) — on the root image only
+        self._pil = None
+        self._rgb = None
+        self._bgr = None
+        self._gray = None
+        self._hsv = None
+        self._jpeg = {}
+        self._uploads = {}
+
+    @property
+    def pil(self):
+        """PIL image in RGB mode."""
+        if self._pil is None:
+            if self._rgb is not None:
+                self._pil = Image.fromarray(self._rgb)
+            else:
+                self._pil = _downscale(self._root()._bitmap(self.max_side), self.max_side)
+        return self._pil
+
+    def _root(self):
+        image = self
+        while image._parent is not None:
+            image = image._parent
+        return image
+
+    def _bitmap(self, max_side):
+        """
+        Root only: the shared decoded bitmap, large enough for a max_side view.
+        Decoded at the largest registered stage side (at least max_side, at most
+        this image's own bound); decoded again only when a larger view is asked for.
+        """
+        if self._pil is not None or self._rgb is not None:
+            return self.pil
+        if self._shared is None or not _covers(*self._shared, max_side):
+            side = None if max_side is None else max(max_side, *_stage_sides)
+            if self.max_side:
+                side = self.max_side if side is None else min(side, self.max_side)
+            self._shared = (_decode(self.image_bytes, side), side)
+        return self._shared[0]
+
+    def at(self, max_side):
+        """
+        View of this image bounded to max_side on its longest side.
+        Returns self when the request is no smaller than this image's bound.
+        """
+        if not max_side or (self.max_side and max_side >= self.max_side):
+            return self
+        if max_side not in self._views:
+            self._views[max_side] = DecodedImage(self.image_bytes, max_side, _parent=self)
+        return self._views[max_side]
+
+    @property
+    def size(self):
+        """(width, height) of the decoded image."""
+        return self.pil.size
+
+    @property
+    def rgb(self):
+        """HxWx3 uint8 array, RGB order."""
+        if self._rgb is None:
+            self._rgb = np.asarray(self.pil)
+        return self._rgb
+
+    @property
+    def bgr(self):
+        """HxWx3 uint8 array, BGR order (OpenCV)."""
+        if self._bgr is None:
+            self._bgr = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR)
+        return self._bgr
+
+    @property
+    def gray(self):
+        """HxW uint8 grayscale array."""
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    @property
+    def hsv(self):
+        """HxWx3 uint8 array in OpenCV HSV."""
+        if self._hsv is None:
+            self._hsv = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2HSV)
+        return self._hsv
+
+    def jpeg_bytes(self, quality=85):
+        """JPEG re-encode of the RGB image, memoized per quality."""
+        if quality not in self._jpeg:
+            buffer = io.BytesIO()
+            self.pil.save(buffer, format="JPEG", quality=quality)
+            self._jpeg[quality] = buffer.getvalue()
+        return self._jpeg[quality]
+
+    def upload_jpeg(self, max_side=GEMINI_IMAGE_MAX_SIDE, max_bytes=GEMINI_IMAGE_MAX_BYTES):
+        """
+        JPEG sized for an inline API upload: downscaled to max_side, at the highest
+        quality step that fits max_bytes; if even the lowest step is too large the
+        side shrinks further. Memoized, so retries and further prompts reuse it.
+        """
+        key = (max_side, max_bytes)
+        if key not in self._uploads:
+            view = self.at(max_side)
+            while True:
+                data = _fit_quality(view, max_bytes)
+                if data is not None or max(view.size) <= MIN_UPLOAD_SIDE:
+                    break
+                view = self.at(max(MIN_UPLOAD_SIDE, int(max(view.size) * 0.75)))
+            self._uploads[key] = data if data is not None else view.jpeg_bytes(JPEG_QUALITY_STEPS[-1])
+        return self._uploads[key]
+
+
+def _fit_quality(image, max_bytes):
+    """Highest JPEG_QUALITY_STEPS encode within max_bytes (size falls with quality), or None."""
+    best = None
+    low, high = 0, len(JPEG_QUALITY_STEPS) - 1
+    while low <= high:
+        mid = (low + high) // 2
+        data = image.jpeg_bytes(JPEG_QUALITY_STEPS[mid])
+        if len(data) <= max_bytes:
+            best = data
+            high = mid - 1
+        else:
+            low = mid + 1
+    return best
+
+
+def as_decoded_image(image, max_side=None):
+    """
+    Accepts raw bytes or an existing DecodedImage.
+    max_side: optional resolution the calling stage needs.
+    Returns: DecodedImage (a memoized view of the one passed in)
+    """
+    if not isinstance(image, DecodedImage):
+        image = DecodedImage(image)
+    return image.at(max_side)
@@ -0,0 +1,96 @@
+"""
+Cheap pre-screen for unusable uploads (pocket shots, lens-cap frames, heavy
+motion blur, thumbnails) before YOLO, Gemini Vision and severity run.
+
+All checks use a small grayscale thumbnail of the request's DecodedImage plus
+the dimensions from the image header, so a rejected upload costs a reduced
+JPEG decode and a few array reductions.
+
+Night photos are expected (broken streetlights are reported after dark), so a
+dark frame is only rejected when it is also flat and has no light sources in
+it — the lens-cap / pocket case, not a dim street. Light sources (bright pixels
+standing out from the frame's dominant level) also exempt a frame from the
+blank check.
+"""
+
+import io
+import os
+import cv2
+from PIL import Image
+
+from .image import as_decoded_image, register_stage_side
+
+QUALITY_MAX_SIDE      = int(os.getenv("QUALITY_MAX_SIDE", "256"))          # thumbnail the checks run on
+QUALITY_MIN_SIDE      = int(os.getenv("QUALITY_MIN_SIDE", "64"))           # px, shortest side of the upload
+QUALITY_DARK_MEAN     = float(os.getenv("QUALITY_DARK_MEAN", "18"))        # mean gray below → too dark, if also
+QUALITY_DARK_FLAT     = float(os.getenv("QUALITY_DARK_FLAT", "0.9"))       #   this share in one histogram bin
+QUALITY_LIGHT_LEVEL   = int(os.getenv("QUALITY_LIGHT_LEVEL", "200"))       # gray at or above → light source pixel
+QUALITY_LIGHT_SHARE   = float(os.getenv("QUALITY_LIGHT_SHARE", "0.001"))   # light pixels above this share → lit scene
+QUALITY_BRIGHT_MEAN   = float(os.getenv("QUALITY_BRIGHT_MEAN", "245"))     # mean gray above → overexposed
+QUALITY_BLANK_SHARE   = float(os.getenv("QUALITY_BLANK_SHARE", "0.97"))    # pixels in one histogram bin → blank
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "15"))    # Laplacian variance below → blurry
+register_stage_side(QUALITY_MAX_SIDE)
+
+HISTOGRAM_BINS = 32
+
+REASON_MESSAGES = {
+    "unreadable":  "File could not be decoded as an image.",
+    "too_small":   "Image is too small to analyze.",
+    "too_dark":    "Image is almost completely dark.",
+    "overexposed": "Image is almost completely white.",
+    "blank":       "Image is blank or a single flat colour.",
+    "too_blurry":  "Image is too blurry to analyze."
+}
+
+
+def _source_size(image):
+    """(width, height) of the upload itself, from the header when bytes are available."""
+    if image.image_bytes is not None:
+        return Image.open(io.BytesIO(image.image_bytes)).size
+    return image.size
+
+
+def assess_quality(image):
+    """
+    Accepts raw image bytes or a DecodedImage.
+    Returns: {"usable": bool, "reason": code or None, "message": str or None, "metrics": {...}}
+    """
+    image = as_decoded_image(image)
+    try:
+        width, height = _source_size(image)
+        gray = image.at(QUALITY_MAX_SIDE).gray if min(width, height) >= QUALITY_MIN_SIDE else None
+    except Exception:
+        return {"usable": False, "reason": "unreadable", "message": REASON_MESSAGES["unreadable"], "metrics": {}}
+    metrics = {"width": width, "height": height}
+
+    reason = None
+    if gray is None:
+        reason = "too_small"
+    else:
+        histogram = cv2.calcHist([gray], [0], None, [HISTOGRAM_BINS], [0, 256]).ravel()
+        # Light sources: bright bins other than the dominant one (a flat white frame has none)
+        light_bin, dominant = QUALITY_LIGHT_LEVEL * HISTOGRAM_BINS // 256, int(histogram.argmax())
+        light = histogram[light_bin:].sum() - (histogram[dominant] if dominant >= light_bin else 0)
+        metrics.update({
+            "mean_brightness": round(float(gray.mean()), 2),
+            "dominant_bin_share": round(float(histogram.max() / max(gray.size, 1)), 4),
+            "light_share": round(float(light / max(gray.size, 1)), 4),
+            "sharpness": round(float(cv2.Laplacian(gray, cv2.CV_64F).var()), 2)
+        })
+        lit = metrics["light_share"] >= QUALITY_LIGHT_SHARE
+        if metrics["mean_brightness"] < QUALITY_DARK_MEAN and metrics["dominant_bin_share"] >= QUALITY_DARK_FLAT \
+                and not lit:
+            reason = "too_dark"
+        elif metrics["mean_brightness"] > QUALITY_BRIGHT_MEAN:
+            reason = "overexposed"
+        elif metrics["dominant_bin_share"] >= QUALITY_BLANK_SHARE and not lit:
+            reason = "blank"
+        elif metrics["sharpness"] < QUALITY_MIN_SHARPNESS:
+            reason = "too_blurry"
+
+    return {
+        "usable": reason is None,
+        "reason": reason,
+        "message": REASON_MESSAGES.get(reason),
+        "metrics": metrics
+    }
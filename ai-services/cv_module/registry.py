@@ -0,0 +1,349 @@
+"""
+Versioned model registry with background loading and atomic hot-swap.
+
+Each named slot ("detector", "civic") holds the version currently serving plus
+a short history for rollback. New weights are loaded and warmed up off the
+request path, then swapped in with a single reference assignment. Callers take
+a reference to the current version at the start of a request, so requests
+already in flight finish on the model they started with.
+
+The watcher polls retrain_log.json (written by retrain.py) and loads the new
+model_path into the "civic" slot whenever the log changes. /models/reload and
+/models/rollback do not swap models directly: they record the requested
+weights in registry_state.json, which the same watcher polls, so every
+pre-fork worker converges on the same version. Versions are identified across
+workers by a content fingerprint of their weights file (version numbers are
+per process). Only weights inside MODELS_DIR, or versions already loaded, can
+be requested.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime
+from PIL import Image
+
+from .backends import load_backend, INFERENCE_BACKEND
+
+BASE_DIR              = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODELS_DIR            = os.path.join(BASE_DIR, "models")
+RETRAIN_LOG           = os.path.join(BASE_DIR, "retrain_log.json")
+CIVIC_MODEL_PATH      = os.path.join(MODELS_DIR, "civic_latest.pt")
+CIVIC_INT8_MODEL_PATH = os.path.join(MODELS_DIR, "civic_latest_int8.onnx")
+REGISTRY_STATE        = os.path.join(MODELS_DIR, "registry_state.json")   # serving requests from the API
+
+REGISTRY_POLL_SECONDS = float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "30"))
+MODEL_HISTORY         = int(os.getenv("MODEL_REGISTRY_HISTORY", "2"))   # old versions kept for rollback
+
+
+def file_fingerprint(path):
+    """
+    Short content hash of a weights file — the same in every worker, unlike
+    version numbers. Returns: hex string (a hash of the path if it is not a file)
+    """
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    else:
+        digest.update(os.path.abspath(path).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ModelVersion:
+    """One loaded, warmed-up model. Immutable once published."""
+
+    def __init__(self, version, path, backend, load_ms, fingerprint=None):
+        self.version = version
+        self.path = path
+        self.backend = backend
+        self.fingerprint = fingerprint or file_fingerprint(path)
+        self.lock = threading.Lock()
+        self.loaded_at = datetime.utcnow().isoformat()
+        self.load_ms = load_ms
+        self.warmup_ms = None
+
+    def predict(self, images):
+        with self.lock:
+            return self.backend.predict(images)
+
+    def warm_up(self):
+        """One dummy inference so the first real request does not pay for lazy init."""
+        start = time.perf_counter()
+        self.predict([Image.new("RGB", (64, 64), (114, 114, 114))])
+        self.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "fingerprint": self.fingerprint,
+            "backend": self.backend.name,
+            "task": self.backend.task,
+            "loaded_at": self.loaded_at,
+            "load_ms": self.load_ms,
+            "warmup_ms": self.warmup_ms
+        }
+
+
+class ModelSlot:
+    def __init__(self, name):
+        self.name = name
+        self.current = None
+        self.history = []
+        self.loading = None
+        self.last_error = None
+        self._next_version = 1
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current ModelVersion or None. A plain attribute read, so it is atomic."""
+        return self.current
+
+    def find(self, version=None, fingerprint=None):
+        """Returns: the current or a previous ModelVersion by number or fingerprint, or None"""
+        for candidate in [self.current] + self.history[::-1]:
+            if candidate is not None and (candidate.version == version or candidate.fingerprint == fingerprint):
+                return candidate
+        return None
+
+    def load(self, path, background=True, warm=True, fingerprint=None):
+        """
+        Loads path, warms it up and swaps it in.
+        background=True returns immediately; the old model keeps serving meanwhile.
+        warm=False skips the dummy inference (e.g. when preloading before fork).
+        fingerprint, if given, must match the file (it may have been overwritten since).
+        Returns: the new ModelVersion (foreground) or the loader thread (background)
+        """
+        if background:
+            thread = threading.Thread(target=self._load_quietly, args=(path, warm, fingerprint),
+                                      name=f"load-{self.name}", daemon=True)
+            thread.start()
+            return thread
+        return self._load(path, warm, fingerprint)
+
+    def serve(self, path, fingerprint=None, background=True, warm=True):
+        """
+        Makes the given weights the serving version: nothing to do if they already
+        are, an instant swap if they are in the history, otherwise a load.
+        Returns: the ModelVersion now serving, or the loader thread (background load)
+        """
+        with self._lock:
+            if fingerprint is not None:
+                if self.current is not None and self.current.fingerprint == fingerprint:
+                    return self.current
+                for version in self.history[::-1]:
+                    if version.fingerprint == fingerprint:
+                        self.history.remove(version)
+                        self._publish(version)
+                        print(f"↩ Model registry: {self.name} swapped back to v{version.version}")
+                        return version
+        return self.load(path, background, warm, fingerprint)
+
+    def _load(self, path, warm=True, fingerprint=None):
+        self.loading = path
+        try:
+            if fingerprint is not None and file_fingerprint(path) != fingerprint:
+                raise ValueError(f"{path} no longer holds weights {fingerprint}")
+            start = time.perf_counter()
+            backend = load_backend(path)
+            load_ms = round((time.perf_counter() - start) * 1000, 1)
+
+            with self._lock:
+                version = ModelVersion(self._next_version, path, backend, load_ms, fingerprint)
+                self._next_version += 1
+            if warm:
+                version.warm_up()
+
+            with self._lock:
+                self._publish(version)
+            self.last_error = None
+            print(f"✓ Model registry: {self.name} v{version.version} serving {path} "
+                  f"(load {load_ms}ms, warm-up {version.warmup_ms}ms)")
+            return version
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Model registry: failed to load {path} into {self.name}: {e}")
+            raise
+        finally:
+            self.loading = None
+
+    def _load_quietly(self, path, warm=True, fingerprint=None):
+        # Background loads report failures through last_error; the old model keeps serving
+        try:
+            self._load(path, warm, fingerprint)
+        except Exception:
+            pass
+
+    def _publish(self, version):
+        if self.current is not None:
+            self.history.append(self.current)
+            del self.history[:-MODEL_HISTORY]
+        self.current = version
+
+    def describe(self):
+        return {
+            "current": self.current.describe() if self.current else None,
+            "history": [v.describe() for v in self.history],
+            "loading": self.loading,
+            "last_error": self.last_error
+        }
+
+
+class ModelRegistry:
+    def __init__(self, slot_names):
+        self.slots = {name: ModelSlot(name) for name in slot_names}
+        self._watcher = None
+        self._watcher_pid = None
+        self._watch_lock = threading.Lock()
+        self._log_mtime = None
+        self._applied = {}      # slot → requested_at of the last registry_state.json entry applied
+
+    def slot(self, name):
+        if name not in self.slots:
+            raise KeyError(f"Unknown model slot: {name}")
+        return self.slots[name]
+
+    def get(self, name):
+        return self.slot(name).get()
+
+    def describe(self):
+        return {name: slot.describe() for name, slot in self.slots.items()}
+
+    # ── Retrain watcher ──
+
+    def start_watching(self):
+        """Starts the retrain_log.json watcher once per process (threads do not survive fork)."""
+        pid = os.getpid()
+        if self._watcher is not None and self._watcher_pid == pid:
+            return
+        with self._watch_lock:
+            if self._watcher is not None and self._watcher_pid == pid:
+                return
+            self._watcher_pid = pid
+            self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            try:
+                self.check_for_new_model()
+            except Exception as e:
+                print(f"Model registry watcher error: {e}")
+            time.sleep(REGISTRY_POLL_SECONDS)
+
+    def check_for_new_model(self, background=True, warm=True):
+        """
+        Applies what changed since the last poll: a new model in retrain_log.json
+        (for "civic") and requests in registry_state.json. Per slot, the newest wins.
+        """
+        log_mtime = os.path.getmtime(RETRAIN_LOG) if os.path.exists(RETRAIN_LOG) else 0
+        wanted = {}             # slot → (requested_at, path, fingerprint)
+        if log_mtime and log_mtime != self._log_mtime:
+            with open(RETRAIN_LOG) as f:
+                model_path = json.load(f).get("model_path")
+            if model_path and os.path.exists(model_path):
+                wanted["civic"] = (log_mtime, serving_path(model_path), None)
+        self._log_mtime = log_mtime
+
+        for name, entry in _read_state().items():
+            requested_at = entry.get("requested_at", 0)
+            if name not in self.slots or requested_at <= self._applied.get(name, 0):
+                continue
+            self._applied[name] = requested_at
+            if requested_at > (log_mtime if name == "civic" else 0):
+                wanted[name] = (requested_at, entry["path"], entry.get("fingerprint"))
+
+        for name, (_, path, fingerprint) in wanted.items():
+            try:
+                self.slot(name).serve(path, fingerprint, background=background, warm=warm)
+            except Exception as e:
+                print(f"Model registry: could not serve {path} in {name}: {e}")
+        return wanted or None
+
+    # ── Serving requests (shared by every worker through registry_state.json) ──
+
+    def request(self, name, path, fingerprint=None):
+        """
+        Records that slot name should serve path (fingerprint: specific weights
+        already loaded) for every worker's watcher, and applies it here now.
+        Returns: the ModelVersion now serving, or the loader thread
+        """
+        slot = self.slot(name)
+        requested_at = time.time()
+        state = _read_state()
+        state[name] = {"path": path, "fingerprint": fingerprint, "requested_at": requested_at}
+        _write_state(state)
+        self._applied[name] = requested_at
+        return slot.serve(path, fingerprint)
+
+    def reload(self, name, path=None, version=None):
+        """
+        Requests new weights for a slot: a file inside MODELS_DIR, or a version
+        number this process still holds (current or history).
+        Returns: the ModelVersion now serving, or the loader thread
+        """
+        slot = self.slot(name)
+        if version is not None:
+            loaded = slot.find(version=int(version))
+            if loaded is None:
+                raise KeyError(f"{name} has no version {version}")
+            return self.request(name, loaded.path, loaded.fingerprint)
+        return self.request(name, allowed_model_path(path))
+
+    def rollback(self, name):
+        """
+        Requests the slot's previous version (instant where it is still in memory).
+        Returns: the version now serving
+        """
+        slot = self.slot(name)
+        if not slot.history:
+            raise ValueError(f"No previous version of {name} to roll back to")
+        previous = slot.history[-1]
+        return self.request(name, previous.path, previous.fingerprint)
+
+
+def _read_state():
+    try:
+        with open(REGISTRY_STATE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_state(state):
+    # Written whole and renamed into place, so a polling worker never reads half a file
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    temp_path = f"{REGISTRY_STATE}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(temp_path, REGISTRY_STATE)
+
+
+def allowed_model_path(path):
+    """
+    Weights the API may load: an existing file inside MODELS_DIR (loading
+    unpickles it, so arbitrary paths are refused).
+    Returns: the resolved path (raises PermissionError / FileNotFoundError)
+    """
+    resolved = os.path.realpath(os.path.join(MODELS_DIR, path))
+    if os.path.commonpath([resolved, os.path.realpath(MODELS_DIR)]) != os.path.realpath(MODELS_DIR):
+        raise PermissionError(f"Model weights must be inside {MODELS_DIR}")
+    if not os.path.isfile(resolved):
+        raise FileNotFoundError(f"No model weights at {path}")
+    return resolved
+
+
+def serving_path(model_path):
+    """
+    Picks the file to serve for trained weights: the promoted INT8 export when
+    running on ONNX Runtime and it is at least as new as the weights.
+    """
+    if INFERENCE_BACKEND == "onnx" and os.path.abspath(model_path) == os.path.abspath(CIVIC_MODEL_PATH) \
+            and os.path.exists(CIVIC_INT8_MODEL_PATH) \
+            and os.path.getmtime(CIVIC_INT8_MODEL_PATH) >= os.path.getmtime(model_path):
+        return CIVIC_INT8_MODEL_PATH
+    return model_path
@@ -0,0 +1,137 @@
+"""
+Image result cache for repeated and near-duplicate uploads.
+
+Citizens often report the same pothole several times, and the same bytes reach
+more than one endpoint. Results are stored per image under its SHA-256 and
+its 64-bit perceptual hash (DCT pHash of a 32x32 grayscale thumbnail):
+  - exact match: same bytes → cached result, no decode beyond the header
+  - perceptual match: pHash within IMAGE_CACHE_MAX_HAMMING bits → cached result
+    (survives re-encoding, resizing and exposure changes). The result belongs to
+    the other image: callers keep its category but not its pixel-level fields.
+
+Entries are also keyed by the serving model version, so a hot-swapped model
+never serves results produced by its predecessor.
+
+Entries expire after IMAGE_CACHE_TTL_SECONDS; the least recently used entry is
+evicted once IMAGE_CACHE_MAX_ENTRIES is reached, which bounds memory (entries
+are small result dicts, never pixels).
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+from .image import as_decoded_image, register_stage_side
+
+IMAGE_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "2048"))
+IMAGE_CACHE_TTL_SECONDS = float(os.getenv("IMAGE_CACHE_TTL_SECONDS", "3600"))
+IMAGE_CACHE_MAX_HAMMING = int(os.getenv("IMAGE_CACHE_MAX_HAMMING", "6"))    # 0 = exact matches only
+
+# pHash is computed from this view — the same thumbnail the quality gate decodes
+HASH_MAX_SIDE = 256
+register_stage_side(HASH_MAX_SIDE)
+
+
+def content_hash(image):
+    """SHA-256 hex digest of the upload bytes (or of the pixels for in-memory images)."""
+    image = as_decoded_image(image)
+    data = image.image_bytes if image.image_bytes is not None else image.rgb.tobytes()
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image):
+    """64-bit pHash: sign of the low-frequency 8x8 DCT block against its median."""
+    gray = as_decoded_image(image).at(HASH_MAX_SIDE).gray
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    bits = low > np.median(low[1:])      # DC term excluded from the median
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class ImageResultCache:
+    """Thread-safe LRU + TTL cache of analysis results keyed by model version, SHA-256 and pHash."""
+
+    def __init__(self, max_entries=IMAGE_CACHE_MAX_ENTRIES, ttl_seconds=IMAGE_CACHE_TTL_SECONDS,
+                 max_hamming=IMAGE_CACHE_MAX_HAMMING):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_hamming = max_hamming
+        self._entries = OrderedDict()    # (version, sha256) → (phash, stored_at, result)
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "perceptual_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def lookup(self, image, version=None):
+        """
+        version: serving model version; only results stored under it can match.
+        Returns: (result or None, match "exact" | "perceptual" | None, key for store())
+        """
+        image = as_decoded_image(image)
+        digest = content_hash(image)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get((version, digest))
+            if entry is not None and self._fresh((version, digest), entry, now):
+                self._entries.move_to_end((version, digest))
+                self._stats["exact_hits"] += 1
+                return entry[2], "exact", (version, digest, entry[0])
+
+        phash = perceptual_hash(image) if self.max_hamming > 0 else None
+        if phash is not None:
+            with self._lock:
+                match = self._nearest(phash, version, now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self._stats["perceptual_hits"] += 1
+                    return self._entries[match][2], "perceptual", (version, digest, phash)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, None, (version, digest, phash)
+
+    def store(self, key, result):
+        version, digest, phash = key
+        with self._lock:
+            self._entries[(version, digest)] = (phash, time.time(), result)
+            self._entries.move_to_end((version, digest))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["exact_hits"] + self._stats["perceptual_hits"] + self._stats["misses"]
+            hits = lookups - self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+            }
+
+    # Callers hold self._lock
+
+    def _fresh(self, entry_key, entry, now):
+        if now - entry[1] <= self.ttl_seconds:
+            return True
+        del self._entries[entry_key]
+        self._stats["expired"] += 1
+        return False
+
+    def _nearest(self, phash, version, now):
+        best, best_distance = None, self.max_hamming + 1
+        for entry_key, entry in list(self._entries.items()):
+            if entry_key[0] != version or entry[0] is None or not self._fresh(entry_key, entry, now):
+                continue
+            distance = bin(entry[0] ^ phash).count("1")
+            if distance < best_distance:
+                best, best_distance = entry_key, distance
+        return best
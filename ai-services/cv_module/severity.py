@@ -1,28 +1,56 @@
+import os
+import math
 import cv2
 import numpy as np
-from PIL import Image
-import io
+from .image import DecodedImage, as_decoded_image, register_stage_side
 
-def calculate_severity(category, confidence, image_bytes=None):
+# Resolution the severity analyzers run at. They measure area ratios and
+# blob counts, which are stable well below full phone-camera resolution.
+SEVERITY_MAX_SIDE = int(os.getenv("SEVERITY_MAX_SIDE", "512"))
+register_stage_side(SEVERITY_MAX_SIDE)
+
+# "frame":  analyze the whole image
+# "region": when the detector boxed the predicted category, analyze only those
+#           boxes and use the fraction of the frame they cover as a severity signal
+SEVERITY_MODE = os.getenv("SEVERITY_MODE", "frame").lower()
+
+# ── Feature thresholds ──
+DARK_THRESHOLD   = 80                         # gray <= this counts as pothole shadow
+BRIGHT_THRESHOLD = 150                        # gray > this counts as garbage blob
+BLUE_LOWER       = np.array([90, 50, 50], dtype=np.uint8)
+BLUE_UPPER       = np.array([130, 255, 255], dtype=np.uint8)
+
+# Level cutoffs, highest level first (value > cutoff → level 5, 4, 3, 2; else 1)
+POTHOLE_DENSITY_CUTOFFS = (0.15, 0.1, 0.05, 0.02)
+GARBAGE_BLOB_CUTOFFS    = (20, 10, 5, 2)
+GARBAGE_DENSITY_CUTOFFS = (0.2, 0.1, 0.05, 0.02)
+WATER_DENSITY_CUTOFFS   = (0.2, 0.1, 0.05, 0.02)
+DARK_SCENE_BRIGHTNESS   = 0.3
+BOX_COVERAGE_CUTOFFS    = (0.4, 0.2, 0.08, 0.02)   # fraction of the frame inside boxes
+
+def calculate_severity(category, confidence, image=None, features=None, detections=None, mode=None):
+    """
+    Accepts raw image bytes or a DecodedImage (shared with classify_image).
+    features: precomputed compute_severity_features() output, skips the image pass.
+    detections: classify_image(..., return_detections=True) output, used in region mode.
+    Returns: severity (1-5)
+    """
     base_severity = 1
+    mode = mode or SEVERITY_MODE
+    boxes = region_boxes(category, detections) if mode == "region" and image else []
     
-    if image_bytes:
-        # Decode image
-        image = Image.open(io.BytesIO(image_bytes))
-        image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        
+    if boxes:
+        base_severity = analyze_region_severity(as_decoded_image(image, SEVERITY_MAX_SIDE), boxes,
+                                                _severity_lookup(category))
+    elif image or features:
         # Analyze based on category
-        category_lower = category.lower()
-        if "pothole" in category_lower:
-            base_severity = analyze_pothole_severity(image_cv)
-        elif "garbage" in category_lower or "waste" in category_lower:
-            base_severity = analyze_garbage_severity(image_cv)
-        elif "water leakage" in category_lower or "flood" in category_lower:
-            base_severity = analyze_water_severity(image_cv)
-        elif "streetlight" in category_lower or "light" in category_lower:
-            base_severity = analyze_light_severity(image_cv)
-        else:
+        level_for = _severity_lookup(category)
+        if level_for is None:
             base_severity = 2  # default
+        else:
+            if features is None:
+                features = compute_severity_features(as_decoded_image(image, SEVERITY_MAX_SIDE), category)
+            base_severity = level_for(features)
     else:
         # Fallback to old logic
         category_lower = category.lower()
@@ -43,76 +71,181 @@ def calculate_severity(category, confidence, image_bytes=None):
     
     return base_severity
 
+def _severity_lookup(category):
+    category_lower = category.lower()
+    if "pothole" in category_lower:
+        return pothole_level
+    elif "garbage" in category_lower or "waste" in category_lower:
+        return garbage_level
+    elif "water leakage" in category_lower or "flood" in category_lower:
+        return water_level
+    elif "streetlight" in category_lower or "light" in category_lower:
+        return light_level
+    return None
+
+def _gray(image):
+    # DecodedImage memoizes its grayscale view; plain BGR arrays are converted
+    if isinstance(image, DecodedImage):
+        return image.gray
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def _hsv(image):
+    if isinstance(image, DecodedImage):
+        return image.hsv
+    return cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+# ── Feature pass ──
+
+def compute_severity_features(image, category=None):
+    """
+    Severity features from a DecodedImage or BGR array: only the ones category's
+    level reads (the blob labelling runs for garbage only, the HSV conversion for
+    water only), or every category's when category is None. Whole-array masks and
+    pixel counts, no contour lists or Python loops.
+    Returns: dict with some of dark_density, bright_density, bright_blobs, blue_density, brightness
+    """
+    groups = _feature_groups(category)
+    gray, hsv = _planes(image, groups)
+    return _features(gray, hsv, groups)
+
+# Feature group → the features it produces (_LEVEL_GROUPS says which group each level reads)
+FEATURE_GROUPS = {
+    "dark":       ("dark_density",),
+    "bright":     ("bright_density", "bright_blobs"),
+    "blue":       ("blue_density",),
+    "brightness": ("brightness",)
+}
+
+def _feature_groups(category):
+    if category is None:
+        return tuple(FEATURE_GROUPS)
+    level_for = _severity_lookup(category)
+    return _LEVEL_GROUPS[level_for] if level_for else ()
+
+def _planes(image, groups):
+    # Water reads only HSV; every other group reads only grayscale
+    gray = _gray(image) if any(group != "blue" for group in groups) else None
+    hsv = _hsv(image) if "blue" in groups else None
+    return gray, hsv
+
+def _features(gray, hsv, groups=tuple(FEATURE_GROUPS)):
+    plane = gray if gray is not None else hsv
+    image_area = plane.shape[0] * plane.shape[1]
+    if image_area == 0:
+        return {key: 0 for group in groups for key in FEATURE_GROUPS[group]}
+    features = {}
+
+    # Potholes: dark pixels (the THRESH_BINARY_INV mask at DARK_THRESHOLD)
+    if "dark" in groups:
+        _, not_dark = cv2.threshold(gray, DARK_THRESHOLD, 255, cv2.THRESH_BINARY)
+        features["dark_density"] = (image_area - cv2.countNonZero(not_dark)) / image_area
+
+    # Garbage: bright blobs; label 0 is the background. Only the label count is
+    # needed — the summed blob area is the mask's pixel count, which is far
+    # cheaper than accumulating per-label stats on large images
+    if "bright" in groups:
+        _, bright = cv2.threshold(gray, BRIGHT_THRESHOLD, 255, cv2.THRESH_BINARY)
+        num_labels, _ = cv2.connectedComponents(bright, connectivity=8)
+        features["bright_density"] = cv2.countNonZero(bright) / image_area
+        features["bright_blobs"] = num_labels - 1
+
+    # Water: blue / wet areas
+    if "blue" in groups:
+        features["blue_density"] = cv2.countNonZero(cv2.inRange(hsv, BLUE_LOWER, BLUE_UPPER)) / image_area
+
+    if "brightness" in groups:
+        features["brightness"] = cv2.mean(gray)[0] / 255
+
+    return features
+
+# ── Region mode ──
+
+def region_boxes(category, detections):
+    """Detected boxes belonging to category (empty when there are none)."""
+    if not detections:
+        return []
+    return [box for box in detections.get("boxes", []) if box["category"] == category]
+
+def analyze_region_severity(image, boxes, level_for=None):
+    """
+    Severity from the detected boxes only: the category's feature level over the
+    box crops (no full-frame pass), raised to the level implied by how much of the
+    frame the boxes cover. Boxes are normalised (x1, y1, x2, y2) in 0-1.
+    Returns: severity level (1-5) before confidence adjustment
+    """
+    coverage = min(sum(box["area_ratio"] for box in boxes), 1.0)
+    coverage_level = _level(coverage, BOX_COVERAGE_CUTOFFS)
+    if level_for is None:
+        return max(2, coverage_level)
+
+    groups = _LEVEL_GROUPS[level_for]
+    gray, hsv = _planes(image, groups)
+    height, width = (gray if gray is not None else hsv).shape[:2]
+
+    crops = []
+    for box in boxes:
+        x1, y1, x2, y2 = box["box"]
+        left, top = min(int(x1 * width), width - 1), min(int(y1 * height), height - 1)
+        right, bottom = max(math.ceil(x2 * width), left + 1), max(math.ceil(y2 * height), top + 1)
+        window = (slice(top, bottom), slice(left, right))
+        crops.append(((bottom - top) * (right - left),
+                      _features(gray[window] if gray is not None else None,
+                                hsv[window] if hsv is not None else None, groups)))
+
+    return max(level_for(_merge_features(crops)), coverage_level)
+
+def _merge_features(crops):
+    # Pixel-weighted means of the per-crop densities; blob counts add up
+    total = sum(pixels for pixels, _ in crops)
+    keys = crops[0][1].keys()
+    merged = {key: sum(pixels * f[key] for pixels, f in crops) / total
+              for key in keys if key != "bright_blobs"}
+    if "bright_blobs" in keys:
+        merged["bright_blobs"] = sum(f["bright_blobs"] for _, f in crops)
+    return merged
+
+# ── Feature → level lookups ──
+
+def _level(value, cutoffs):
+    for level, cutoff in zip((5, 4, 3, 2), cutoffs):
+        if value > cutoff:
+            return level
+    return 1
+
+def pothole_level(features):
+    return _level(features["dark_density"], POTHOLE_DENSITY_CUTOFFS)
+
+def garbage_level(features):
+    return max(_level(features["bright_blobs"], GARBAGE_BLOB_CUTOFFS),
+               _level(features["bright_density"], GARBAGE_DENSITY_CUTOFFS))
+
+def water_level(features):
+    return _level(features["blue_density"], WATER_DENSITY_CUTOFFS)
+
+def light_level(features):
+    # Dark image, maybe broken light
+    return 4 if features["brightness"] < DARK_SCENE_BRIGHTNESS else 2
+
+_LEVEL_GROUPS = {
+    pothole_level: ("dark",),
+    garbage_level: ("bright",),
+    water_level:   ("blue",),
+    light_level:   ("brightness",)
+}
+
+# Per-category entry points, kept for callers that score a single category
+
 def analyze_pothole_severity(image_cv):
-    # Assume potholes are dark areas; threshold and calculate density
-    gray = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 80, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    total_area = sum(cv2.contourArea(c) for c in contours)
-    image_area = image_cv.shape[0] * image_cv.shape[1]
-    density = total_area / image_area if image_area > 0 else 0
-    
-    if density > 0.15:
-        return 5
-    elif density > 0.1:
-        return 4
-    elif density > 0.05:
-        return 3
-    elif density > 0.02:
-        return 2
-    else:
-        return 1
+    return pothole_level(compute_severity_features(image_cv, "Pothole"))
 
 def analyze_garbage_severity(image_cv):
-    # Count bright/dark blobs as garbage density
-    gray = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray, 150, 255, cv2.THRESH_BINARY)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    num_blobs = len(contours)
-    total_area = sum(cv2.contourArea(c) for c in contours)
-    image_area = image_cv.shape[0] * image_cv.shape[1]
-    density = total_area / image_area if image_area > 0 else 0
-    
-    if num_blobs > 20 or density > 0.2:
-        return 5
-    elif num_blobs > 10 or density > 0.1:
-        return 4
-    elif num_blobs > 5 or density > 0.05:
-        return 3
-    elif num_blobs > 2 or density > 0.02:
-        return 2
-    else:
-        return 1
+    return garbage_level(compute_severity_features(image_cv, "Garbage"))
 
 def analyze_water_severity(image_cv):
-    # Detect blue/wet areas (simple HSV threshold for blue)
-    hsv = cv2.cvtColor(image_cv, cv2.COLOR_BGR2HSV)
-    lower_blue = np.array([90, 50, 50])
-    upper_blue = np.array([130, 255, 255])
-    mask = cv2.inRange(hsv, lower_blue, upper_blue)
-    blue_area = cv2.countNonZero(mask)
-    image_area = image_cv.shape[0] * image_cv.shape[1]
-    density = blue_area / image_area if image_area > 0 else 0
-    
-    if density > 0.2:
-        return 5
-    elif density > 0.1:
-        return 4
-    elif density > 0.05:
-        return 3
-    elif density > 0.02:
-        return 2
-    else:
-        return 1
+    return water_level(compute_severity_features(image_cv, "Water Leakage"))
 
 def analyze_light_severity(image_cv):
-    # For lights, perhaps detect bright spots or assume based on context; simple fallback
-    gray = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
-    brightness = np.mean(gray) / 255
-    if brightness < 0.3:  # Dark image, maybe broken light
-        return 4
-    else:
-        return 2
+    return light_level(compute_severity_features(image_cv, "Streetlight"))
 
 def scale_confidence(confidence):
     # Scale 0.0-1.0 to 0-100%
@@ -0,0 +1,132 @@
+"""
+Process-pool offload for severity scoring.
+
+calculate_severity's colour conversions, masks and connected-components pass
+still serialize behind YOLO inference in the request process.
+With SEVERITY_POOL_WORKERS > 0 they run in separate processes instead. The
+parent decodes the image at severity resolution once and passes the pixels
+through shared memory (no pickling of the array); only the shared-memory name,
+shape and category cross the process boundary.
+
+score_severity() is the sync entry point, score_severity_async() the asyncio
+one. Both enforce a per-task timeout and fall back to the image-free category
+estimate if the worker does not answer in time.
+"""
+
+import os
+import asyncio
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+
+from .image import DecodedImage, as_decoded_image
+from .severity import calculate_severity, SEVERITY_MAX_SIDE
+
+SEVERITY_POOL_WORKERS = int(os.getenv("SEVERITY_POOL_WORKERS", "0"))       # 0 = run in-process
+SEVERITY_TASK_TIMEOUT = float(os.getenv("SEVERITY_TASK_TIMEOUT", "5"))     # seconds
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    """One pool per process; spawn context so workers never inherit model threads or locks."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ProcessPoolExecutor(
+                max_workers=SEVERITY_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_pid = pid
+    return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def _severity_task(shm_name, shape, dtype, category, confidence, detections):
+    """Runs in a pool worker: attach to the shared pixels and score them."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        rgb = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        severity = calculate_severity(category, confidence, DecodedImage.from_rgb(rgb), detections=detections)
+        del rgb
+        return severity
+    finally:
+        shm.close()
+
+
+def _submit(category, confidence, image, detections):
+    """
+    Copies the severity-resolution pixels into shared memory and queues the task.
+    The segment is released when the task's future completes — not when the
+    caller stops waiting, since a timed-out worker may still be reading it.
+    Returns: the task's future
+    """
+    rgb = as_decoded_image(image, SEVERITY_MAX_SIDE).rgb
+    shm = shared_memory.SharedMemory(create=True, size=rgb.nbytes)
+    try:
+        np.ndarray(rgb.shape, dtype=rgb.dtype, buffer=shm.buf)[:] = rgb
+        future = _get_pool().submit(_severity_task, shm.name, rgb.shape, rgb.dtype.str,
+                                     category, confidence, detections)
+    except BaseException:
+        _release(shm)
+        raise
+    future.add_done_callback(lambda _: _release(shm))
+    return future
+
+
+def _release(shm):
+    shm.close()
+    shm.unlink()
+
+
+def score_severity(category, confidence, image=None, detections=None, timeout=SEVERITY_TASK_TIMEOUT):
+    """
+    calculate_severity, offloaded to the severity process pool when enabled.
+    detections: classify_image(..., return_detections=True) output for region mode.
+    Returns: severity (1-5)
+    """
+    if not image or SEVERITY_POOL_WORKERS <= 0:
+        return calculate_severity(category, confidence, image, detections=detections)
+
+    try:
+        future = _submit(category, confidence, image, detections)
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        print(f"Severity task timed out after {timeout}s — using category estimate")
+        return calculate_severity(category, confidence)
+    except BrokenProcessPool:
+        _reset_pool()
+        return calculate_severity(category, confidence, image, detections=detections)
+
+
+async def score_severity_async(category, confidence, image=None, detections=None, timeout=SEVERITY_TASK_TIMEOUT):
+    """Awaitable score_severity for async request handlers."""
+    if not image or SEVERITY_POOL_WORKERS <= 0:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(calculate_severity, category, confidence, image, detections=detections))
+
+    try:
+        future = _submit(category, confidence, image, detections)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except asyncio.TimeoutError:
+        print(f"Severity task timed out after {timeout}s — using category estimate")
+        return calculate_severity(category, confidence)
+    except BrokenProcessPool:
+        _reset_pool()
+        return calculate_severity(category, confidence, image, detections=detections)
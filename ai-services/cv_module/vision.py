@@ -1,23 +1,92 @@
 import os
-import io
+import asyncio
+import threading
+from collections import Counter
 import numpy as np
-from PIL import Image
-from ultralytics import YOLO
-import google.generativeai as genai
 from dotenv import load_dotenv
+from batching import MicroBatcher
+from resources import lazy_resource
+from structured_output import generate_json, generate_json_async
+from .image import as_decoded_image, register_stage_side
+from .calibration import load_calibration, apply_temperature
+from .registry import ModelRegistry, RETRAIN_LOG, CIVIC_MODEL_PATH, serving_path
 
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-gemini_model = genai.GenerativeModel("gemini-2.5-flash")
+# Versioned, hot-swappable models:
+#   "detector" — COCO YOLO (CV_DETECTOR_WEIGHTS)
+#   "civic"    — classifier from retrain.py, picked up from retrain_log.json without a restart
+# Nothing is loaded at import time; the first request (or warm-up) loads the detector.
+DETECTOR_WEIGHTS = os.getenv("CV_DETECTOR_WEIGHTS", "yolov8n.pt")
+model_registry = ModelRegistry(["detector", "civic"])
 
-# Load YOLO model
-yolo_model = YOLO('yolov8n.pt')
+
+def preload_models():
+    """
+    Loads model weights without running inference. Used by serve.py in the
+    pre-fork master so workers share the weights copy-on-write.
+    """
+    slot = model_registry.slot("detector")
+    version = slot.get() or slot.load(DETECTOR_WEIGHTS, background=False, warm=False)
+    try:
+        if model_registry.get("civic") is None:
+            if os.path.exists(RETRAIN_LOG):
+                model_registry.check_for_new_model(background=False, warm=False)
+            elif os.path.exists(CIVIC_MODEL_PATH):
+                model_registry.slot("civic").load(serving_path(CIVIC_MODEL_PATH), background=False, warm=False)
+    except Exception as e:
+        print(f"Civic classifier not loaded: {e}")
+    return version
+
+
+def _load_models():
+    """Loads + warms up the models (dummy inference), then starts the civic model watcher."""
+    version = preload_models()
+    for loaded in (version, model_registry.get("civic")):
+        if loaded is not None and loaded.warmup_ms is None:
+            loaded.warm_up()
+    model_registry.start_watching()
+    return version
+
+
+detector_resource = lazy_resource("yolo_detector", _load_models)
+
+# Micro-batching: concurrent classify_image calls share one forward pass
+YOLO_MAX_BATCH   = int(os.getenv("YOLO_MAX_BATCH", "8"))
+YOLO_MAX_WAIT_MS = float(os.getenv("YOLO_MAX_WAIT_MS", "10"))
+
+# Resolution each model runs at (matches its default imgsz, so nothing is lost)
+YOLO_MAX_SIDE  = int(os.getenv("YOLO_MAX_SIDE", "640"))
+CIVIC_MAX_SIDE = int(os.getenv("CIVIC_MAX_SIDE", "320"))
+register_stage_side(YOLO_MAX_SIDE)
+register_stage_side(CIVIC_MAX_SIDE)
+
+# Civic classifier answers only above this calibrated top-1 probability —
+# the default for categories without a fitted threshold (see calibration.py)
+CIVIC_MIN_CONFIDENCE = float(os.getenv("CIVIC_MIN_CONFIDENCE", "0.6"))
 
 # Valid civic categories
 CIVIC_CATEGORIES = ["Pothole", "Garbage", "Streetlight", "Water Leakage", "Uncategorized"]
 
+# Gemini Vision fallback reply (structured_output schema) and its token budget
+GEMINI_VISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": CIVIC_CATEGORIES},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "reason": {"type": "string"}
+    },
+    "required": ["category", "confidence"]
+}
+GEMINI_VISION_MAX_TOKENS = 120    # category + confidence + a one-line reason
+GEMINI_VISION_PROMPT = """Which civic issue does this image show?
+- Pothole (damaged road, cracks, holes in road surface, broken asphalt)
+- Garbage (trash, waste, litter, garbage pile, dumped waste)
+- Streetlight (broken lamp post, dark street light, damaged pole)
+- Water Leakage (flooding, water pipe leak, puddle from pipe, sewage overflow)
+- Uncategorized (if none of the above are clearly visible)
+Give the category, a confidence between 0 and 1 and one short reason."""
+
 # YOLO COCO class → civic category mapping
 YOLO_TO_CATEGORY = {
     9:  "Streetlight",
@@ -25,95 +94,277 @@ YOLO_TO_CATEGORY = {
 }
 
 
-def classify_image(image_bytes):
+def _run_model_batch(items):
+    """
+    Runs queued (model_version, image) pairs, one forward pass per model version.
+    Returns: one prediction dict per item, in order
+    """
+    results = [None] * len(items)
+    groups = {}
+    for i, (version, _) in enumerate(items):
+        groups.setdefault(id(version), (version, []))[1].append(i)
+    for version, indices in groups.values():
+        predictions = version.predict([items[i][1] for i in indices])
+        for i, prediction in zip(indices, predictions):
+            results[i] = prediction
+    return results
+
+
+model_batcher = MicroBatcher(_run_model_batch, YOLO_MAX_BATCH, YOLO_MAX_WAIT_MS, name="vision")
+
+# How often each cascade tier produced the answer (per image)
+CASCADE_TIERS = ("civic", "detector", "gemini")
+_tier_counts = Counter()
+_tier_lock = threading.Lock()
+
+
+def _record_tiers(tiers):
+    with _tier_lock:
+        _tier_counts.update(tier for tier in tiers if tier)
+
+
+def cascade_stats():
+    """
+    Returns: per-tier answer counts and shares, plus the Gemini fallback rate
+    """
+    with _tier_lock:
+        counts = {tier: _tier_counts[tier] for tier in CASCADE_TIERS}
+    civic = model_registry.get("civic")
+    total = sum(counts.values())
+    return {
+        "images": total,
+        "counts": counts,
+        "rates": {tier: round(n / total, 4) if total else 0.0 for tier, n in counts.items()},
+        "gemini_fallback_rate": round(counts["gemini"] / total, 4) if total else 0.0,
+        "calibration": load_calibration(civic.fingerprint) if civic else None
+    }
+
+
+def serving_version():
+    """
+    Returns: the fingerprints of the detector and civic weights in use, e.g.
+             "detector:3fa1…/civic:-" — cached results are keyed by it
+    """
+    return "/".join(f"{name}:{loaded.fingerprint if loaded else '-'}"
+                    for name, loaded in (("detector", model_registry.get("detector")),
+                                         ("civic", model_registry.get("civic"))))
+
+
+def classify_image(image, return_detections=False):
+    """
+    Three-stage cascade (cascade_stats() counts which tier answered):
+    1. Retrained civic classifier — when one has been trained and its
+       calibrated confidence clears the category's threshold
+    2. YOLO  — fast local detection
+    3. Gemini Vision — smart fallback
+    Accepts raw image bytes or a DecodedImage.
+    return_detections=True adds the YOLO boxes (see _detections_from_result),
+    so severity can work on the detected regions instead of the whole frame.
+    Returns: (category, confidence) or (category, confidence, detections)
+    """
+    return classify_images([image], return_detections=return_detections)[0]
+
+
+def classify_images(images, executor=None, return_detections=False):
+    """
+    Batch version of classify_image for several images of one issue.
+    All images are queued to the models together so they share forward passes;
+    Gemini fallbacks for the misses run concurrently on executor if given.
+    Returns: list of (category, confidence) — or (category, confidence, detections)
+             with return_detections — in input order
+    """
+    images = [as_decoded_image(image) for image in images]
+    results, tiers, detections = _classify_locally(images)
+
+    # ── Stage 3: Gemini Vision ──
+    misses = [i for i, detected in enumerate(results) if not detected]
+    if misses:
+        print(f"YOLO didn't find a civic issue in {len(misses)} image(s) — using Gemini Vision...")
+        if executor is not None:
+            fallbacks = executor.map(_classify_with_gemini, [images[i] for i in misses])
+        else:
+            fallbacks = map(_classify_with_gemini, [images[i] for i in misses])
+        for i, detected in zip(misses, fallbacks):
+            results[i] = detected
+            tiers[i] = "gemini"
+    return _finish(results, tiers, detections, return_detections)
+
+
+async def classify_images_async(images, executor=None, return_detections=False):
     """
-    Two-stage classification:
-    1. YOLO  — fast local detection
-    2. Gemini Vision — smart fallback
-    Returns: (category, confidence)
+    Awaitable classify_images for the ASGI service. Only the local stages (civic
+    classifier, YOLO) and the JPEG encodes run on executor; the Gemini Vision
+    fallbacks are awaited together on the event loop (generate_json_async), so
+    slow Vision calls hold no executor thread.
+    Returns: same as classify_images
     """
-    image = Image.open(io.BytesIO(image_bytes))
+    loop = asyncio.get_running_loop()
+    images = [as_decoded_image(image) for image in images]
+    results, tiers, detections, requests = await loop.run_in_executor(executor, _classify_for_fallback, images)
+    if requests:
+        print(f"YOLO didn't find a civic issue in {len(requests)} image(s) — using Gemini Vision...")
+        fallbacks = await asyncio.gather(*(_classify_with_gemini_async(contents) for contents in requests.values()))
+        for i, detected in zip(requests, fallbacks):
+            results[i] = detected
+            tiers[i] = "gemini"
+    return _finish(results, tiers, detections, return_detections)
+
+
+def _classify_for_fallback(images):
+    """Executor job of classify_images_async: local stages + Gemini request contents for the misses."""
+    results, tiers, detections = _classify_locally(images)
+    requests = {i: _gemini_contents(images[i]) for i, detected in enumerate(results) if not detected}
+    return results, tiers, detections, requests
 
-    # ── Stage 1: YOLO ──
+
+def _finish(results, tiers, detections, return_detections):
+    _record_tiers(tiers)
+    if return_detections:
+        return [(category, confidence, found) for (category, confidence), found in zip(results, detections)]
+    return results
+
+
+def _classify_locally(images):
+    """
+    Stages 1-2 of the cascade (civic classifier, YOLO) for DecodedImages.
+    Returns: (results — (category, confidence) or None where both missed, tiers, detections)
+    """
     try:
-        results = yolo_model(image)
-        if results and len(results) > 0:
-            result = results[0]
-            if result.boxes and len(result.boxes) > 0:
-                boxes = result.boxes
-                max_conf_idx = int(np.argmax(boxes.conf.cpu().numpy()))
-                class_id = int(boxes.cls[max_conf_idx].cpu().numpy())
-                confidence = float(boxes.conf[max_conf_idx].cpu().numpy())
-                category = YOLO_TO_CATEGORY.get(class_id)
-                if category:
-                    print(f"✓ YOLO detected: {category} ({confidence:.2f})")
-                    return category, confidence
+        detector_resource.get()
+        model_registry.start_watching()
     except Exception as e:
         print(f"YOLO error: {e}")
+    results = [None] * len(images)
+    tiers = [None] * len(images)
+    detections = [_detections_from_result(None) for _ in images]
 
-    # ── Stage 2: Gemini Vision ──
-    print("YOLO didn't find a civic issue — using Gemini Vision...")
-    return _classify_with_gemini(image_bytes)
+    # Pin model versions for this request — a hot-swap mid-request does not affect it
+    civic = model_registry.get("civic")
+    detector = model_registry.get("detector")
 
+    # ── Stage 1: retrained civic classifier ──
+    if civic is not None:
+        calibration = load_calibration(civic.fingerprint)
+        futures = model_batcher.submit_many([(civic, image.at(CIVIC_MAX_SIDE).pil) for image in images])
+        for i, future in enumerate(futures):
+            try:
+                results[i] = _category_from_probs(future.result(), civic.backend.names, calibration)
+                tiers[i] = "civic" if results[i] else None
+            except Exception as e:
+                print(f"Civic classifier error: {e}")
 
-def _classify_with_gemini(image_bytes):
+    # ── Stage 2: YOLO ──
+    pending = [i for i, detected in enumerate(results) if not detected]
+    if pending and detector is not None:
+        futures = model_batcher.submit_many([(detector, images[i].at(YOLO_MAX_SIDE).pil) for i in pending])
+        for i, future in zip(pending, futures):
+            try:
+                prediction = future.result()
+                results[i] = _category_from_result(prediction)
+                tiers[i] = "detector" if results[i] else None
+                detections[i] = _detections_from_result(prediction, images[i].at(YOLO_MAX_SIDE).size)
+            except Exception as e:
+                print(f"YOLO error: {e}")
+    return results, tiers, detections
+
+
+def _category_from_probs(prediction, names, calibration=None):
     """
-    Uses Gemini Vision to identify civic issues.
-    Sends image as raw bytes with correct mime type.
+    Maps the civic classifier's calibrated top-1 class to a category.
+    Returns: (category, confidence) or None if below the category's threshold
     """
-    try:
-        # Convert to RGB PIL image
-        image = Image.open(io.BytesIO(image_bytes))
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-
-        # Save as JPEG bytes (Gemini handles JPEG best)
-        jpeg_buffer = io.BytesIO()
-        image.save(jpeg_buffer, format="JPEG", quality=85)
-        jpeg_bytes = jpeg_buffer.getvalue()
-
-        # Send as inline image data — correct format for google-generativeai
-        image_part = {
-            "mime_type": "image/jpeg",
-            "data": jpeg_bytes
-        }
-
-        prompt = """You are a smart city issue detection system.
-Look at this image carefully and identify if it contains any of these civic issues:
-- Pothole (damaged road, cracks, holes in road surface, broken asphalt)
-- Garbage (trash, waste, litter, garbage pile, dumped waste)
-- Streetlight (broken lamp post, dark street light, damaged pole)
-- Water Leakage (flooding, water pipe leak, puddle from pipe, sewage overflow)
-- Uncategorized (if none of the above are clearly visible)
+    calibration = calibration or {"temperature": 1.0, "thresholds": {}}
+    probs = apply_temperature(prediction["probs"], calibration["temperature"])
+    class_id = int(np.argmax(probs))
+    confidence = float(probs[class_id])
+    category = names.get(class_id)
+    threshold = calibration["thresholds"].get(category, CIVIC_MIN_CONFIDENCE)
+    if category in CIVIC_CATEGORIES and confidence >= threshold:
+        print(f"✓ Civic classifier: {category} ({confidence:.2f} ≥ {threshold})")
+        return category, confidence
+    return None
 
-Reply in this EXACT format only:
-CATEGORY: <one of the 5 categories above>
-CONFIDENCE: <number between 0 and 1>
-REASON: <one short sentence>
 
-Nothing else."""
+def _category_from_result(result):
+    """
+    Maps the highest-confidence YOLO box (backend prediction dict) to a civic category.
+    Returns: (category, confidence) or None if nothing civic was detected
+    """
+    if len(result["confidences"]) > 0:
+        max_conf_idx = int(np.argmax(result["confidences"]))
+        class_id = int(result["class_ids"][max_conf_idx])
+        confidence = float(result["confidences"][max_conf_idx])
+        category = YOLO_TO_CATEGORY.get(class_id)
+        if category:
+            print(f"✓ YOLO detected: {category} ({confidence:.2f})")
+            return category, confidence
+    return None
+
+
+def _detections_from_result(result, size=None):
+    """
+    Civic-relevant YOLO boxes from a backend prediction dict. Boxes are normalised
+    (x1, y1, x2, y2) in 0-1, so they apply to any resolution view of the image.
+    Returns: {"boxes": [{category, confidence, box, area_ratio}], "counts": {category: n}}
+    """
+    boxes = []
+    if result is not None and len(result["confidences"]) > 0:
+        width, height = size
+        for class_id, confidence, box in zip(result["class_ids"], result["confidences"], result["boxes"]):
+            category = YOLO_TO_CATEGORY.get(int(class_id))
+            if not category:
+                continue
+            x1, x2 = (min(max(float(v) / width, 0.0), 1.0) for v in (box[0], box[2]))
+            y1, y2 = (min(max(float(v) / height, 0.0), 1.0) for v in (box[1], box[3]))
+            boxes.append({
+                "category": category,
+                "confidence": round(float(confidence), 4),
+                "box": [round(x1, 4), round(y1, 4), round(x2, 4), round(y2, 4)],
+                "area_ratio": round((x2 - x1) * (y2 - y1), 4)
+            })
+    return {"boxes": boxes, "counts": dict(Counter(box["category"] for box in boxes))}
+
 
-        response = gemini_model.generate_content([prompt, image_part])
-        result = response.text.strip()
-        print(f"Gemini Vision response:\n{result}")
+def _gemini_contents(image):
+    """
+    Gemini Vision request contents: the prompt and the image as inline JPEG data.
+    Returns: contents list, or None if the image could not be encoded
+    """
+    try:
+        # Downscaled JPEG within the upload byte budget (Gemini handles JPEG best) — memoized on the image
+        jpeg_bytes = as_decoded_image(image).upload_jpeg()
+    except Exception as e:
+        print(f"Gemini Vision error: {e}")
+        return None
+    # Send as inline image data — correct format for google-generativeai
+    return [GEMINI_VISION_PROMPT, {"mime_type": "image/jpeg", "data": jpeg_bytes}]
 
-        category = "Uncategorized"
-        confidence = 0.5
 
-        for line in result.split("\n"):
-            line = line.strip()
-            if line.startswith("CATEGORY:"):
-                cat = line.replace("CATEGORY:", "").strip()
-                if cat in CIVIC_CATEGORIES:
-                    category = cat
-            elif line.startswith("CONFIDENCE:"):
-                try:
-                    confidence = float(line.replace("CONFIDENCE:", "").strip())
-                except ValueError:
-                    confidence = 0.5
+def _classify_with_gemini(image):
+    """
+    Uses Gemini Vision to identify civic issues.
+    Sends image as raw bytes with correct mime type.
+    """
+    contents = _gemini_contents(image)
+    if contents is None:
+        return "Uncategorized", 0.0
+    try:
+        reply = generate_json(contents, GEMINI_VISION_SCHEMA, GEMINI_VISION_MAX_TOKENS)
+    except Exception as e:
+        print(f"Gemini Vision error: {e}")
+        return "Uncategorized", 0.0
+    print(f"Gemini Vision response: {reply}")
+    return reply["category"], round(reply["confidence"], 4)
 
-        return category, round(confidence, 4)
 
+async def _classify_with_gemini_async(contents):
+    """Awaitable _classify_with_gemini for prepared _gemini_contents()."""
+    if contents is None:
+        return "Uncategorized", 0.0
+    try:
+        reply = await generate_json_async(contents, GEMINI_VISION_SCHEMA, GEMINI_VISION_MAX_TOKENS)
     except Exception as e:
         print(f"Gemini Vision error: {e}")
-        return "Uncategorized", 0.0
\ No newline at end of file
+        return "Uncategorized", 0.0
+    print(f"Gemini Vision response: {reply}")
+    return reply["category"], round(reply["confidence"], 4)
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""
+export_model.py - Export a vision model for CPU serving and verify it.
+
+Exports ultralytics weights (yolov8n.pt, models/civic_latest.pt, ...) to ONNX,
+then checks the exported model against PyTorch on sample images:
+  - parity: same top class, confidence / probability deltas, box IoU
+  - latency: p50 / p95 per image for each backend
+
+Usage:
+    python export_model.py                         # yolov8n.pt vs onnx
+    python export_model.py models/civic_latest.pt  # retrained classifier
+    python export_model.py yolov8n.pt openvino     # compare against OpenVINO
+"""
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from PIL import Image
+
+from cv_module.backends import export_onnx, load_backend
+
+# ── Config ──────────────────────────────────────────
+SAMPLE_DIRS     = [
+    os.path.join(os.path.dirname(__file__), "test_images"),
+    os.path.join(os.path.dirname(__file__), "training_data"),
+]
+MAX_SAMPLES     = 32
+LATENCY_RUNS    = 20
+CONF_TOLERANCE  = 0.02    # max allowed |Δconfidence| / |Δprob| for the top prediction
+MIN_BOX_IOU     = 0.9
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# ── Helpers ─────────────────────────────────────────
+
+def list_images(root):
+    """Returns [(path, category)] for every image under root/<category>/."""
+    samples = []
+    if not os.path.isdir(root):
+        return samples
+    for category in sorted(os.listdir(root)):
+        cat_dir = os.path.join(root, category)
+        if os.path.isdir(cat_dir):
+            for f in sorted(os.listdir(cat_dir)):
+                if f.lower().endswith(IMAGE_EXTENSIONS):
+                    samples.append((os.path.join(cat_dir, f), category))
+    return samples
+
+
+def load_sample_images(limit=MAX_SAMPLES):
+    """Collects up to limit RGB images from test_images/ and training_data/."""
+    images = []
+    for sample_dir in SAMPLE_DIRS:
+        for root, _, files in os.walk(sample_dir):
+            for f in sorted(files):
+                if f.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append(Image.open(os.path.join(root, f)).convert("RGB"))
+                    if len(images) >= limit:
+                        return images
+    return images
+
+
+def _box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _top(prediction):
+    """(class_id, confidence, box) of the strongest prediction, or None."""
+    if "probs" in prediction:
+        idx = int(np.argmax(prediction["probs"]))
+        return idx, float(prediction["probs"][idx]), None
+    if len(prediction["confidences"]) == 0:
+        return None
+    idx = int(np.argmax(prediction["confidences"]))
+    return int(prediction["class_ids"][idx]), float(prediction["confidences"][idx]), prediction["boxes"][idx]
+
+
+def check_parity(reference, candidate, images):
+    """
+    Compares candidate backend predictions to the reference (PyTorch) per image.
+    Returns: dict with agreement rate, worst confidence delta, worst box IoU, pass flag
+    """
+    agree = 0
+    max_conf_delta = 0.0
+    min_iou = 1.0
+    for image in images:
+        ref = _top(reference.predict([image])[0])
+        cand = _top(candidate.predict([image])[0])
+        if ref is None or cand is None:
+            agree += ref is None and cand is None
+            continue
+        if ref[0] == cand[0]:
+            agree += 1
+            max_conf_delta = max(max_conf_delta, abs(ref[1] - cand[1]))
+            if ref[2] is not None:
+                min_iou = min(min_iou, _box_iou(ref[2], cand[2]))
+
+    agreement = agree / len(images) if images else 0.0
+    return {
+        "images": len(images),
+        "top1_agreement": round(agreement, 4),
+        "max_confidence_delta": round(max_conf_delta, 4),
+        "min_box_iou": round(min_iou, 4),
+        "passed": agreement == 1.0 and max_conf_delta <= CONF_TOLERANCE and min_iou >= MIN_BOX_IOU
+    }
+
+
+def measure_latency(backend, images, runs=LATENCY_RUNS):
+    """Single-image latency over runs passes after one warm-up. Returns: p50/p95 in ms."""
+    backend.predict(images[:1])
+    timings = []
+    for i in range(runs):
+        image = images[i % len(images)]
+        start = time.perf_counter()
+        backend.predict([image])
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(timings, 50)), 2),
+        "p95_ms": round(float(np.percentile(timings, 95)), 2)
+    }
+
+
+# ── Main entry point ─────────────────────────────────
+
+def export_and_verify(weights, kind="onnx"):
+    """
+    Exports weights to ONNX and compares the kind backend against PyTorch.
+    Returns: report dict
+    """
+    onnx_path = export_onnx(weights, force=True)
+    images = load_sample_images()
+    if not images:
+        raise RuntimeError("No sample images found for parity check")
+
+    reference = load_backend(weights, "torch")
+    candidate = load_backend(onnx_path, kind)
+
+    report = {
+        "weights": weights,
+        "exported": onnx_path,
+        "task": reference.task,
+        "backend": kind,
+        "parity": check_parity(reference, candidate, images),
+        "latency": {
+            "torch": measure_latency(reference, images),
+            kind: measure_latency(candidate, images)
+        }
+    }
+    speedup = report["latency"]["torch"]["p50_ms"] / max(report["latency"][kind]["p50_ms"], 1e-6)
+    report["latency"]["p50_speedup"] = round(speedup, 2)
+    return report
+
+
+if __name__ == "__main__":
+    weights = sys.argv[1] if len(sys.argv) > 1 else "yolov8n.pt"
+    kind = sys.argv[2] if len(sys.argv) > 2 else "onnx"
+    result = export_and_verify(weights, kind)
+    print("\nResult:", json.dumps(result, indent=2, default=str))
+    sys.exit(0 if result["parity"]["passed"] else 1)
@@ -0,0 +1,182 @@
+"""
+gemini_client.py - Shared, lazily configured Gemini client.
+
+cv_module, nlp_module and the RAG endpoints all get their GenerativeModel from
+here. Nothing is imported or configured until the first call, and each model
+name is built once per process and reused across requests.
+
+generate_content() adds single-flight coalescing: concurrent callers sending
+the same prompt (same model, contents and options) wait on one outstanding
+API call and share its response or its exception.
+
+generate_content_async() is the non-blocking counterpart for the ASGI
+service: it awaits the client's async API, coalesces identical calls within
+the event loop, and holds at most GEMINI_MAX_CONCURRENCY calls in flight per
+event loop (the rest wait on a semaphore instead of opening more streams).
+The API call runs as its own task that every caller awaits through a shield,
+so cancelling any one caller (the first included) never cancels the others.
+"""
+
+import os
+import asyncio
+import functools
+import hashlib
+import threading
+import weakref
+from concurrent.futures import Future
+from dotenv import load_dotenv
+from resources import lazy_resource
+
+load_dotenv()
+
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Schema-constrained replies (structured_output); set to gemini-2.5-flash-lite to
+# opt into a model that does not think by default
+STRUCTURED_MODEL = os.getenv("GEMINI_STRUCTURED_MODEL", DEFAULT_MODEL)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "256"))
+
+
+def _configure():
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai
+
+
+_genai = lazy_resource("gemini", _configure)
+
+
+def _model_resource(name, required=False):
+    return lazy_resource(f"gemini:{name}", lambda: _genai.get().GenerativeModel(name), required=required)
+
+
+# Registered up front so warm_up() builds the models before traffic
+_model_resource(DEFAULT_MODEL, required=True)
+_model_resource(STRUCTURED_MODEL, required=True)
+
+
+def get_model(name=DEFAULT_MODEL):
+    """Returns: the shared GenerativeModel for name (built on first use)."""
+    return _model_resource(name).get()
+
+
+# ── Single-flight ──
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_flight_stats = {"calls": 0, "coalesced": 0}
+
+
+def _feed(digest, part):
+    # Stable fingerprint of prompt contents: text, inline image parts, option dicts
+    if isinstance(part, (bytes, bytearray, memoryview)):
+        digest.update(b"b:")
+        digest.update(part)
+    elif isinstance(part, dict):
+        digest.update(b"{")
+        for key in sorted(part, key=str):
+            digest.update(str(key).encode("utf-8") + b"=")
+            _feed(digest, part[key])
+        digest.update(b"}")
+    elif isinstance(part, (list, tuple)):
+        digest.update(b"[")
+        for item in part:
+            _feed(digest, item)
+            digest.update(b",")
+        digest.update(b"]")
+    else:
+        digest.update(repr(part).encode("utf-8"))
+
+
+def prompt_fingerprint(contents, model_name=DEFAULT_MODEL, **kwargs):
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    _feed(digest, contents)
+    _feed(digest, kwargs)
+    return digest.hexdigest()
+
+
+def generate_content(contents, model_name=DEFAULT_MODEL, **kwargs):
+    """
+    model.generate_content(contents, **kwargs), coalesced with any identical call
+    already in flight in this process.
+    Returns: the Gemini response (shared between coalesced callers — treat as read-only)
+    """
+    key = prompt_fingerprint(contents, model_name, **kwargs)
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = Future()
+            _flight_stats["calls"] += 1
+        else:
+            _flight_stats["coalesced"] += 1
+
+    if not leader:
+        return flight.result()
+
+    try:
+        response = get_model(model_name).generate_content(contents, **kwargs)
+        flight.set_result(response)
+        return response
+    except BaseException as e:
+        flight.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+# ── Async (one state per event loop: asyncio futures and semaphores are loop-bound) ──
+
+_loop_states = weakref.WeakKeyDictionary()
+
+
+def _loop_state():
+    loop = asyncio.get_running_loop()
+    state = _loop_states.get(loop)
+    if state is None:
+        state = _loop_states[loop] = {"in_flight": {}, "semaphore": asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)}
+    return state
+
+
+async def _call_async(semaphore, contents, model_name, kwargs):
+    async with semaphore:
+        return await get_model(model_name).generate_content_async(contents, **kwargs)
+
+
+def _landed(in_flight, key, flight):
+    # Done-callback of a shared call: retire it, and retrieve its exception so a
+    # call whose callers were all cancelled logs no "never retrieved" warning
+    if in_flight.get(key) is flight:
+        del in_flight[key]
+    if not flight.cancelled():
+        flight.exception()
+
+
+async def generate_content_async(contents, model_name=DEFAULT_MODEL, **kwargs):
+    """
+    await model.generate_content_async(contents, **kwargs), coalesced with any
+    identical call in flight on this event loop and bounded by GEMINI_MAX_CONCURRENCY.
+    The call is a task of its own: a cancelled caller stops waiting, while the
+    call finishes for everyone else waiting on it.
+    Returns: the Gemini response (shared between coalesced callers — treat as read-only)
+    """
+    state = _loop_state()
+    key = prompt_fingerprint(contents, model_name, **kwargs)
+    flight = state["in_flight"].get(key)
+    if flight is None:
+        flight = state["in_flight"][key] = asyncio.ensure_future(
+            _call_async(state["semaphore"], contents, model_name, kwargs))
+        flight.add_done_callback(functools.partial(_landed, state["in_flight"], key))
+        with _in_flight_lock:
+            _flight_stats["calls"] += 1
+    else:
+        with _in_flight_lock:
+            _flight_stats["coalesced"] += 1
+    return await asyncio.shield(flight)
+
+
+def single_flight_stats():
+    """Returns: API calls made, callers served by another caller's call, calls in flight now"""
+    with _in_flight_lock:
+        in_flight = len(_in_flight) + sum(len(state["in_flight"]) for state in list(_loop_states.values()))
+        return {**_flight_stats, "in_flight": in_flight}
@@ -0,0 +1,239 @@
+"""
+llm_cache.py - Two-tier cache for Gemini text responses.
+
+The nlp_module functions send the same complaint text to Gemini again and
+again (the backend analyzes a description it already sent for /rag-describe,
+and templated complaints repeat). Responses are cached under
+(function, prompt version, model name, normalized text):
+
+  - memory tier: per-process LRU (LLM_CACHE_MEMORY_ENTRIES)
+  - disk tier:   SQLite file shared by all workers, survives restarts
+                 (LLM_CACHE_PATH, pruned to LLM_CACHE_MAX_ROWS)
+
+Both tiers expire entries after LLM_CACHE_TTL_SECONDS. Only successful
+responses are stored — a Gemini error (or, for cached_generate_json, a reply
+that fails schema validation) raises before anything is cached.
+Bump the prompt version in nlp.py whenever a prompt changes.
+"""
+
+import os
+import re
+import time
+import asyncio
+import functools
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from gemini_client import DEFAULT_MODEL, STRUCTURED_MODEL, generate_content
+from structured_output import generate_json, generate_json_async
+
+# ── Config ──────────────────────────────────────────
+LLM_CACHE_ENABLED        = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH           = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "llm_cache.sqlite3"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+LLM_CACHE_MAX_ROWS       = int(os.getenv("LLM_CACHE_MAX_ROWS", "50000"))
+LLM_CACHE_TTL_SECONDS    = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+PRUNE_EVERY_WRITES       = 200
+
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of the input, so trivial variants share an entry."""
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def cache_key(namespace, text, prompt_version, model_name=DEFAULT_MODEL):
+    payload = json.dumps([namespace, str(prompt_version), model_name, normalize_text(text)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    self._lock only guards the memory LRU and the counters; the disk tier runs
+    outside it on a per-thread SQLite connection (WAL lets readers and the
+    writer proceed concurrently), so a slow disk never stalls memory hits.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, memory_entries=LLM_CACHE_MEMORY_ENTRIES,
+                 max_rows=LLM_CACHE_MAX_ROWS, ttl_seconds=LLM_CACHE_TTL_SECONDS):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()     # key → (value, stored_at)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # .conn, .pid — one connection per thread
+        self._writes = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0,
+                       "evictions": 0, "disk_errors": 0}
+
+    # ── Public API ──
+
+    def get(self, key):
+        """Returns: the cached value, or None on a miss / expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        row = self._disk("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,), fetch=True)
+        if row and now - row[1] <= self.ttl_seconds:
+            self._disk("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            with self._lock:
+                self._remember(key, row[0], row[1])
+                self._stats["disk_hits"] += 1
+            return row[0]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._stats["writes"] += 1
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY_WRITES == 0
+        self._disk("INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                   (key, value, now, now))
+        if prune:
+            self._prune(now)
+
+    def stats(self):
+        rows = self._disk("SELECT COUNT(*) FROM llm_cache", fetch=True)
+        with self._lock:
+            lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "memory_entries": len(self._memory),
+                "disk_entries": rows[0] if rows else None,
+                "hit_rate": round((lookups - self._stats["misses"]) / lookups, 4) if lookups else 0.0
+            }
+
+    # ── Internals ──
+
+    def _remember(self, key, value, stored_at):
+        # Caller holds self._lock
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self):
+        # One connection per thread, reopened after a fork (connections must not cross it)
+        pid = os.getpid()
+        if getattr(self._local, "conn", None) is None or self._local.pid != pid:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                                key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                                created_at REAL NOT NULL, accessed_at REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+            conn.commit()
+            self._local.conn, self._local.pid = conn, pid
+        return self._local.conn
+
+    def _disk(self, sql, params=(), fetch=False):
+        """
+        Runs one statement; disk problems degrade to memory-only caching.
+        Returns: the fetched row with fetch=True, else the changed row count (None on error)
+        """
+        if not self.path:
+            return None
+        try:
+            conn = self._connection()
+            cursor = conn.execute(sql, params)
+            if fetch:
+                return cursor.fetchone()
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            with self._lock:
+                self._stats["disk_errors"] += 1
+            print(f"LLM cache disk error: {e}")
+        return None
+
+    def _prune(self, now):
+        """Drops expired rows, then the least recently used beyond max_rows."""
+        expired = self._disk("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        evicted = self._disk("""DELETE FROM llm_cache WHERE key IN (
+                                    SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)""",
+                             (self.max_rows,))
+        with self._lock:
+            self._stats["evictions"] += (expired or 0) + (evicted or 0)
+
+
+llm_cache = LLMCache()
+
+
+def cached_generate(namespace, text, prompt, prompt_version, model_name=DEFAULT_MODEL):
+    """
+    generate_content(prompt).text through the cache. text is what the prompt was
+    built from (the cache key); prompt is what Gemini actually receives.
+    Returns: response text (exceptions from Gemini propagate, nothing is cached)
+    """
+    if not LLM_CACHE_ENABLED:
+        return generate_content(prompt, model_name).text
+
+    key = cache_key(namespace, text, prompt_version, model_name)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return cached
+
+    response_text = generate_content(prompt, model_name).text
+    llm_cache.set(key, response_text)
+    return response_text
+
+
+def cached_generate_json(namespace, text, contents, schema, prompt_version, max_output_tokens,
+                         model_name=STRUCTURED_MODEL):
+    """
+    structured_output.generate_json through the cache. Only replies that passed
+    schema validation are stored.
+    Returns: the validated reply (StructuredOutputError / Gemini errors propagate)
+    """
+    cached = cached_value(namespace, text, prompt_version, model_name)
+    if cached is not None:
+        return json.loads(cached)
+    value = generate_json(contents, schema, max_output_tokens, model_name)
+    store_value(namespace, text, json.dumps(value), prompt_version, model_name)
+    return value
+
+
+async def cache_io_async(fn, *args):
+    """Runs a cache call on the loop's default executor, so SQLite I/O never blocks the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+
+async def cached_generate_json_async(namespace, text, contents, schema, prompt_version, max_output_tokens,
+                                     model_name=STRUCTURED_MODEL):
+    """Awaitable cached_generate_json; cache lookups and stores run off the event loop."""
+    cached = await cache_io_async(cached_value, namespace, text, prompt_version, model_name)
+    if cached is not None:
+        return json.loads(cached)
+    value = await generate_json_async(contents, schema, max_output_tokens, model_name)
+    await cache_io_async(store_value, namespace, text, json.dumps(value), prompt_version, model_name)
+    return value
+
+
+def cached_value(namespace, text, prompt_version, model_name=DEFAULT_MODEL):
+    """
+    Per-item lookup for callers that batch several texts into one Gemini call.
+    Returns: the stored value, or None (also when caching is disabled)
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+    return llm_cache.get(cache_key(namespace, text, prompt_version, model_name))
+
+
+def store_value(namespace, text, value, prompt_version, model_name=DEFAULT_MODEL):
+    """Counterpart of cached_value(): stores one item's answer."""
+    if LLM_CACHE_ENABLED:
+        llm_cache.set(cache_key(namespace, text, prompt_version, model_name), value)
@@ -4,13 +4,34 @@ from .nlp import (
     summarize_text,
     detect_urgency,
     analyze_text_comprehensive,
+    analyze_texts_comprehensive,
+    analyze_texts,
+    text_batcher,
     generate_description
 )
+from .descriptions import pick_description, description_pool
+from .nlp_async import (
+    analyze_text_comprehensive_async,
+    analyze_texts_comprehensive_async,
+    classify_text_async,
+    summarize_text_async,
+    async_text_batcher
+)
 
 __all__ = [
     'classify_text',
     'summarize_text', 
     'detect_urgency',
     'analyze_text_comprehensive',
-    'generate_description'
+    'analyze_texts_comprehensive',
+    'analyze_texts',
+    'text_batcher',
+    'generate_description',
+    'pick_description',
+    'description_pool',
+    'analyze_text_comprehensive_async',
+    'analyze_texts_comprehensive_async',
+    'classify_text_async',
+    'summarize_text_async',
+    'async_text_batcher'
 ]
@@ -0,0 +1,111 @@
+"""
+Precomputed civic descriptions per issue category.
+
+generate_description() depends only on the category, so the image endpoints
+pick from a pool of Gemini-written variants instead of making a live call per
+upload. The pool is filled in a background thread at warm-up and refreshed
+every DESCRIPTION_REFRESH_SECONDS; until a category has variants (or if Gemini
+is unavailable) pick_description() returns the template sentence.
+"""
+
+import os
+import time
+import random
+import threading
+
+from structured_output import generate_json
+from resources import lazy_resource
+from .nlp import ISSUE_CATEGORIES
+
+DESCRIPTION_VARIANTS         = int(os.getenv("DESCRIPTION_VARIANTS", "5"))
+DESCRIPTION_REFRESH_SECONDS  = float(os.getenv("DESCRIPTION_REFRESH_SECONDS", str(6 * 3600)))
+DESCRIPTION_RETRY_SECONDS    = 60      # after a failed refresh
+VARIANT_MAX_TOKENS           = 80      # reply budget per sentence
+
+
+def template_description(category):
+    """The fixed sentence generate_description falls back to."""
+    if not category or category == "Uncategorized":
+        return "A civic issue has been reported and requires attention."
+    return f"A {category} issue has been reported and requires immediate attention."
+
+
+def _generate_variants(category, count=DESCRIPTION_VARIANTS):
+    """One schema-constrained Gemini call for count distinct description sentences. Returns: list of str"""
+    prompt = f"""Write {count} different short factual civic report sentences (max 40 words each) about a {category} issue
+reported in a city, in formal language suitable for a municipal complaint system."""
+
+    schema = {"type": "array", "items": {"type": "string"}, "min_items": 1, "max_items": count}
+    return [line.strip('"').strip("'") for line in generate_json(prompt, schema, VARIANT_MAX_TOKENS * count)]
+
+
+class DescriptionPool:
+    def __init__(self, categories=ISSUE_CATEGORIES):
+        self.categories = [c for c in categories if c != "Uncategorized"]
+        self.pool = {}                 # category → tuple of variants (replaced whole, never mutated)
+        self.refreshed_at = None
+        self.last_error = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def pick(self, category):
+        """O(1): a random pooled variant, or the template sentence."""
+        variants = self.pool.get(category)
+        if not variants:
+            return template_description(category)
+        return random.choice(variants)
+
+    def refresh(self):
+        """Regenerates every category's variants; categories that fail keep their old ones."""
+        failures = 0
+        for category in self.categories:
+            try:
+                variants = _generate_variants(category)
+                if variants:
+                    self.pool[category] = tuple(variants)
+            except Exception as e:
+                failures += 1
+                self.last_error = str(e)
+                print(f"Description pool: {category} refresh failed: {e}")
+        self.refreshed_at = time.time()
+        print(f"✓ Description pool refreshed ({len(self.pool)}/{len(self.categories)} categories)")
+        return failures == 0
+
+    def start(self):
+        """Starts the refresh loop once per process (threads do not survive fork)."""
+        pid = os.getpid()
+        with self._lock:
+            if self._thread is not None and self._thread_pid == pid:
+                return self
+            self._thread_pid = pid
+            self._thread = threading.Thread(target=self._run, name="description-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            ok = self.refresh()
+            time.sleep(DESCRIPTION_REFRESH_SECONDS if ok else DESCRIPTION_RETRY_SECONDS)
+
+    def describe(self):
+        return {
+            "categories": {category: len(variants) for category, variants in self.pool.items()},
+            "refreshed_at": self.refreshed_at,
+            "last_error": self.last_error
+        }
+
+
+description_pool = DescriptionPool()
+
+# Started by resources.warm_up() (or the first pick); not required for readiness
+_pool_resource = lazy_resource("description_pool", description_pool.start, required=False)
+
+
+def pick_description(category):
+    """
+    Description for a detected category without a live Gemini call.
+    Returns: description (string)
+    """
+    _pool_resource.get()
+    return description_pool.pick(category)
@@ -1,12 +1,18 @@
 import os
-import google.generativeai as genai
+import json
 from dotenv import load_dotenv
+from batching import MicroBatcher
+from gemini_client import STRUCTURED_MODEL, generate_content
+from llm_cache import cached_generate_json, cached_value, store_value
+from structured_output import StructuredOutputError, json_config, response_text, validate
 
 load_dotenv()
 
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel("gemini-2.5-flash")
+# Concurrent classify_text / analyze_text_comprehensive calls are gathered into one
+# numbered multi-item prompt per batch; several batches may be in flight at once
+TEXT_BATCH_MAX_ITEMS   = int(os.getenv("TEXT_BATCH_MAX_ITEMS", "16"))
+TEXT_BATCH_MAX_WAIT_MS = float(os.getenv("TEXT_BATCH_MAX_WAIT_MS", "15"))
+TEXT_BATCH_WORKERS     = int(os.getenv("TEXT_BATCH_WORKERS", "4"))
 
 # Issue categories
 ISSUE_CATEGORIES = [
@@ -20,6 +26,35 @@ ISSUE_CATEGORIES = [
     "Uncategorized"
 ]
 
+# Bump a function's version whenever its prompt changes — old cached responses stop matching
+PROMPT_VERSIONS = {
+    "text_analysis": 2,
+    "summarize_text": 2,
+    "generate_description": 2,
+    "analyze_text_comprehensive": 2
+}
+
+# Response schemas (structured_output) and reply token budgets
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ISSUE_CATEGORIES},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "summary": {"type": "string"}
+    },
+    "required": ["category", "confidence", "summary"]
+}
+BATCH_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {"id": {"type": "integer"}, **ANALYSIS_SCHEMA["properties"]},
+    "required": ["id", *ANALYSIS_SCHEMA["required"]]
+}
+SUMMARY_SCHEMA = {"type": "object", "properties": {"summary": {"type": "string"}}, "required": ["summary"]}
+DESCRIPTION_SCHEMA = {"type": "object", "properties": {"description": {"type": "string"}}, "required": ["description"]}
+
+ANALYSIS_MAX_TOKENS = 120     # per complaint: category, confidence, ≤40-word summary
+SENTENCE_MAX_TOKENS = 100
+
 # Urgency keywords — kept local, no API needed
 URGENCY_KEYWORDS = {
     5: ["sparking", "fire", "explosion", "danger", "critical", "emergency", "blocking road", "accident", "injury", "dangerous"],
@@ -33,47 +68,17 @@ URGENCY_KEYWORDS = {
 def classify_text(text):
     """
     Classify complaint text into issue categories using Gemini.
+    Concurrent callers share batched calls (see analyze_texts).
     Returns: (category, confidence)
     """
     if not text or len(text.strip()) < 3:
         return "Uncategorized", 0.0
 
-    try:
-        prompt = f"""You are a smart city issue classifier.
-Classify the following complaint into exactly ONE of these categories:
-{', '.join(ISSUE_CATEGORIES)}
-
-Complaint: "{text}"
-
-Reply in this EXACT format only:
-CATEGORY: <category name>
-CONFIDENCE: <number between 0 and 1>
-
-Nothing else."""
-
-        response = model.generate_content(prompt)
-        result = response.text.strip()
-
-        category = "Uncategorized"
-        confidence = 0.5
-
-        for line in result.split("\n"):
-            line = line.strip()
-            if line.startswith("CATEGORY:"):
-                cat = line.replace("CATEGORY:", "").strip()
-                if cat in ISSUE_CATEGORIES:
-                    category = cat
-            elif line.startswith("CONFIDENCE:"):
-                try:
-                    confidence = float(line.replace("CONFIDENCE:", "").strip())
-                except ValueError:
-                    confidence = 0.5
-
-        return category, round(confidence, 4)
-
-    except Exception as e:
-        print(f"Gemini classify_text error: {e}")
+    item = analyze_texts([text])[0]
+    if "error" in item:
+        print(f"Gemini classify_text error: {item['error']}")
         return "Uncategorized", 0.0
+    return item["category"], item["confidence"]
 
 
 def summarize_text(text, max_length=50, min_length=20):
@@ -85,21 +90,23 @@ def summarize_text(text, max_length=50, min_length=20):
         return text[:100]
 
     try:
-        prompt = f"""Summarize the following civic complaint in one clear sentence (max 40 words).
-Use formal civic language. Do not add opinions.
+        reply = cached_generate_json("summarize_text", text, _summary_prompt(text), SUMMARY_SCHEMA,
+                                     PROMPT_VERSIONS["summarize_text"], SENTENCE_MAX_TOKENS)
+        return reply["summary"].strip('"').strip("'")
 
-Complaint: "{text}"
+    except Exception as e:
+        print(f"Gemini summarize_text error: {e}")
+        return _summary_fallback(text)
 
-Reply with just the summary sentence, nothing else."""
 
-        response = model.generate_content(prompt)
-        summary = response.text.strip().strip('"').strip("'")
-        return summary if summary else text[:100]
+def _summary_prompt(text):
+    return f"""Summarize this civic complaint in one clear sentence (max 40 words), formal civic language, no opinions.
+Complaint: {json.dumps(text, ensure_ascii=False)}"""
 
-    except Exception as e:
-        print(f"Gemini summarize_text error: {e}")
-        sentences = text.split('.')
-        return (sentences[0] + '.').strip() if sentences else text[:100]
+
+def _summary_fallback(text):
+    sentences = text.split('.')
+    return (sentences[0] + '.').strip() if sentences else text[:100]
 
 
 def detect_urgency(text):
@@ -140,84 +147,175 @@ def generate_description(category):
         return "A civic issue has been reported and requires attention."
 
     try:
-        prompt = f"""Write one short factual civic report sentence (max 40 words) about a {category} issue 
-reported in a city. Use formal language suitable for a municipal complaint system.
-Reply with just the sentence, nothing else."""
+        prompt = f"""Write one short factual civic report sentence (max 40 words) about a {category} issue
+reported in a city, in formal language suitable for a municipal complaint system."""
 
-        response = model.generate_content(prompt)
-        description = response.text.strip().strip('"').strip("'")
-        return description if description else f"A {category} issue has been reported and requires immediate attention."
+        reply = cached_generate_json("generate_description", category, prompt, DESCRIPTION_SCHEMA,
+                                     PROMPT_VERSIONS["generate_description"], SENTENCE_MAX_TOKENS)
+        return reply["description"].strip('"').strip("'")
 
     except Exception as e:
         print(f"Gemini generate_description error: {e}")
         return f"A {category} issue has been reported and requires immediate attention."
 
 
-def analyze_text_comprehensive(text):
+def _analysis(item):
+    return {"category": item["category"], "confidence": round(item["confidence"], 4),
+            "summary": item["summary"].strip('"').strip("'")}
+
+
+def _batch_request(texts):
+    """Returns: (numbered prompt, generation_config) for one multi-complaint call."""
+    # JSON-quoted so quotes and newlines inside a complaint cannot break the numbering
+    numbered = "\n".join(f"{i}. {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts, 1))
+    prompt = f"""Analyze each numbered civic complaint: category (one of {', '.join(ISSUE_CATEGORIES)}),
+confidence 0-1, and a one-line summary (max 40 words, formal civic language).
+Return one object per complaint with its number as id.
+
+{numbered}"""
+    return prompt, json_config({"type": "array", "items": BATCH_ITEM_SCHEMA}, ANALYSIS_MAX_TOKENS * len(texts))
+
+
+def _batch_results(reply_text, count):
+    """Splits a batched reply back per complaint: the validated analysis, or None."""
+    try:
+        items = json.loads(reply_text)
+    except ValueError:
+        return [None] * count
+
+    # Entries are validated one by one so a bad entry only sends that complaint to the fallback
+    by_id = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            item = validate(item, BATCH_ITEM_SCHEMA)
+        except StructuredOutputError:
+            continue
+        by_id[item["id"]] = _analysis(item)
+    return [by_id.get(i) for i in range(1, count + 1)]
+
+
+def _analyze_batch(texts):
     """
-    Comprehensive text analysis using a single Gemini call.
-    Returns: dict with classification, summary, urgency
+    One Gemini call for several complaints: numbered prompt, schema-constrained JSON array reply.
+    Returns: per text, the validated analysis or None if its entry is missing or invalid
     """
-    if not text or len(text.strip()) < 3:
-        return {
-            "classification": {"category": "Uncategorized", "confidence": 0.0},
-            "summary": text[:100] if text else "",
-            "urgency": {"level": 1, "label": "Very Low", "keywords": []},
-            "error": "Text too short for analysis"
-        }
-
+    prompt, config = _batch_request(texts)
     try:
-        prompt = f"""You are a smart city complaint analysis system.
-Analyze the following civic complaint and provide:
-1. Category (choose ONE from: {', '.join(ISSUE_CATEGORIES)})
-2. Confidence score (0 to 1)
-3. One-line summary (max 40 words, formal civic language)
-
-Complaint: "{text}"
-
-Reply in this EXACT format only:
-CATEGORY: <category>
-CONFIDENCE: <0.0 to 1.0>
-SUMMARY: <one line summary>
-
-Nothing else."""
-
-        response = model.generate_content(prompt)
-        result = response.text.strip()
-
-        category = "Uncategorized"
-        confidence = 0.5
-        summary = text[:100]
-
-        for line in result.split("\n"):
-            line = line.strip()
-            if line.startswith("CATEGORY:"):
-                cat = line.replace("CATEGORY:", "").strip()
-                if cat in ISSUE_CATEGORIES:
-                    category = cat
-            elif line.startswith("CONFIDENCE:"):
-                try:
-                    confidence = float(line.replace("CONFIDENCE:", "").strip())
-                except ValueError:
-                    confidence = 0.5
-            elif line.startswith("SUMMARY:"):
-                summary = line.replace("SUMMARY:", "").strip().strip('"').strip("'")
-
-        # Urgency is always local
-        urgency_level, urgency_label, keywords_found = detect_urgency(text)
+        reply_text = response_text(generate_content(prompt, STRUCTURED_MODEL, generation_config=config))
+    except StructuredOutputError:
+        return [None] * len(texts)
+    return _batch_results(reply_text, len(texts))
 
-        return {
-            "classification": {"category": category, "confidence": round(confidence, 4)},
-            "summary": summary,
-            "urgency": {"level": urgency_level, "label": urgency_label, "keywords": keywords_found}
-        }
 
-    except Exception as e:
-        print(f"Gemini analyze_text_comprehensive error: {e}")
-        urgency_level, urgency_label, keywords_found = detect_urgency(text)
+text_batcher = MicroBatcher(_analyze_batch, max_batch_size=TEXT_BATCH_MAX_ITEMS,
+                            max_wait_ms=TEXT_BATCH_MAX_WAIT_MS, name="text", workers=TEXT_BATCH_WORKERS)
+
+
+def _analyze_single(text):
+    """
+    Per-item fallback when a batched reply did not cover this complaint.
+    Returns: {"category","confidence","summary"}
+    """
+    reply = cached_generate_json("analyze_text_comprehensive", text, _single_prompt(text), ANALYSIS_SCHEMA,
+                                 PROMPT_VERSIONS["analyze_text_comprehensive"], ANALYSIS_MAX_TOKENS)
+    return _analysis(reply)
+
+
+def _single_prompt(text):
+    return f"""Analyze this civic complaint: category (one of {', '.join(ISSUE_CATEGORIES)}),
+confidence 0-1, and a one-line summary (max 40 words, formal civic language).
+Complaint: {json.dumps(text, ensure_ascii=False)}"""
+
+
+def analyze_texts(texts):
+    """
+    Category, confidence and summary for several complaints.
+    Cached items are answered directly; the rest are micro-batched together with
+    concurrent requests into shared Gemini calls.
+    Returns: list of {"category","confidence","summary"} (or {"error": ...}), in input order
+    """
+    results, pending = _cached_analyses(texts)
+    futures = text_batcher.submit_many([texts[index] for index in pending]) if pending else []
+    for index, future in zip(pending, futures):
+        try:
+            item = future.result()
+            if item is None:
+                item = _analyze_single(texts[index])
+            _remember_analysis(texts[index], item)
+            results[index] = item
+        except Exception as e:
+            results[index] = {"error": str(e)}
+    return results
+
+
+def _cached_analyses(texts):
+    """Returns: (results with cached items filled in, indexes still to analyze)"""
+    results = [None] * len(texts)
+    pending = []
+    for index, text in enumerate(texts):
+        cached = cached_value("text_analysis", text, PROMPT_VERSIONS["text_analysis"], STRUCTURED_MODEL)
+        if cached is not None:
+            results[index] = json.loads(cached)
+        else:
+            pending.append(index)
+    return results, pending
+
+
+def _remember_analysis(text, item):
+    store_value("text_analysis", text, json.dumps(item), PROMPT_VERSIONS["text_analysis"], STRUCTURED_MODEL)
+
+
+def _comprehensive_result(text, item):
+    # Urgency is always local
+    urgency_level, urgency_label, keywords_found = detect_urgency(text)
+    urgency = {"level": urgency_level, "label": urgency_label, "keywords": keywords_found}
+    if "error" in item:
+        print(f"Gemini analyze_text_comprehensive error: {item['error']}")
         return {
             "classification": {"category": "Uncategorized", "confidence": 0.0},
             "summary": text[:100],
-            "urgency": {"level": urgency_level, "label": urgency_label, "keywords": keywords_found},
-            "error": str(e)
-        }
\ No newline at end of file
+            "urgency": urgency,
+            "error": item["error"]
+        }
+    return {
+        "classification": {"category": item["category"], "confidence": item["confidence"]},
+        "summary": item["summary"],
+        "urgency": urgency
+    }
+
+
+def _split_short_texts(texts):
+    """Returns: (results with the too-short texts answered, indexes of texts to analyze)"""
+    results = [None] * len(texts)
+    valid = []
+    for index, text in enumerate(texts):
+        if not text or len(text.strip()) < 3:
+            results[index] = {
+                "classification": {"category": "Uncategorized", "confidence": 0.0},
+                "summary": text[:100] if text else "",
+                "urgency": {"level": 1, "label": "Very Low", "keywords": []},
+                "error": "Text too short for analysis"
+            }
+        else:
+            valid.append(index)
+    return results, valid
+
+
+def analyze_texts_comprehensive(texts):
+    """
+    analyze_text_comprehensive for several complaints, sharing batched Gemini calls.
+    Returns: list of dicts with classification, summary, urgency (input order)
+    """
+    results, valid = _split_short_texts(texts)
+    items = analyze_texts([texts[index] for index in valid]) if valid else []
+    for index, item in zip(valid, items):
+        results[index] = _comprehensive_result(texts[index], item)
+    return results
+
+
+def analyze_text_comprehensive(text):
+    """
+    Comprehensive text analysis using a single (batched) Gemini call.
+    Returns: dict with classification, summary, urgency
+    """
+    return analyze_texts_comprehensive([text])[0]
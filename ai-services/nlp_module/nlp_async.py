@@ -0,0 +1,108 @@
+"""
+Awaitable versions of the nlp functions for the ASGI service (asgi_app.py).
+
+Same prompts, schemas, cache entries and result shapes as nlp.py. Gemini is
+awaited through generate_content_async instead of blocking a thread, and
+concurrent analyze requests share batched calls through an AsyncMicroBatcher
+(each batch is a task on the event loop, not a worker thread). Cache lookups
+and stores (SQLite) run on the default executor via llm_cache.cache_io_async.
+"""
+
+import asyncio
+
+from batching import AsyncMicroBatcher
+from gemini_client import STRUCTURED_MODEL, generate_content_async
+from llm_cache import cache_io_async, cached_generate_json_async
+from structured_output import StructuredOutputError, response_text
+from .nlp import (PROMPT_VERSIONS, ANALYSIS_SCHEMA, SUMMARY_SCHEMA, ANALYSIS_MAX_TOKENS, SENTENCE_MAX_TOKENS,
+                  TEXT_BATCH_MAX_ITEMS, TEXT_BATCH_MAX_WAIT_MS, _analysis, _batch_request, _batch_results,
+                  _cached_analyses, _remember_analysis, _single_prompt, _split_short_texts,
+                  _comprehensive_result, _summary_prompt, _summary_fallback)
+
+
+async def _analyze_batch_async(texts):
+    """Awaitable nlp._analyze_batch. Returns: per text, the validated analysis or None"""
+    prompt, config = _batch_request(texts)
+    try:
+        reply_text = response_text(await generate_content_async(prompt, STRUCTURED_MODEL, generation_config=config))
+    except StructuredOutputError:
+        return [None] * len(texts)
+    return _batch_results(reply_text, len(texts))
+
+
+async_text_batcher = AsyncMicroBatcher(_analyze_batch_async, max_batch_size=TEXT_BATCH_MAX_ITEMS,
+                                       max_wait_ms=TEXT_BATCH_MAX_WAIT_MS, name="text-async")
+
+
+async def _analyze_single_async(text):
+    reply = await cached_generate_json_async("analyze_text_comprehensive", text, _single_prompt(text),
+                                             ANALYSIS_SCHEMA, PROMPT_VERSIONS["analyze_text_comprehensive"],
+                                             ANALYSIS_MAX_TOKENS)
+    return _analysis(reply)
+
+
+async def analyze_texts_async(texts):
+    """
+    Awaitable nlp.analyze_texts.
+    Returns: list of {"category","confidence","summary"} (or {"error": ...}), in input order
+    """
+    results, pending = await cache_io_async(_cached_analyses, texts)
+    items = await asyncio.gather(*async_text_batcher.submit_many([texts[index] for index in pending]),
+                                 return_exceptions=True)
+
+    async def finish(text, item):
+        if isinstance(item, Exception):
+            return {"error": str(item)}
+        try:
+            if item is None:
+                item = await _analyze_single_async(text)
+            await cache_io_async(_remember_analysis, text, item)
+            return item
+        except Exception as e:
+            return {"error": str(e)}
+
+    finished = await asyncio.gather(*(finish(texts[index], item) for index, item in zip(pending, items)))
+    for index, item in zip(pending, finished):
+        results[index] = item
+    return results
+
+
+async def analyze_texts_comprehensive_async(texts):
+    """Awaitable nlp.analyze_texts_comprehensive."""
+    results, valid = _split_short_texts(texts)
+    items = await analyze_texts_async([texts[index] for index in valid]) if valid else []
+    for index, item in zip(valid, items):
+        results[index] = _comprehensive_result(texts[index], item)
+    return results
+
+
+async def analyze_text_comprehensive_async(text):
+    """Awaitable nlp.analyze_text_comprehensive."""
+    return (await analyze_texts_comprehensive_async([text]))[0]
+
+
+async def classify_text_async(text):
+    """Awaitable nlp.classify_text. Returns: (category, confidence)"""
+    if not text or len(text.strip()) < 3:
+        return "Uncategorized", 0.0
+
+    item = (await analyze_texts_async([text]))[0]
+    if "error" in item:
+        print(f"Gemini classify_text error: {item['error']}")
+        return "Uncategorized", 0.0
+    return item["category"], item["confidence"]
+
+
+async def summarize_text_async(text):
+    """Awaitable nlp.summarize_text. Returns: summary (string)"""
+    if not text or len(text.strip()) < 10:
+        return text[:100]
+
+    try:
+        reply = await cached_generate_json_async("summarize_text", text, _summary_prompt(text), SUMMARY_SCHEMA,
+                                                 PROMPT_VERSIONS["summarize_text"], SENTENCE_MAX_TOKENS)
+        return reply["summary"].strip('"').strip("'")
+
+    except Exception as e:
+        print(f"Gemini summarize_text error: {e}")
+        return _summary_fallback(text)
@@ -0,0 +1,178 @@
+"""
+quantize.py - INT8 post-training quantization for the retrained civic classifier.
+
+Takes the model produced by retrain.run_training (models/civic_latest.pt),
+exports it to ONNX, calibrates static INT8 quantization on a sample of
+training_data/, then compares INT8 against FP32 on the validation split that
+retrain.prepare_dataset builds (dataset/val/<category>/):
+  - top-1 accuracy of both models
+  - p50 / p95 single-image latency of both models
+
+The INT8 model is promoted to models/civic_latest_int8.onnx only if the
+accuracy drop stays within QUANT_MAX_ACCURACY_DROP.
+"""
+
+import os
+import json
+import random
+import shutil
+from datetime import datetime
+import numpy as np
+from PIL import Image
+from onnxruntime.quantization import CalibrationDataReader
+
+from cv_module.backends import OnnxBackend, export_onnx, _classify_transform
+from export_model import measure_latency, list_images
+
+# ── Config ──────────────────────────────────────────
+BASE_DIR          = os.path.dirname(__file__)
+TRAINING_DATA_DIR = os.path.join(BASE_DIR, "training_data")
+VAL_DIR           = os.path.join(BASE_DIR, "dataset", "val")
+MODELS_DIR        = os.path.join(BASE_DIR, "models")
+INT8_MODEL_PATH   = os.path.join(MODELS_DIR, "civic_latest_int8.onnx")
+QUANT_REPORT      = os.path.join(MODELS_DIR, "quantization_report.json")
+
+CALIBRATION_SAMPLES     = int(os.getenv("QUANT_CALIBRATION_SAMPLES", "64"))
+QUANT_MAX_ACCURACY_DROP = float(os.getenv("QUANT_MAX_ACCURACY_DROP", "0.01"))   # absolute top-1 drop
+
+
+# ── Helpers ─────────────────────────────────────────
+
+class _CalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed training images to the ONNX Runtime calibrator one at a time."""
+
+    def __init__(self, input_name, paths, imgsz):
+        self.input_name = input_name
+        self.paths = iter(paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        path = next(self.paths, None)
+        if path is None:
+            return None
+        array = _classify_transform(np.asarray(Image.open(path).convert("RGB")), self.imgsz)
+        return {self.input_name: array[None]}
+
+    def rewind(self):
+        pass
+
+
+def calibrate_and_quantize(fp32_path, output_path, sample_count=CALIBRATION_SAMPLES):
+    """
+    Static INT8 quantization (QDQ, per-channel weights) calibrated on training_data/.
+    Returns: output_path
+    """
+    import onnx
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    samples = [path for path, _ in list_images(TRAINING_DATA_DIR)]
+    if not samples:
+        raise RuntimeError("No training images available for calibration")
+    random.Random(0).shuffle(samples)
+    samples = samples[:sample_count]
+
+    fp32 = OnnxBackend(fp32_path)
+    # Shape inference + graph fusion before quantization; optional (needs sympy)
+    prepared_path = output_path + ".prep.onnx"
+    try:
+        quant_pre_process(fp32_path, prepared_path)
+    except Exception as prep_err:
+        print(f"Quantization pre-processing skipped: {prep_err}")
+        shutil.copy(fp32_path, prepared_path)
+
+    print(f"\n⚖️  Calibrating INT8 quantization on {len(samples)} images...")
+    quantize_static(
+        prepared_path,
+        output_path,
+        _CalibrationReader(fp32.input_name, samples, fp32.imgsz[0]),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8
+    )
+    os.remove(prepared_path)
+
+    # Carry over ultralytics metadata (task, names, imgsz) so OnnxBackend can serve it
+    source = onnx.load(fp32_path, load_external_data=False)
+    quantized = onnx.load(output_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, output_path)
+    return output_path
+
+
+def evaluate_top1(backend, samples):
+    """Top-1 accuracy of a classify backend over [(path, category)]."""
+    if not samples:
+        return 0.0
+    name_to_id = {name: idx for idx, name in backend.names.items()}
+    correct = 0
+    for path, category in samples:
+        probs = backend.predict([Image.open(path)])[0]["probs"]
+        correct += int(np.argmax(probs)) == name_to_id.get(category)
+    return correct / len(samples)
+
+
+# ── Main entry point ─────────────────────────────────
+
+def quantize_model(weights=os.path.join(MODELS_DIR, "civic_latest.pt"), max_accuracy_drop=QUANT_MAX_ACCURACY_DROP):
+    """
+    Full pipeline: export → calibrate → quantize → evaluate → promote if within budget.
+    Returns: report dict (also written to models/quantization_report.json)
+    """
+    fp32_path = export_onnx(weights)
+    candidate_path = os.path.join(MODELS_DIR, "civic_int8_candidate.onnx")
+    calibrate_and_quantize(fp32_path, candidate_path)
+
+    fp32 = OnnxBackend(fp32_path)
+    int8 = OnnxBackend(candidate_path)
+    if fp32.task != "classify":
+        raise ValueError(f"Expected a classification model, got task={fp32.task}")
+
+    val_samples = list_images(VAL_DIR)
+    if not val_samples:
+        raise RuntimeError(f"No validation split at {VAL_DIR} — run retrain.prepare_dataset first")
+
+    fp32_accuracy = evaluate_top1(fp32, val_samples)
+    int8_accuracy = evaluate_top1(int8, val_samples)
+    accuracy_drop = fp32_accuracy - int8_accuracy
+
+    images = [Image.open(path).convert("RGB") for path, _ in val_samples]
+    report = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "weights": weights,
+        "fp32_model": fp32_path,
+        "int8_candidate": candidate_path,
+        "validation_images": len(val_samples),
+        "fp32_top1": round(fp32_accuracy, 4),
+        "int8_top1": round(int8_accuracy, 4),
+        "accuracy_drop": round(accuracy_drop, 4),
+        "max_accuracy_drop": max_accuracy_drop,
+        "latency": {
+            "fp32": measure_latency(fp32, images),
+            "int8": measure_latency(int8, images)
+        },
+        "size_mb": {
+            "fp32": round(os.path.getsize(fp32_path) / 1e6, 2),
+            "int8": round(os.path.getsize(candidate_path) / 1e6, 2)
+        },
+        "promoted": False
+    }
+
+    if accuracy_drop <= max_accuracy_drop:
+        shutil.move(candidate_path, INT8_MODEL_PATH)
+        report["promoted"] = True
+        report["int8_model"] = INT8_MODEL_PATH
+        print(f"✓ INT8 model promoted: {INT8_MODEL_PATH} (top-1 drop {accuracy_drop:.4f})")
+    else:
+        print(f"✗ INT8 model rejected: top-1 drop {accuracy_drop:.4f} exceeds budget {max_accuracy_drop}")
+
+    with open(QUANT_REPORT, "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    result = quantize_model()
+    print("\nResult:", json.dumps(result, indent=2, default=str))
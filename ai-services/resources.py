@@ -0,0 +1,107 @@
+"""
+resources.py - Deferred, thread-safe initialisation of heavy resources.
+
+Models and API clients register here as LazyResource objects instead of being
+built at import time. The first caller builds the resource (others wait on the
+same lock); warm_up() can build everything ahead of traffic in the background.
+readiness() reports per-resource state and load duration for the /ready probe.
+"""
+
+import threading
+import time
+
+_RESOURCES = {}
+_RESOURCES_LOCK = threading.Lock()
+
+
+class LazyResource:
+    """
+    factory() builds the resource on first get(); the result is cached.
+    required=False resources are reported by readiness() but do not block it.
+    """
+
+    def __init__(self, name, factory, required=True):
+        self.name = name
+        self.factory = factory
+        self.required = required
+        self.state = "not_loaded"      # not_loaded → loading → ready | failed
+        self.load_ms = None
+        self.error = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state == "ready":
+                return self._value
+            self.state = "loading"
+            start = time.perf_counter()
+            try:
+                self._value = self.factory()
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+                print(f"Resource {self.name} failed to load: {e}")
+                raise
+            self.load_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.error = None
+            self.state = "ready"
+            print(f"✓ Resource {self.name} ready ({self.load_ms}ms)")
+            return self._value
+
+    def describe(self):
+        return {
+            "state": self.state,
+            "required": self.required,
+            "load_ms": self.load_ms,
+            "error": self.error
+        }
+
+
+def lazy_resource(name, factory, required=True):
+    """Creates and registers a LazyResource (or returns the one already registered under name)."""
+    with _RESOURCES_LOCK:
+        if name not in _RESOURCES:
+            _RESOURCES[name] = LazyResource(name, factory, required)
+        return _RESOURCES[name]
+
+
+def _registered():
+    """Snapshot of the registered resources, taken under the registration lock."""
+    with _RESOURCES_LOCK:
+        return list(_RESOURCES.values())
+
+
+def warm_up(background=True):
+    """
+    Builds every registered resource ahead of traffic.
+    Returns: the warm-up thread (background) or None
+    """
+    def _run():
+        start = time.perf_counter()
+        for resource in _registered():
+            try:
+                resource.get()
+            except Exception:
+                pass   # recorded on the resource; /ready reports it
+        print(f"✓ Warm-up finished in {round((time.perf_counter() - start) * 1000, 1)}ms")
+
+    if background:
+        thread = threading.Thread(target=_run, name="warm-up", daemon=True)
+        thread.start()
+        return thread
+    _run()
+    return None
+
+
+def readiness():
+    """
+    Returns: (ready flag, {name: state dict}); ready once every required resource is loaded
+    """
+    resources = _registered()
+    states = {resource.name: resource.describe() for resource in resources}
+    ready = all(r.state == "ready" for r in resources if r.required)
+    return ready, states
@@ -19,6 +19,7 @@ MODELS_DIR        = os.path.join(os.path.dirname(__file__), "models")
 RETRAIN_LOG       = os.path.join(os.path.dirname(__file__), "retrain_log.json")
 
 RETRAIN_THRESHOLD = 15       # retrain when any category hits this
+QUANTIZE_AFTER_RETRAIN = os.getenv("QUANTIZE_AFTER_RETRAIN", "false").lower() == "true"
 BASE_MODEL        = "yolov8n-cls.pt"   # classification variant of YOLOv8
 
 CIVIC_CATEGORIES = ["Pothole", "Garbage", "Streetlight", "Water Leakage"]
@@ -199,7 +200,34 @@ def maybe_retrain():
         # Step 2: Train model
         model_path = run_training()
 
-        # Step 3: Log it
+        # Step 3: Calibrate confidence thresholds (written before the log, so the
+        # serving watcher never picks up the new model with stale thresholds)
+        calibration = None
+        if model_path:
+            try:
+                from calibrate import calibrate_model
+                calibration = calibrate_model(model_path)
+            except Exception as calib_err:
+                print(f"Calibration failed (non-fatal): {calib_err}")
+
+        # Step 4: Optional INT8 quantization (promoted only within accuracy budget)
+        quantization = None
+        if model_path and QUANTIZE_AFTER_RETRAIN:
+            try:
+                from quantize import quantize_model
+                quantization = quantize_model(model_path)
+            except Exception as quant_err:
+                print(f"Quantization failed (non-fatal): {quant_err}")
+
+        # The promoted INT8 file is what the onnx backend serves — it needs its own thresholds
+        if quantization and quantization["promoted"]:
+            try:
+                from calibrate import calibrate_model
+                quantization["calibration"] = calibrate_model(quantization["int8_model"])
+            except Exception as calib_err:
+                print(f"INT8 calibration failed (non-fatal): {calib_err}")
+
+        # Step 5: Log it
         if model_path:
             update_retrain_log(total, model_path, stats)
             print(f"\n✅ Retraining complete! New model: {model_path}")
@@ -207,7 +235,9 @@ def maybe_retrain():
                 "retrained": True,
                 "model_path": model_path,
                 "stats": stats,
-                "total_images": total
+                "total_images": total,
+                "calibration": calibration,
+                "quantization": quantization
             }
 
     except Exception as e:
@@ -0,0 +1,116 @@
+"""
+serve.py - Production entrypoint: pre-fork gunicorn workers sharing model weights.
+
+    python serve.py
+
+The master process imports the app and loads model weights once, before
+forking, so every worker shares them copy-on-write instead of holding its own
+copy. Each worker then gets a fixed CPU thread budget for torch / OpenCV /
+ONNX Runtime so workers × threads never oversubscribes the host, and warms up
+its own models (dummy inference) after the fork.
+
+`app.run(debug=True)` in app.py stays the development server.
+
+Environment:
+    PORT                 listen port (default 8000)
+    WEB_CONCURRENCY      worker processes (default: cores // CPU_THREADS_PER_WORKER)
+    CPU_THREADS_PER_WORKER  torch / OpenCV / ORT threads per worker (default 2, 1 on ≤2 cores)
+    GUNICORN_THREADS     request threads per worker (default 4; Gemini calls are I/O bound)
+    GUNICORN_TIMEOUT     worker timeout seconds (default 120)
+"""
+
+import os
+
+
+# ── Config ──────────────────────────────────────────
+
+def available_cores():
+    """Cores this process may run on (respects taskset / cgroup cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+CORES                  = available_cores()
+CPU_THREADS_PER_WORKER = int(os.getenv("CPU_THREADS_PER_WORKER", "2" if CORES > 2 else "1"))
+WORKERS                = int(os.getenv("WEB_CONCURRENCY", str(max(1, CORES // CPU_THREADS_PER_WORKER))))
+REQUEST_THREADS        = int(os.getenv("GUNICORN_THREADS", "4"))
+PORT                   = int(os.getenv("PORT", "8000"))
+TIMEOUT                = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Must be set before torch / OpenCV / onnxruntime are imported (in the master),
+# so every worker inherits the same per-process thread budget
+for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "ORT_INTRA_OP_THREADS"):
+    os.environ[var] = str(CPU_THREADS_PER_WORKER)
+
+# The master must not start warm-up threads or run inference before fork
+os.environ["WARMUP_ON_START"] = "false"
+
+
+# ── Hooks ───────────────────────────────────────────
+
+def preload_models():
+    """
+    Runs in the master before fork. Only torch weights are preloaded: ONNX Runtime
+    and OpenVINO sessions own thread pools that do not survive fork, so those
+    backends load in each worker instead.
+    """
+    from cv_module.backends import INFERENCE_BACKEND
+    from cv_module.vision import preload_models as load_weights
+
+    if INFERENCE_BACKEND != "torch":
+        print(f"Backend {INFERENCE_BACKEND}: models load per worker after fork")
+        return
+    try:
+        load_weights()
+        print("✓ Model weights preloaded in master (shared copy-on-write)")
+    except Exception as e:
+        print(f"Preload failed, workers will load models themselves: {e}")
+
+
+def post_fork(server, worker):
+    """Per-worker thread budget, then background warm-up of this worker's models."""
+    import sys
+    import cv2
+    cv2.setNumThreads(CPU_THREADS_PER_WORKER)
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        torch.set_num_threads(CPU_THREADS_PER_WORKER)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass   # already fixed once inter-op work has started
+
+    import resources
+    resources.warm_up(background=True)
+
+
+# ── Main entry point ─────────────────────────────────
+
+def run():
+    from gunicorn.app.base import BaseApplication
+    from app import app
+
+    preload_models()
+
+    class CivicAIServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"0.0.0.0:{PORT}")
+            self.cfg.set("workers", WORKERS)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", REQUEST_THREADS)
+            self.cfg.set("timeout", TIMEOUT)
+            self.cfg.set("preload_app", True)
+            self.cfg.set("post_fork", post_fork)
+
+        def load(self):
+            return app
+
+    print(f"🚀 Serving on :{PORT} — {WORKERS} workers × {CPU_THREADS_PER_WORKER} CPU threads "
+          f"({CORES} cores), {REQUEST_THREADS} request threads each")
+    CivicAIServer().run()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,150 @@
+"""
+structured_output.py - Schema-constrained JSON replies from Gemini.
+
+Prompts that used to ask for a line format ("CATEGORY: ...") and were parsed
+with startswith loops now send a response schema with
+response_mime_type="application/json", temperature 0 and a small
+max_output_tokens cap, and the reply is validated against the same schema in
+one pass. A reply that is not valid JSON or does not match raises
+StructuredOutputError instead of silently turning into default values.
+
+Schemas use the subset Gemini accepts (type, enum, properties, required,
+items, min_items, max_items, nullable, description). "minimum" / "maximum" are
+checked locally only and stripped before the schema is sent.
+
+Calls go to STRUCTURED_MODEL (GEMINI_STRUCTURED_MODEL, default GEMINI_MODEL).
+The installed SDK cannot send a thinking budget, so a thinking model gets only a
+small STRUCTURED_THINKING_TOKENS allowance on top of each reply budget; thinking
+that runs past it cuts the reply short, which raises StructuredOutputError.
+"""
+
+import os
+import json
+
+from gemini_client import STRUCTURED_MODEL, generate_content, generate_content_async
+
+# Reply budget per call is set by the caller; models that think (gemini-2.5 flash /
+# pro) count thinking tokens against max_output_tokens, so they get this small cap
+# on top. 0 leaves them the bare reply budget.
+STRUCTURED_THINKING_TOKENS = int(os.getenv("STRUCTURED_THINKING_TOKENS", "512"))
+
+LOCAL_ONLY_KEYS = ("minimum", "maximum")
+
+_TYPES = {
+    "object":  dict,
+    "array":   list,
+    "string":  str,
+    "number":  (int, float),
+    "integer": int,
+    "boolean": bool
+}
+
+
+class StructuredOutputError(ValueError):
+    """Gemini's reply was not JSON or did not match the response schema."""
+
+
+def thinks_by_default(model_name):
+    """gemini-2.5 flash / pro think unless told not to; flash-lite and earlier models do not."""
+    return "2.5" in model_name and "lite" not in model_name
+
+
+def _thinking_allowance(model_name):
+    return STRUCTURED_THINKING_TOKENS if thinks_by_default(model_name) else 0
+
+
+def wire_schema(schema):
+    """The schema as sent to Gemini (local-only keywords removed)."""
+    schema = {key: value for key, value in schema.items() if key not in LOCAL_ONLY_KEYS}
+    if "items" in schema:
+        schema["items"] = wire_schema(schema["items"])
+    if "properties" in schema:
+        schema["properties"] = {name: wire_schema(sub) for name, sub in schema["properties"].items()}
+    return schema
+
+
+def json_config(schema, max_output_tokens, model_name=STRUCTURED_MODEL):
+    """generation_config for a schema-constrained reply."""
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": wire_schema(schema),
+        "max_output_tokens": max_output_tokens + _thinking_allowance(model_name),
+        "temperature": 0
+    }
+
+
+def validate(value, schema, path="$"):
+    """
+    Checks value against schema; strings are stripped, unknown object keys dropped.
+    Returns: the cleaned value (raises StructuredOutputError on the first mismatch)
+    """
+    if value is None:
+        if schema.get("nullable"):
+            return None
+        raise StructuredOutputError(f"{path}: missing")
+
+    kind = schema.get("type", "object")
+    expected = _TYPES[kind]
+    if not isinstance(value, expected) or (kind in ("number", "integer") and isinstance(value, bool)):
+        raise StructuredOutputError(f"{path}: expected {kind}, got {type(value).__name__}")
+
+    if kind == "string":
+        value = value.strip()
+        if not value and not schema.get("nullable"):
+            raise StructuredOutputError(f"{path}: empty string")
+    if "enum" in schema and value not in schema["enum"]:
+        raise StructuredOutputError(f"{path}: {value!r} not one of {schema['enum']}")
+    if kind in ("number", "integer"):
+        if value < schema.get("minimum", value) or value > schema.get("maximum", value):
+            raise StructuredOutputError(f"{path}: {value} out of range")
+        value = float(value) if kind == "number" else value
+
+    if kind == "array":
+        if len(value) < schema.get("min_items", 0):
+            raise StructuredOutputError(f"{path}: fewer than {schema['min_items']} items")
+        value = value[:schema["max_items"]] if "max_items" in schema else value
+        if "items" in schema:
+            value = [validate(item, schema["items"], f"{path}[{i}]") for i, item in enumerate(value)]
+
+    if kind == "object":
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value:
+                raise StructuredOutputError(f"{path}.{name}: missing")
+        value = {name: validate(value[name], sub, f"{path}.{name}")
+                 for name, sub in properties.items() if name in value}
+    return value
+
+
+def parse_json(text, schema):
+    """Returns: the validated value decoded from a JSON reply."""
+    try:
+        value = json.loads(text)
+    except ValueError as e:
+        raise StructuredOutputError(f"reply is not JSON: {e}") from e
+    return validate(value, schema)
+
+
+def response_text(response):
+    """response.text, with a blocked / truncated (no parts) reply reported as a schema error."""
+    try:
+        return response.text
+    except ValueError as e:
+        raise StructuredOutputError(f"empty reply: {e}") from e
+
+
+def generate_json(contents, schema, max_output_tokens, model_name=STRUCTURED_MODEL):
+    """
+    One schema-constrained Gemini call (single-flight like any generate_content call).
+    Returns: the validated reply (dict / list)
+    """
+    response = generate_content(contents, model_name,
+                                generation_config=json_config(schema, max_output_tokens, model_name))
+    return parse_json(response_text(response), schema)
+
+
+async def generate_json_async(contents, schema, max_output_tokens, model_name=STRUCTURED_MODEL):
+    """Awaitable generate_json (gemini_client.generate_content_async)."""
+    response = await generate_content_async(contents, model_name,
+                                            generation_config=json_config(schema, max_output_tokens, model_name))
+    return parse_json(response_text(response), schema)
@@ -0,0 +1,174 @@
+"""
+Tests for the asyncio serving pieces: AsyncMicroBatcher, the single-flight
+generate_content_async and the async Gemini Vision fallback (Gemini replaced by fakes).
+Run: python -m pytest test_async.py  (no AI service or network needed)
+"""
+
+import asyncio
+
+import pytest
+
+import gemini_client
+from batching import AsyncMicroBatcher
+
+
+# ── AsyncMicroBatcher ──
+
+def test_async_results_follow_submission_order():
+    batches = []
+
+    async def double(items):
+        batches.append(list(items))
+        await asyncio.sleep(0)
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = AsyncMicroBatcher(double, max_batch_size=4, max_wait_ms=20, name="test")
+        results = await asyncio.gather(*batcher.submit_many(range(10)))
+        return batcher, results
+
+    batcher, results = asyncio.run(main())
+    assert results == [item * 2 for item in range(10)]
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert batcher.stats["items"] == 10
+
+
+def test_async_batch_error_reaches_every_caller():
+    async def fail(items):
+        raise ValueError("model crashed")
+
+    async def main():
+        batcher = AsyncMicroBatcher(fail, max_batch_size=8, max_wait_ms=5, name="test")
+        return await asyncio.gather(*batcher.submit_many("abc"), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_async_cancelled_caller_is_dropped():
+    seen = []
+
+    async def identity(items):
+        seen.extend(items)
+        return list(items)
+
+    async def main():
+        batcher = AsyncMicroBatcher(identity, max_batch_size=8, max_wait_ms=20, name="test")
+        kept, dropped = batcher.submit("kept"), batcher.submit("dropped")
+        dropped.cancel()
+        return await kept
+
+    assert asyncio.run(main()) == "kept"
+    assert seen == ["kept"]
+
+
+# ── Single-flight generate_content_async ──
+
+class _FakeModel:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.calls.append(contents)
+        await asyncio.sleep(self.delay)
+        if contents == "fail":
+            raise RuntimeError("quota exceeded")
+        return f"reply to {contents}"
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = _FakeModel()
+    monkeypatch.setattr(gemini_client, "get_model", lambda name=None: fake)
+    return fake
+
+
+def test_identical_calls_share_one_request(model):
+    async def main():
+        return await asyncio.gather(*(gemini_client.generate_content_async("prompt") for _ in range(5)))
+
+    assert asyncio.run(main()) == ["reply to prompt"] * 5
+    assert model.calls == ["prompt"]
+
+
+def test_cancelling_the_first_caller_does_not_cancel_the_others(model):
+    async def main():
+        first = asyncio.ensure_future(gemini_client.generate_content_async("prompt"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(gemini_client.generate_content_async("prompt"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return first, await second
+
+    first, reply = asyncio.run(main())
+    assert first.cancelled()
+    assert reply == "reply to prompt"
+    assert model.calls == ["prompt"]
+
+
+def test_cancelling_a_follower_does_not_cancel_the_call(model):
+    async def main():
+        first = asyncio.ensure_future(gemini_client.generate_content_async("prompt"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(gemini_client.generate_content_async("prompt"))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        return await first
+
+    assert asyncio.run(main()) == "reply to prompt"
+
+
+def test_errors_are_shared_and_not_cached(model):
+    async def main():
+        results = await asyncio.gather(*(gemini_client.generate_content_async("fail") for _ in range(3)),
+                                       return_exceptions=True)
+        retry = await asyncio.gather(gemini_client.generate_content_async("fail"), return_exceptions=True)
+        return results + retry
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert model.calls == ["fail", "fail"]
+
+
+def test_abandoned_call_finishes_and_is_retired(model):
+    async def main():
+        caller = asyncio.ensure_future(gemini_client.generate_content_async("fail"))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.1)
+        return gemini_client.single_flight_stats()["in_flight"]
+
+    assert asyncio.run(main()) == 0
+
+
+# ── Gemini Vision fallback on the event loop ──
+
+def test_vision_fallbacks_are_awaited_together(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from cv_module import vision
+
+    misses = 4
+    monkeypatch.setattr(vision, "_classify_locally",
+                        lambda images: ([None] * len(images), [None] * len(images), [{}] * len(images)))
+    monkeypatch.setattr(vision, "_gemini_contents", lambda image: ["prompt", image])
+    in_flight, peak = [0], [0]
+
+    async def generate_json_async(contents, schema, max_output_tokens, model_name=None):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return {"category": "Pothole", "confidence": 0.8}
+
+    monkeypatch.setattr(vision, "generate_json_async", generate_json_async)
+
+    async def main():
+        # One executor thread: the Vision calls must not need it
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return await vision.classify_images_async([bytes([i]) for i in range(misses)], executor,
+                                                      return_detections=True)
+
+    results = asyncio.run(main())
+    assert [result[:2] for result in results] == [("Pothole", 0.8)] * misses
+    assert peak[0] == misses
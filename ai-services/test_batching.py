@@ -0,0 +1,93 @@
+"""
+Tests for batching.MicroBatcher: batched calls, result order and error propagation.
+Run: python -m pytest test_batching.py  (no AI service or network needed)
+"""
+
+import threading
+import time
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def test_results_follow_submission_order():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=50, name="test")
+    futures = batcher.submit_many(range(10))
+    assert [future.result(timeout=5) for future in futures] == [item * 2 for item in range(10)]
+    assert [item for batch in batches for item in batch] == list(range(10))
+    assert max(len(batch) for batch in batches) <= 4
+    assert batcher.stats["items"] == 10
+
+
+def test_concurrent_callers_share_a_batch():
+    sizes = []
+
+    def identity(items):
+        sizes.append(len(items))
+        return list(items)
+
+    batcher = MicroBatcher(identity, max_batch_size=8, max_wait_ms=200, name="test")
+    results = [None] * 8
+    start = threading.Barrier(8)
+
+    def call(index):
+        start.wait()
+        results[index] = batcher(index, timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == list(range(8))
+    assert max(sizes) > 1
+
+
+def test_batch_error_reaches_every_caller():
+    def fail(items):
+        raise ValueError("model crashed")
+
+    batcher = MicroBatcher(fail, max_batch_size=4, max_wait_ms=50, name="test")
+    futures = batcher.submit_many(["a", "b", "c"])
+    for future in futures:
+        with pytest.raises(ValueError, match="model crashed"):
+            future.result(timeout=5)
+
+    # The worker survives a failed batch
+    batcher.process_batch = lambda items: list(items)
+    assert batcher("d", timeout=5) == "d"
+
+
+def test_wrong_result_count_is_an_error():
+    batcher = MicroBatcher(lambda items: items[:1], max_batch_size=4, max_wait_ms=50, name="test")
+    futures = batcher.submit_many([1, 2])
+    for future in futures:
+        with pytest.raises(RuntimeError, match="returned 1 results for 2 items"):
+            future.result(timeout=5)
+
+
+def test_cancelled_items_are_skipped():
+    seen = []
+    release = threading.Event()
+
+    def slow(items):
+        seen.extend(items)
+        release.wait(5)
+        return list(items)
+
+    batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=0, name="test")
+    first = batcher.submit("first")
+    time.sleep(0.1)              # the worker is now blocked on "first"
+    cancelled = batcher.submit("cancelled")
+    assert cancelled.cancel()
+    release.set()
+    assert first.result(timeout=5) == "first"
+    assert batcher("last", timeout=5) == "last"
+    assert seen == ["first", "last"]
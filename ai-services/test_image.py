@@ -0,0 +1,101 @@
+"""
+Tests for cv_module.image.DecodedImage: one decode per upload, memoized arrays and views.
+Run: python -m pytest test_image.py  (no AI service or network needed)
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+import cv_module.image as image_module
+from cv_module.image import DecodedImage, as_decoded_image
+
+
+def _jpeg(width=1200, height=900):
+    array = np.random.default_rng(0).integers(0, 255, (height // 20, width // 20, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(array).resize((width, height)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _count_decodes(monkeypatch):
+    calls = []
+    decode = image_module._decode
+
+    def counting(image_bytes, max_side=None):
+        calls.append(max_side)
+        return decode(image_bytes, max_side)
+
+    monkeypatch.setattr(image_module, "_decode", counting)
+    return calls
+
+
+def test_arrays_decode_once(monkeypatch):
+    calls = _count_decodes(monkeypatch)
+    image = DecodedImage(_jpeg())
+    assert image.rgb is image.rgb
+    assert image.gray.shape == image.rgb.shape[:2]
+    assert image.bgr[..., 0].tolist() == image.rgb[..., 2].tolist()
+    assert image.hsv is image.hsv
+    assert image.jpeg_bytes() is image.jpeg_bytes()
+    assert len(calls) == 1
+
+
+def test_views_are_bounded_and_memoized():
+    image = DecodedImage(_jpeg(), max_side=1600)
+    view = image.at(320)
+    assert view is image.at(320)
+    assert max(view.size) <= 320
+    assert image.at(None) is image
+    assert image.at(2000) is image
+    assert as_decoded_image(image, 320) is view
+
+
+def test_view_reuses_decoded_parent(monkeypatch):
+    calls = _count_decodes(monkeypatch)
+    image = DecodedImage(_jpeg())
+    image.rgb
+    image.at(256).gray
+    image.at(640).rgb
+    assert len(calls) == 1
+
+
+def test_stage_views_share_one_decode(monkeypatch):
+    # The views one /analyze request reads: quality + pHash, civic, YOLO, severity, Gemini upload
+    calls = _count_decodes(monkeypatch)
+    image = DecodedImage(_jpeg(2400, 1800), max_side=1600)
+    image.at(256).gray
+    image.at(320).pil
+    image.at(640).pil
+    image.at(512).hsv
+    image.upload_jpeg(max_side=1024)
+    assert calls == [max(image_module._stage_sides)]
+    assert max(image.at(640).size) == 640
+
+
+def test_larger_request_than_the_shared_side_decodes_again(monkeypatch):
+    calls = _count_decodes(monkeypatch)
+    image = DecodedImage(_jpeg(2400, 1800), max_side=1600)
+    image.at(256).gray
+    image.rgb
+    image.at(2000).gray
+    assert calls == [max(image_module._stage_sides), 1600]
+
+
+def test_from_rgb_skips_decoding(monkeypatch):
+    calls = _count_decodes(monkeypatch)
+    array = np.zeros((40, 60, 3), dtype=np.uint8)
+    image = DecodedImage.from_rgb(array)
+    assert image.rgb is array
+    assert image.size == (60, 40)
+    assert image.at(20).size[0] == 20
+    assert calls == []
+
+
+def test_upload_jpeg_fits_budget():
+    image = DecodedImage(_jpeg(2400, 1800), max_side=None)
+    data = image.upload_jpeg(max_side=1024, max_bytes=60000)
+    assert len(data) <= 60000
+    assert max(Image.open(io.BytesIO(data)).size) <= 1024
+    assert image.upload_jpeg(max_side=1024, max_bytes=60000) is data
@@ -0,0 +1,100 @@
+"""
+Tests for llm_cache.LLMCache: memory / SQLite tiers, expiry and pruning.
+Run: python -m pytest test_llm_cache.py  (no AI service or network needed)
+"""
+
+import threading
+
+import llm_cache
+from llm_cache import LLMCache, cache_key
+
+
+def _clock(monkeypatch, start=1000.0):
+    now = [start]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_memory_then_disk_hit(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMCache(path=path)
+    assert cache.get("k") is None
+    cache.set("k", "value")
+    assert cache.get("k") == "value"
+    assert cache.stats()["memory_hits"] == 1
+
+    # A second process / restart only has the disk tier
+    restarted = LLMCache(path=path)
+    assert restarted.get("k") == "value"
+    assert restarted.get("k") == "value"
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["disk_entries"]) == (1, 1, 1)
+
+
+def test_entries_expire_in_both_tiers(tmp_path, monkeypatch):
+    now = _clock(monkeypatch)
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMCache(path=path, ttl_seconds=60)
+    cache.set("k", "value")
+
+    now[0] += 59
+    assert cache.get("k") == "value"
+    assert LLMCache(path=path, ttl_seconds=60).get("k") == "value"
+
+    now[0] += 2
+    assert cache.get("k") is None
+    assert LLMCache(path=path, ttl_seconds=60).get("k") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_is_bounded(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite3"), memory_entries=2)
+    for key in "abc":
+        cache.set(key, key.upper())
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get("a") == "A"             # evicted from memory, still on disk
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_prune_drops_expired_and_oldest_rows(tmp_path, monkeypatch):
+    now = _clock(monkeypatch)
+    monkeypatch.setattr(llm_cache, "PRUNE_EVERY_WRITES", 5)
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite3"), max_rows=3, ttl_seconds=60)
+    cache.set("old", "x")
+    now[0] += 120
+    for i in range(4):
+        now[0] += 1
+        cache.set(f"k{i}", str(i))           # the 5th write prunes
+    stats = cache.stats()
+    assert stats["disk_entries"] == 3
+    assert stats["evictions"] == 2
+
+
+def test_memory_only_without_path():
+    cache = LLMCache(path=None)
+    cache.set("k", "value")
+    assert cache.get("k") == "value"
+    assert cache.stats()["disk_entries"] is None
+
+
+def test_threads_share_the_disk_tier(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.sqlite3"), memory_entries=1)
+
+    def work(worker):
+        for i in range(50):
+            cache.set(f"{worker}-{i}", str(i))
+            assert cache.get(f"{worker}-{i}") == str(i)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert (stats["disk_entries"], stats["disk_errors"], stats["misses"]) == (200, 0, 0)
+
+
+def test_cache_key_normalizes_text():
+    assert cache_key("fn", "  Pothole   on Main ", 1) == cache_key("fn", "pothole on main", 1)
+    assert cache_key("fn", "pothole", 1) != cache_key("fn", "pothole", 2)
+    assert cache_key("fn", "pothole", 1, "model-a") != cache_key("fn", "pothole", 1, "model-b")
@@ -0,0 +1,90 @@
+"""
+Tests for nlp._analyze_batch: one Gemini call per batch, split back per complaint.
+Gemini is replaced by a fake generate_content. Run: python -m pytest test_nlp_batch.py
+"""
+
+import json
+
+import pytest
+
+from nlp_module import nlp
+
+TEXTS = ["Deep pothole near the school gate", "Garbage not collected for a week", "Streetlight flickering at night"]
+
+
+class _Reply:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("response has no parts")
+        return self._text
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Sets the next reply text (None = blocked reply); records each call."""
+    state = {"reply": None, "calls": []}
+
+    def generate_content(prompt, model_name=None, **kwargs):
+        state["calls"].append(prompt)
+        return _Reply(state["reply"])
+
+    monkeypatch.setattr(nlp, "generate_content", generate_content)
+    return state
+
+
+def _item(id, category="Pothole", confidence=0.9, summary="Pothole reported."):
+    return {"id": id, "category": category, "confidence": confidence, "summary": summary}
+
+
+def test_results_are_matched_by_id(gemini):
+    gemini["reply"] = json.dumps([_item(3, "Streetlight"), _item(1), _item(2, "Garbage")])
+    results = nlp._analyze_batch(TEXTS)
+    assert [result["category"] for result in results] == ["Pothole", "Garbage", "Streetlight"]
+    assert len(gemini["calls"]) == 1
+    assert all(json.dumps(text) in gemini["calls"][0] for text in TEXTS)
+
+
+def test_missing_ids_are_none(gemini):
+    gemini["reply"] = json.dumps([_item(1), _item(7)])
+    assert nlp._analyze_batch(TEXTS)[1:] == [None, None]
+
+
+def test_invalid_entries_only_fail_themselves(gemini):
+    gemini["reply"] = json.dumps([
+        _item(1),
+        _item(2, category="Volcano"),        # not in the enum
+        {"id": 3, "category": "Streetlight"}  # missing fields
+    ])
+    results = nlp._analyze_batch(TEXTS)
+    assert results[0]["category"] == "Pothole"
+    assert results[1:] == [None, None]
+
+
+def test_non_json_or_blocked_reply_fails_the_batch(gemini):
+    gemini["reply"] = "CATEGORY: Pothole"
+    assert nlp._analyze_batch(TEXTS) == [None, None, None]
+    gemini["reply"] = json.dumps({"id": 1})  # an object, not an array
+    assert nlp._analyze_batch(TEXTS) == [None, None, None]
+    gemini["reply"] = None
+    assert nlp._analyze_batch(TEXTS) == [None, None, None]
+
+
+def test_quotes_and_newlines_keep_the_numbering(gemini):
+    texts = ['He said "2. Garbage" here', "line one\n3. fake entry"]
+    gemini["reply"] = json.dumps([_item(1), _item(2)])
+    nlp._analyze_batch(texts)
+    numbered = [line for line in gemini["calls"][0].splitlines() if line[:1].isdigit()]
+    assert [line.split(".", 1)[0] for line in numbered] == ["1", "2"]
+
+
+def test_api_errors_propagate(gemini, monkeypatch):
+    def fail(prompt, model_name=None, **kwargs):
+        raise RuntimeError("quota exceeded")
+
+    monkeypatch.setattr(nlp, "generate_content", fail)
+    with pytest.raises(RuntimeError, match="quota exceeded"):
+        nlp._analyze_batch(TEXTS)
@@ -0,0 +1,100 @@
+"""
+Tests for cv_module.result_cache.ImageResultCache: exact, perceptual and TTL behaviour.
+Run: python -m pytest test_result_cache.py  (no AI service or network needed)
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+import cv_module.result_cache as result_cache
+from cv_module.image import DecodedImage
+from cv_module.result_cache import ImageResultCache
+
+RESULT = {"predicted_category": "Pothole", "confidence_percent": 91.0, "severity_score": 4, "detections": []}
+
+
+def _encode(array, format="JPEG", quality=90, size=None):
+    image = Image.fromarray(array)
+    if size:
+        image = image.resize(size)
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, quality=quality)
+    return DecodedImage(buffer.getvalue())
+
+
+def _scene(seed):
+    small = np.random.default_rng(seed).integers(0, 255, (24, 32, 3), dtype=np.uint8)
+    return np.asarray(Image.fromarray(small).resize((640, 480), Image.Resampling.BILINEAR))
+
+
+def test_exact_hit():
+    cache = ImageResultCache(max_hamming=6)
+    image = _encode(_scene(1))
+    result, match, key = cache.lookup(image, "v1")
+    assert (result, match) == (None, None)
+    cache.store(key, RESULT)
+
+    result, match, _ = cache.lookup(_encode(_scene(1)), "v1")
+    assert (result, match) == (RESULT, "exact")
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_perceptual_hit_survives_reencoding():
+    cache = ImageResultCache(max_hamming=6)
+    _, _, key = cache.lookup(_encode(_scene(1)), "v1")
+    cache.store(key, RESULT)
+
+    copy = _encode(_scene(1), quality=60, size=(480, 360))
+    result, match, _ = cache.lookup(copy, "v1")
+    assert (result, match) == (RESULT, "perceptual")
+
+    other = _encode(_scene(2))
+    assert cache.lookup(other, "v1")[:2] == (None, None)
+
+
+def test_exact_only_when_hamming_is_zero():
+    cache = ImageResultCache(max_hamming=0)
+    _, _, key = cache.lookup(_encode(_scene(1)), "v1")
+    cache.store(key, RESULT)
+    assert cache.lookup(_encode(_scene(1), quality=60), "v1")[:2] == (None, None)
+
+
+def test_model_version_is_part_of_the_key():
+    cache = ImageResultCache(max_hamming=6)
+    image = _encode(_scene(1))
+    _, _, key = cache.lookup(image, "v1")
+    cache.store(key, RESULT)
+    assert cache.lookup(image, "v2")[:2] == (None, None)
+    assert cache.lookup(_encode(_scene(1), quality=60), "v2")[:2] == (None, None)
+    assert cache.lookup(image, "v1")[1] == "exact"
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "time", lambda: now[0])
+    cache = ImageResultCache(ttl_seconds=60, max_hamming=6)
+    image = _encode(_scene(1))
+    _, _, key = cache.lookup(image, "v1")
+    cache.store(key, RESULT)
+
+    now[0] += 59
+    assert cache.lookup(image, "v1")[1] == "exact"
+    now[0] += 2
+    assert cache.lookup(image, "v1")[:2] == (None, None)
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_is_evicted():
+    cache = ImageResultCache(max_entries=2, max_hamming=0)
+    images = [_encode(_scene(seed)) for seed in range(3)]
+    keys = [cache.lookup(image, "v1")[2] for image in images]
+    cache.store(keys[0], RESULT)
+    cache.store(keys[1], RESULT)
+    cache.lookup(images[0], "v1")           # 0 is now more recent than 1
+    cache.store(keys[2], RESULT)
+    assert cache.lookup(images[1], "v1")[1] is None
+    assert cache.lookup(images[0], "v1")[1] == "exact"
+    assert cache.stats()["evictions"] == 1
@@ -25,36 +25,34 @@ export const createIssue = async (req, res, next) => {
     let textClassification = null, textSummary = null;
     let urgencyLevel = null, urgencyLabel = null, urgencyKeywords = [];
 
-    // Image analysis using the first image only if provided
-    if (req.files && req.files.length > 0) {
+    // One AI call for images + description: CV and text analysis run concurrently on the AI side
+    const hasImages = req.files && req.files.length > 0;
+    if (hasImages || (description && description.trim().length >= 3)) {
       try {
-        const file = req.files[0];
-        const aiResponse = await axios.post(`${AI_SERVICE_URL}/analyze-and-enhance`, {
-          image: file.buffer.toString("base64")
+        const form = new FormData();
+        for (const file of req.files || []) {
+          form.append("images", new Blob([file.buffer], { type: file.mimetype }), file.originalname);
+        }
+        form.append("description", description);
+        const aiResponse = await axios.post(`${AI_SERVICE_URL}/analyze-issue`, form, {
+          maxBodyLength: Infinity
         });
-        ({ predicted_category: aiCategory, confidence_percent: aiConfidence, enhanced_description: aiGeneratedDescription, severity_score: aiSeverityScore, is_miscategorized } = aiResponse.data);
+        const { classification, summary, urgency } = aiResponse.data;
+        if (hasImages) {
+          ({ predicted_category: aiCategory, confidence_percent: aiConfidence, enhanced_description: aiGeneratedDescription, severity_score: aiSeverityScore, is_miscategorized } = aiResponse.data);
+        }
+        if (classification) {
+          textClassification = classification;
+          textSummary = summary;
+          urgencyLevel = urgency.level;
+          urgencyLabel = urgency.label;
+          urgencyKeywords = urgency.keywords;
+        }
       } catch (aiError) {
         console.error("AI service error:", aiError.message);
       }
     }
 
-    // Text analysis (always, for description)
-    if (description && description.trim().length >= 3) {
-      try {
-        const textResponse = await axios.post(`${AI_SERVICE_URL}/analyze-text`, {
-          text: description
-        });
-        const { classification, summary, urgency } = textResponse.data;
-        textClassification = classification;
-        textSummary = summary;
-        urgencyLevel = urgency.level;
-        urgencyLabel = urgency.label;
-        urgencyKeywords = urgency.keywords;
-      } catch (textError) {
-        console.error("Text analysis error:", textError.message);
-      }
-    }
-
     // Upload images to Cloudinary
     let imageUrls = [];
     if (req.files && req.files.length > 0) {
@@ -118,12 +116,15 @@ export const createIssue = async (req, res, next) => {
  */
 async function _saveTrainingDataAsync({ imageBuffer, confirmedCategory, aiCategory, confidence, issueId }) {
   try {
-    await axios.post(`${AI_SERVICE_URL}/save-training-data`, {
-      image: imageBuffer.toString("base64"),
-      confirmed_category: confirmedCategory,
-      ai_category: aiCategory,
-      confidence,
-      issue_id: issueId
+    await axios.post(`${AI_SERVICE_URL}/save-training-data`, imageBuffer, {
+      headers: { "Content-Type": "application/octet-stream" },
+      params: {
+        confirmed_category: confirmedCategory,
+        ai_category: aiCategory,
+        confidence,
+        issue_id: issueId
+      },
+      maxBodyLength: Infinity
     });
     console.log(`✓ Training data saved for issue ${issueId} [${confirmedCategory}]`);
   } catch (err) {